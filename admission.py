@@ -0,0 +1,228 @@
+import os
+import math
+import time
+import itertools
+import threading
+import logging
+from collections import deque
+from contextlib import contextmanager
+from jobs import JobCancelled
+from metrics import ADMISSION_ACTIVE, ADMISSION_QUEUED, ADMISSION_REJECTED, ANSIBLE_FORKS_IN_USE
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LIMITS = 'execute=4,playbook=2,upload=2,facts=2,ping=4,sftp_batch=4'
+
+
+def parse_limits(value):
+    """解析 'execute=4,playbook=2' 形式的按端点并发上限"""
+    limits = {}
+    for item in (value or '').split(','):
+        if not item.strip():
+            continue
+        name, _, limit = item.partition('=')
+        limits[name.strip()] = int(limit)
+    return limits
+
+
+class AdmissionRejected(Exception):
+    """系统繁忙，请求未被接纳"""
+
+    def __init__(self, endpoint, reason, retry_after, status):
+        super().__init__(f'{endpoint}: {reason}')
+        self.endpoint = endpoint
+        self.reason = reason
+        self.retry_after = retry_after
+        self.status = status
+
+
+class Ticket:
+    """一次已接纳（或正在排队）的请求"""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, controller, endpoint, label=None):
+        self.id = next(self._ids)
+        self.controller = controller
+        self.endpoint = endpoint
+        self.label = label
+        self.enqueued_at = time.monotonic()
+        self.started_at = None
+        self.initial_position = 0
+        self.held = False
+        self._released = False
+
+    @property
+    def waited(self):
+        return (self.started_at or time.monotonic()) - self.enqueued_at
+
+    def hold(self):
+        """将释放责任交给后台执行的任务，请求处理结束时不自动释放"""
+        self.held = True
+        return self
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self.controller._release(self)
+
+
+class AdmissionController:
+    """昂贵端点的准入控制
+
+    同时执行的请求总数不超过 ADMISSION_MAX_CONCURRENT，各端点另有 ADMISSION_LIMITS 中的上限；
+    超出时按先后顺序排队，最多 ADMISSION_QUEUE_SIZE 个，等待超过 ADMISSION_QUEUE_TIMEOUT 秒
+    或队列已满时拒绝，并根据各端点的平均耗时估算 Retry-After。
+    """
+
+    def __init__(self, fork_budget=None):
+        self.max_concurrent = int(os.getenv('ADMISSION_MAX_CONCURRENT', '8'))
+        self.limits = parse_limits(os.getenv('ADMISSION_LIMITS', DEFAULT_LIMITS))
+        self.queue_size = int(os.getenv('ADMISSION_QUEUE_SIZE', '32'))
+        self.queue_timeout = float(os.getenv('ADMISSION_QUEUE_TIMEOUT', '30'))
+        self.fork_budget = fork_budget
+        self._cond = threading.Condition()
+        self._active = {}
+        self._running = []
+        self._waiting = deque()
+        self._durations = {}
+
+        ADMISSION_ACTIVE.set_function(lambda: len(self._running))
+        ADMISSION_QUEUED.set_function(lambda: len(self._waiting))
+
+    def _has_capacity(self, endpoint):
+        if len(self._running) >= self.max_concurrent:
+            return False
+        limit = self.limits.get(endpoint)
+        return limit is None or self._active.get(endpoint, 0) < limit
+
+    def _next_grantable(self):
+        for ticket in self._waiting:
+            if self._has_capacity(ticket.endpoint):
+                return ticket
+        return None
+
+    def _position(self, ticket):
+        for index, waiting in enumerate(self._waiting):
+            if waiting is ticket:
+                return index + 1
+        return 0
+
+    def _start(self, ticket):
+        ticket.started_at = time.monotonic()
+        self._active[ticket.endpoint] = self._active.get(ticket.endpoint, 0) + 1
+        self._running.append(ticket)
+
+    def retry_after(self, endpoint):
+        """按端点平均耗时与排队长度估算重试等待秒数"""
+        average = self._durations.get(endpoint, 5.0)
+        slots = max(1, min(self.limits.get(endpoint, self.max_concurrent), self.max_concurrent))
+        ahead = sum(1 for ticket in self._waiting if ticket.endpoint == endpoint) + 1
+        return int(min(300, max(1, math.ceil(average * ahead / slots))))
+
+    def acquire(self, endpoint, label=None, timeout=None):
+        """等待并占用一个执行名额，返回 Ticket；无法接纳时抛出 AdmissionRejected"""
+        timeout = self.queue_timeout if timeout is None else timeout
+        ticket = Ticket(self, endpoint, label)
+        with self._cond:
+            if not self._waiting and self._has_capacity(endpoint):
+                self._start(ticket)
+                return ticket
+            if len(self._waiting) >= self.queue_size or timeout <= 0:
+                ADMISSION_REJECTED.inc(endpoint=endpoint, reason='queue_full')
+                raise AdmissionRejected(endpoint, 'queue_full', self.retry_after(endpoint), self.status_locked())
+
+            self._waiting.append(ticket)
+            ticket.initial_position = len(self._waiting)
+            deadline = ticket.enqueued_at + timeout
+            while self._next_grantable() is not ticket:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._waiting.remove(ticket)
+                    self._cond.notify_all()
+                    ADMISSION_REJECTED.inc(endpoint=endpoint, reason='queue_timeout')
+                    raise AdmissionRejected(endpoint, 'queue_timeout', self.retry_after(endpoint), self.status_locked())
+                self._cond.wait(remaining)
+            self._waiting.remove(ticket)
+            self._start(ticket)
+            # 其他排队请求的位置发生了变化，可能也可以开始执行
+            self._cond.notify_all()
+        logger.debug("请求排队后开始执行: %s 等待 %.2fs", endpoint, ticket.waited)
+        return ticket
+
+    @contextmanager
+    def admit(self, endpoint, label=None, timeout=None):
+        ticket = self.acquire(endpoint, label, timeout)
+        try:
+            yield ticket
+        finally:
+            ticket.release()
+
+    def _release(self, ticket):
+        with self._cond:
+            if ticket in self._running:
+                self._running.remove(ticket)
+                self._active[ticket.endpoint] -= 1
+                elapsed = time.monotonic() - ticket.started_at
+                previous = self._durations.get(ticket.endpoint)
+                self._durations[ticket.endpoint] = elapsed if previous is None else previous * 0.8 + elapsed * 0.2
+            self._cond.notify_all()
+
+    def status_locked(self):
+        now = time.monotonic()
+        return {
+            'max_concurrent': self.max_concurrent,
+            'limits': self.limits,
+            'queue_size': self.queue_size,
+            'running': [{
+                'id': ticket.id, 'endpoint': ticket.endpoint, 'label': ticket.label,
+                'running_seconds': round(now - ticket.started_at, 3)
+            } for ticket in self._running],
+            'queue': [{
+                'id': ticket.id, 'endpoint': ticket.endpoint, 'label': ticket.label, 'position': index + 1,
+                'waiting_seconds': round(now - ticket.enqueued_at, 3)
+            } for index, ticket in enumerate(self._waiting)],
+            'average_seconds': {endpoint: round(value, 3) for endpoint, value in self._durations.items()},
+            'forks': self.fork_budget.status() if self.fork_budget else None
+        }
+
+    def status(self):
+        with self._cond:
+            return self.status_locked()
+
+
+class ForkBudget:
+    """所有并发 Ansible 运行共享的 fork 总量
+
+    每次运行按主机数申请 fork，ADMISSION_FORK_BUDGET 耗尽时等待；可用量不足申请量但不少于
+    ADMISSION_MIN_FORKS 时按可用量缩减后运行，避免大任务长期饿死小任务。
+    """
+
+    def __init__(self, total=None, min_grant=None):
+        self.total = total or int(os.getenv('ADMISSION_FORK_BUDGET', '60'))
+        self.min_grant = min_grant or int(os.getenv('ADMISSION_MIN_FORKS', '5'))
+        self.in_use = 0
+        self._cond = threading.Condition()
+        ANSIBLE_FORKS_IN_USE.set_function(lambda: self.in_use)
+
+    @contextmanager
+    def reserve(self, desired, cancel=None):
+        """占用 fork 名额，返回实际分配的数量；等待期间 cancel 被取消时抛出 JobCancelled"""
+        desired = max(1, min(int(desired), self.total))
+        needed = min(desired, self.min_grant)
+        with self._cond:
+            while self.total - self.in_use < needed:
+                if cancel is not None and cancel.cancelled:
+                    raise JobCancelled()
+                self._cond.wait(1.0 if cancel is not None else None)
+            granted = min(desired, self.total - self.in_use)
+            self.in_use += granted
+        try:
+            yield granted
+        finally:
+            with self._cond:
+                self.in_use -= granted
+                self._cond.notify_all()
+
+    def status(self):
+        return {'total': self.total, 'in_use': self.in_use, 'min_grant': self.min_grant}
@@ -0,0 +1,118 @@
+import re
+import json
+from output_store import OutputStore
+
+MODE_HASH = 'hash'
+MODE_NORMALIZED = 'normalized'
+AGGREGATE_MODES = (MODE_HASH, MODE_NORMALIZED)
+
+# 结果中参与归一化的文本字段
+TEXT_FIELDS = ('stdout', 'stderr', 'msg')
+
+# 归一化规则按顺序应用，先替换更具体的模式，避免时间、UUID 中的数字被 numbers 规则拆开
+NORMALIZERS = {
+    'timestamps': (
+        re.compile(r'\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:[.,]\d+)?(?:Z|[+-]\d{2}:?\d{2})?'
+                   r'|\b\d{2}:\d{2}:\d{2}\b'),
+        '<time>'
+    ),
+    'ids': (
+        re.compile(r'\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b'
+                   r'|\b(?=[0-9a-fA-F]*\d)[0-9a-fA-F]{12,}\b'),
+        '<id>'
+    ),
+    'ips': (re.compile(r'\b\d{1,3}(?:\.\d{1,3}){3}\b'), '<ip>'),
+    'numbers': (re.compile(r'\d+(?:\.\d+)?'), '<n>'),
+    'whitespace': (re.compile(r'[ \t]+'), ' '),
+}
+DEFAULT_NORMALIZERS = ('host', 'timestamps', 'ids', 'whitespace')
+
+
+def validate_options(mode, normalizers=None):
+    """检查聚合参数，返回错误信息或 None"""
+    if mode not in AGGREGATE_MODES:
+        return f"aggregate 必须是 {' 或 '.join(AGGREGATE_MODES)}"
+    unknown = set(normalizers or ()) - set(NORMALIZERS) - {'host'}
+    if unknown:
+        return f"未知的归一化规则: {', '.join(sorted(unknown))}"
+    return None
+
+
+def normalize_text(text, host, normalizers):
+    if not text:
+        return text
+    if 'host' in normalizers:
+        # 主机地址出现在输出中（如 hostname -I）时替换为占位符
+        text = text.replace(host, '<host>')
+    for name, (pattern, replacement) in NORMALIZERS.items():
+        if name in normalizers:
+            text = pattern.sub(replacement, text)
+    if 'whitespace' in normalizers:
+        text = '\n'.join(line.rstrip() for line in text.strip().splitlines())
+    return text
+
+
+def normalize_result(result, host, normalizers):
+    return {
+        key: normalize_text(value, host, normalizers) if key in TEXT_FIELDS and isinstance(value, str) else value
+        for key, value in result.items()
+    }
+
+
+class ResultAggregator:
+    """将按主机的执行结果按输出分组
+
+    hash 模式下输出完全相同的主机归为一组，组的 hash 与 command_logs 中每台主机的 output_hash 一致；
+    normalized 模式下先按规则替换主机地址、时间戳、ID 等易变内容再分组，组内展示归一化后的结果，
+    并附一台主机的原始结果作为样例。
+    """
+
+    def __init__(self, mode=MODE_HASH, normalizers=None):
+        self.mode = mode
+        self.normalizers = tuple(normalizers) if normalizers is not None else DEFAULT_NORMALIZERS
+
+    def group_result(self, host, result):
+        """返回主机结果所属分组使用的结果内容"""
+        if self.mode == MODE_NORMALIZED:
+            return normalize_result(result, host, self.normalizers)
+        return result
+
+    def aggregate(self, results):
+        """返回 {'total_hosts', 'counts', 'groups'}，groups 按主机数从多到少排列"""
+        groups = {}
+        counts = {}
+        for status, host_results in results.items():
+            counts[status] = len(host_results)
+            for host, result in host_results.items():
+                grouped = self.group_result(host, result)
+                output = json.dumps(grouped)
+                key = (status, output)
+                group = groups.get(key)
+                if group is None:
+                    group = groups[key] = {
+                        'status': status,
+                        'hash': OutputStore.hash_output(output),
+                        'result': grouped,
+                        'hosts': [],
+                        '_variants': set()
+                    }
+                    if self.mode == MODE_NORMALIZED:
+                        group['sample'] = {'host': host, 'result': result}
+                group['hosts'].append(host)
+                if self.mode == MODE_NORMALIZED:
+                    group['_variants'].add(json.dumps(result, sort_keys=True))
+
+        ordered = sorted(groups.values(), key=lambda group: (-len(group['hosts']), group['status'], group['hash']))
+        for group in ordered:
+            group['hosts'].sort()
+            group['count'] = len(group['hosts'])
+            variants = group.pop('_variants')
+            if self.mode == MODE_NORMALIZED:
+                # 组内原始输出的种类数，1 表示归一化前就完全相同
+                group['variants'] = len(variants)
+        return {
+            'mode': self.mode,
+            'total_hosts': sum(counts.values()),
+            'counts': counts,
+            'groups': ordered
+        }
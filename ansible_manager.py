@@ -1,18 +1,85 @@
 import os
+import signal
 from ansible.parsing.dataloader import DataLoader
 from ansible.inventory.manager import InventoryManager
 from ansible.vars.manager import VariableManager
 from ansible.playbook.play import Play
-from ansible.executor.task_queue_manager import TaskQueueManager
+from ansible.executor.task_queue_manager import TaskQueueManager, AnsibleEndPlay
+from ansible.template import Templar
 from ansible.plugins.callback import CallbackBase
-from ansible import context
+from ansible.plugins.loader import callback_loader, connection_loader
+from ansible import context, constants as C
+from ansible.errors import AnsibleError
+from ansible.utils.helpers import pct_to_int
 from ansible.module_utils.common.collections import ImmutableDict
 import tempfile
 import json
-import subprocess
 import threading
-import re
+import concurrent.futures.thread
+import time
 from crypto_utils import CryptoUtils
+from profiling import phase
+from ssh_executor import SSHConnectionPool, FastPathExecutor
+from admission import ForkBudget
+from jobs import JobCancelled
+from playbook_cache import PlaybookCache
+from aggregation import ResultAggregator
+from host_selector import tag_group_name
+from metrics import (
+    ANSIBLE_RUN_SECONDS, ANSIBLE_HOST_TASK_SECONDS, ANSIBLE_HOST_RESULTS,
+    ANSIBLE_ACTIVE_RUNS, ANSIBLE_FORKS
+)
+
+DEFAULT_FORKS = 30
+# 取消执行时先 SIGTERM 模块与 ssh 进程，宽限期后仍未退出的 SIGKILL
+CANCEL_GRACE_SECONDS = float(os.getenv('ANSIBLE_CANCEL_GRACE', '5'))
+CANCELLED_MSG = '执行已取消，主机未运行'
+
+def _forget_parent_thread_pools():
+    """fork 出的子进程中清空线程池线程登记表
+
+    请求与后台任务运行在线程池线程中，Python 3.12 之前由此 fork 的 Ansible worker 退出时会尝试 join
+    继承来的线程池线程（包括自身）而以退出码 1 结束，被 Ansible 判定为 dead worker（CPython gh-88110）。
+    """
+    concurrent.futures.thread._threads_queues.clear()
+
+os.register_at_fork(after_in_child=_forget_parent_thread_pools)
+
+def _descendant_pids(pids):
+    """通过 /proc 查找进程的所有后代进程，没有 /proc 时返回空列表"""
+    children = {}
+    try:
+        entries = os.listdir('/proc')
+    except OSError:
+        return []
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                # 第二个字段为可能包含空格的进程名，父进程 ID 位于其后第二个字段
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    found, pending = [], list(pids)
+    while pending:
+        for child in children.get(pending.pop(), ()):
+            found.append(child)
+            pending.append(child)
+    return found
+
+def _signal_pids(pids, sig, alive_only=False):
+    for pid in pids:
+        try:
+            if alive_only:
+                # 宽限期后只处理仍在运行的进程（僵尸进程的 stat 状态为 Z）
+                with open(f'/proc/{pid}/stat') as f:
+                    if f.read().rsplit(')', 1)[1].split()[0] == 'Z':
+                        continue
+            os.kill(pid, sig)
+        except (ProcessLookupError, FileNotFoundError):
+            pass
 
 class ResultCallback(CallbackBase):
     """自定义回调类来处理任务结果"""
@@ -21,24 +88,162 @@ class ResultCallback(CallbackBase):
         self.host_ok = {}
         self.host_unreachable = {}
         self.host_failed = {}
+        self._task_started = None
+
+    def _observe(self, status):
+        if self._task_started is not None:
+            ANSIBLE_HOST_TASK_SECONDS.observe(time.perf_counter() - self._task_started, status=status)
+
+    def v2_playbook_on_task_start(self, task, is_conditional):
+        self._task_started = time.perf_counter()
 
     def v2_runner_on_ok(self, result):
+        self._observe('success')
         self.host_ok[result._host.get_name()] = result
 
     def v2_runner_on_failed(self, result, ignore_errors=False):
+        self._observe('failed')
         self.host_failed[result._host.get_name()] = result
 
     def v2_runner_on_unreachable(self, result):
+        self._observe('unreachable')
         self.host_unreachable[result._host.get_name()] = result
 
+def _banner(title):
+    return f"{title} " + '*' * max(3, 79 - len(title))
+
+def _serial_batches(hosts, serial):
+    """按 play 的 serial（数量、百分比或列表）将主机分批，规则与 ansible-playbook 一致"""
+    hosts, total, batches, index = list(hosts), len(hosts), [], 0
+    while hosts:
+        size = pct_to_int(serial[index], total)
+        if size <= 0:
+            batches.append(hosts)
+            break
+        batches.append(hosts[:size])
+        hosts = hosts[size:]
+        index = min(index + 1, len(serial) - 1)
+    return batches
+
+class PlaybookCallback(ResultCallback):
+    """自定义 Playbook 的结构化回调
+
+    直接记录每个任务在每台主机上的结果与 PLAY RECAP 统计；需要文本日志时（keep_logs 或 on_line）
+    按 ansible-playbook -v 的格式由事件生成。
+    """
+
+    # 任务结果中保留的字段，完整结果仍可通过文本日志查看
+    RESULT_FIELDS = ('rc', 'stdout', 'stderr', 'msg')
+
+    def __init__(self, on_line=None, keep_logs=True):
+        super().__init__()
+        self.on_line = on_line
+        self.logs = [] if keep_logs else None
+        self.tasks = []
+        self.stats = {}
+        self._play = None
+        self._task = None
+
+    @property
+    def _text(self):
+        return self.logs is not None or self.on_line is not None
+
+    def emit(self, line):
+        if self.logs is not None:
+            self.logs.append(line)
+        if self.on_line:
+            self.on_line(line)
+
+    def v2_playbook_on_play_start(self, play):
+        self._play = play.get_name().strip()
+        if self._text:
+            self.emit('')
+            self.emit(_banner(f'PLAY [{self._play}]'))
+
+    def _start_task(self, task, kind):
+        self._task = {'play': self._play, 'task': task.get_name().strip(), 'action': task.action, 'hosts': {}}
+        self.tasks.append(self._task)
+        if self._text:
+            self.emit('')
+            self.emit(_banner(f"{kind} [{self._task['task']}]"))
+
+    def v2_playbook_on_task_start(self, task, is_conditional):
+        super().v2_playbook_on_task_start(task, is_conditional)
+        self._start_task(task, 'TASK')
+
+    def v2_playbook_on_handler_task_start(self, task):
+        super().v2_playbook_on_task_start(task, False)
+        self._start_task(task, 'RUNNING HANDLER')
+
+    def _record(self, result, status, line):
+        host = result._host.get_name()
+        data = result._result
+        entry = {'status': status, 'changed': bool(data.get('changed'))}
+        entry.update((key, data[key]) for key in self.RESULT_FIELDS if key in data)
+        if self._task is not None:
+            self._task['hosts'][host] = entry
+        if self._text:
+            self.emit(line.format(host=host, result=self._dump_results(data)))
+
+    def v2_runner_on_ok(self, result):
+        super().v2_runner_on_ok(result)
+        changed = bool(result._result.get('changed'))
+        self._record(result, 'changed' if changed else 'ok', ('changed' if changed else 'ok') + ': [{host}] => {result}')
+
+    def v2_runner_on_failed(self, result, ignore_errors=False):
+        super().v2_runner_on_failed(result, ignore_errors)
+        self._record(result, 'ignored' if ignore_errors else 'failed', 'fatal: [{host}]: FAILED! => {result}')
+        if ignore_errors and self._text:
+            self.emit('...ignoring')
+
+    def v2_runner_on_unreachable(self, result):
+        super().v2_runner_on_unreachable(result)
+        self._record(result, 'unreachable', 'fatal: [{host}]: UNREACHABLE! => {result}')
+
+    def v2_runner_on_skipped(self, result):
+        self._record(result, 'skipped', 'skipping: [{host}]')
+
+    def v2_playbook_on_no_hosts_matched(self):
+        if self._text:
+            self.emit('skipping: no hosts matched')
+
+    def v2_playbook_on_stats(self, stats):
+        for host in sorted(stats.processed):
+            self.stats[host] = stats.summarize(host)
+        if self._text:
+            self.emit('')
+            self.emit(_banner('PLAY RECAP'))
+            for host, counts in self.stats.items():
+                self.emit(
+                    f"{host:<26} : ok={counts['ok']:<4} changed={counts['changed']:<4} "
+                    f"unreachable={counts['unreachable']:<4} failed={counts['failures']:<4} "
+                    f"skipped={counts['skipped']:<4} rescued={counts['rescued']:<4} ignored={counts['ignored']:<4}"
+                )
+
+    def summary(self):
+        """按 PLAY RECAP 统计各主机的最终状态"""
+        summary = {'success': [], 'failed': [], 'unreachable': []}
+        for host, counts in self.stats.items():
+            if counts['failures']:
+                summary['failed'].append(host)
+            if counts['unreachable']:
+                summary['unreachable'].append(host)
+            if not counts['failures'] and not counts['unreachable']:
+                summary['success'].append(host)
+        return summary
+
 class AnsibleManager:
     def __init__(self, db):
         self.db = db
         self.crypto = CryptoUtils()
+        self.ssh_pool = SSHConnectionPool()
+        self.fast_path = FastPathExecutor(self.ssh_pool)
+        self.fork_budget = ForkBudget()
+        self.playbook_cache = PlaybookCache()
         context.CLIARGS = ImmutableDict(
             connection='smart',
             module_path=None,
-            forks=30,
+            forks=DEFAULT_FORKS,
             become=None,
             become_method=None,
             become_user=None,
@@ -46,9 +251,166 @@ class AnsibleManager:
             diff=False,
             verbosity=0
         )
+        ANSIBLE_FORKS.set(DEFAULT_FORKS)
+        self._warm_plugin_loaders()
+
+    @staticmethod
+    def _warm_plugin_loaders():
+        """预先加载 inventory、回调与连接插件
+
+        Ansible 的插件加载器不是线程安全的，启动后并发的首次加载可能拿到尚未初始化完成的插件模块
+        （如 auto 插件缺少 InventoryModule），在单线程中提前加载一次即可避免。
+        """
+        with phase('plugin_warmup'):
+            fd, inventory_path = tempfile.mkstemp(prefix='ansible_inventory_')
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    f.write('[managed_hosts]\n')
+                InventoryManager(loader=DataLoader(), sources=inventory_path)
+            finally:
+                os.remove(inventory_path)
+            list(callback_loader.all(class_only=True))
+            for name in ('ssh', 'paramiko_ssh', 'local'):
+                connection_loader.get(name, class_only=True)
+
+    def _run_plays(self, kind, plays, inventory, variable_manager, loader, results_callback, cancel=None):
+        """使用单个 TaskQueueManager 依次运行 plays，并记录运行指标
+
+        fork 数按主机数从共享的 fork 预算中申请，预算不足时等待其他运行结束。
+        cancel 被取消时停止派发任务并终止 worker 进程，已产生的结果保留在 results_callback 中。
+        """
+        desired = min(DEFAULT_FORKS, max(1, len(inventory.list_hosts())))
+        try:
+            with self.fork_budget.reserve(desired, cancel) as forks:
+                self._run_tqm(kind, plays, inventory, variable_manager, loader, results_callback, forks, cancel)
+        except JobCancelled:
+            # 等待 fork 名额期间被取消，没有任何主机运行
+            return
+
+    def _run_tqm(self, kind, plays, inventory, variable_manager, loader, results_callback, forks, cancel):
+        tqm = None
+        unregister = None
+        ANSIBLE_ACTIVE_RUNS.inc(kind=kind)
+        start = time.perf_counter()
+        try:
+            with phase('tqm_init'):
+                tqm = TaskQueueManager(
+                    inventory=inventory,
+                    variable_manager=variable_manager,
+                    loader=loader,
+                    passwords=dict(),
+                    stdout_callback=results_callback,
+                    forks=forks
+                )
+            if cancel is not None:
+                unregister = cancel.on_cancel(lambda: self._terminate_tqm(tqm))
+            with phase('tqm_run'):
+                for play in plays:
+                    if cancel is not None and cancel.cancelled:
+                        break
+                    if not self._run_play(tqm, play, inventory, variable_manager, loader):
+                        break
+                tqm.send_callback('v2_playbook_on_stats', tqm._stats)
+        except Exception:
+            # worker 被终止后 TQM 可能报错，取消时忽略
+            if cancel is None or not cancel.cancelled:
+                raise
+        finally:
+            if unregister is not None:
+                unregister()
+            if tqm is not None:
+                with phase('tqm_cleanup'):
+                    tqm.cleanup()
+            ANSIBLE_ACTIVE_RUNS.dec(kind=kind)
+            ANSIBLE_RUN_SECONDS.observe(time.perf_counter() - start, kind=kind)
+            for status, host_results in (
+                ('success', results_callback.host_ok),
+                ('failed', results_callback.host_failed),
+                ('unreachable', results_callback.host_unreachable)
+            ):
+                if host_results:
+                    ANSIBLE_HOST_RESULTS.inc(len(host_results), kind=kind, status=status)
+
+    @staticmethod
+    def _run_play(tqm, play, inventory, variable_manager, loader):
+        """按 serial 分批运行一个 play，返回 False 表示停止后续 play
+
+        与 ansible-playbook 一致：hosts、serial 等 play 字段先按变量模板化再分批；any_errors_fatal 等
+        中断 play，或某一批主机全部失败时不再继续；meta: end_play 只结束当前 play。
+        """
+        if play._included_path is not None:
+            loader.set_basedir(play._included_path)
+        # 模板化副本只用于计算分批，TaskQueueManager.run 会自行模板化要运行的 play
+        templated = play.copy()
+        templated.post_validate(Templar(loader=loader, variables=variable_manager.get_vars(play=play)))
+        hosts = inventory.get_hosts(templated.hosts, order=templated.order)
+        batches = _serial_batches(hosts, templated.serial) if templated.serial else [hosts]
+        failed_before = len(tqm._failed_hosts) + len(tqm._unreachable_hosts)
+        for batch in batches:
+            if templated.serial:
+                inventory.restrict_to_hosts(batch)
+            try:
+                result = tqm.run(play)
+            except AnsibleEndPlay:
+                break
+            finally:
+                if templated.serial:
+                    inventory.remove_restriction()
+            if result & tqm.RUN_FAILED_BREAK_PLAY:
+                return False
+            failed = len(tqm._failed_hosts) + len(tqm._unreachable_hosts)
+            if batch and failed - failed_before >= len(batch):
+                return False
+            failed_before = failed
+        return True
+
+    @staticmethod
+    def _terminate_tqm(tqm):
+        """取消回调：让策略循环退出，终止正在执行任务的 worker 进程及其派生的模块、ssh 进程"""
+        # 先记下 worker 及其子进程：设置终止标志后主线程会立即开始清理 worker，子进程随之被收养
+        workers = [w for w in list(getattr(tqm, '_workers', None) or []) if w is not None and w.is_alive()]
+        children = _descendant_pids([w.pid for w in workers])
+        _signal_pids(children, signal.SIGTERM)
+        tqm.terminate()
+        for worker in workers:
+            worker.terminate()
+        if children:
+            timer = threading.Timer(CANCEL_GRACE_SECONDS, _signal_pids, args=(children, signal.SIGKILL, True))
+            timer.daemon = True
+            timer.start()
+
+    @staticmethod
+    def _mark_cancelled(results, target_hosts, cancel):
+        """已取消时，把没有任何结果的目标主机记入 results['cancelled']"""
+        if cancel is None or not cancel.cancelled:
+            return results
+        finished = set()
+        for host_results in results.values():
+            finished.update(host_results)
+        cancelled = results.setdefault('cancelled', {})
+        for host in target_hosts:
+            if host['address'] not in finished:
+                cancelled[host['address']] = {'msg': CANCELLED_MSG}
+        return results
+
+    def _load_inventory(self, inventory_path):
+        """加载 inventory，返回 (loader, inventory, variable_manager)"""
+        with phase('inventory_load'):
+            loader = DataLoader()
+            inventory = InventoryManager(loader=loader, sources=inventory_path)
+            variable_manager = VariableManager(loader=loader, inventory=inventory)
+        return loader, inventory, variable_manager
 
     def generate_inventory(self, hosts):
-        """生成临时 inventory 文件"""
+        """生成临时 inventory 文件
+
+        所有主机位于 managed_hosts 组，并按所属主机组及标签（tag_<标签>）生成对应的 Ansible 组，
+        Playbook 可直接以组名作为 hosts。
+        """
+        with phase('generate_inventory'):
+            return self._write_inventory(hosts)
+
+    def _write_inventory(self, hosts):
         inventory_content = ["[managed_hosts]"]
         for host in hosts:
             line = f"{host['address']} ansible_user={host['username']} ansible_port={host['port']} "
@@ -63,24 +425,114 @@ class AnsibleManager:
             line += "ansible_ssh_common_args='-o StrictHostKeyChecking=no'"
             inventory_content.append(line)
 
+        labels = self.db.get_host_labels({host['id'] for host in hosts if host.get('id')})
+        groups = {}
+        for host in hosts:
+            host_labels = labels.get(host.get('id'), {})
+            for group in host_labels.get('groups', ()):
+                groups.setdefault(group, []).append(host['address'])
+            for tag in host_labels.get('tags', ()):
+                groups.setdefault(tag_group_name(tag), []).append(host['address'])
+        for group, addresses in sorted(groups.items()):
+            # 主机变量已在 managed_hosts 中定义，其他组只列出主机
+            inventory_content.append(f"\n[{group}]")
+            inventory_content.extend(dict.fromkeys(addresses))
+
         fd, inventory_path = tempfile.mkstemp(prefix='ansible_inventory_')
         with os.fdopen(fd, 'w') as f:
             f.write('\n'.join(inventory_content))
         
         return inventory_path
 
-    def execute_command(self, command, target_hosts=None):
-        """执行 Ansible 命令"""
+    def _log_results(self, command, results, target_hosts, aggregator=None):
+        """将各主机的执行结果批量写入命令日志
+
+        提供 aggregator 时每台主机记录其所在分组的结果（normalized 模式下为归一化后的输出），
+        同组主机的输出相同，由输出存储去重后每组只保存一份。
+        """
+        host_ids = {h['address']: h['id'] for h in target_hosts}
+        log_entries = []
+        for status in ('success', 'failed', 'unreachable', 'cancelled'):
+            for host, result in results.get(status, {}).items():
+                if aggregator is not None:
+                    result = aggregator.group_result(host, result)
+                if host_ids.get(host):
+                    log_entries.append((host_ids[host], command, json.dumps(result), status))
+
+        with phase('db_log'):
+            self.db.log_commands(log_entries)
+
+    def log_playbook_result(self, result, target_hosts, command='Custom Playbook Execution'):
+        """记录 Playbook 执行日志"""
+        if 'logs' in result:
+            output = {'playbook_logs': result['logs']}
+        else:
+            output = {'tasks': result['tasks']}
+        if target_hosts:
+            # 所有主机共享同一份日志输出，由输出存储按哈希去重，只保存一份
+            playbook_output = json.dumps(output)
+            log_entries = []
+            for host in target_hosts:
+                host_status = 'success'
+                if host['address'] in result['summary']['failed']:
+                    host_status = 'failed'
+                elif host['address'] in result['summary']['unreachable']:
+                    host_status = 'unreachable'
+                elif host['address'] in result['summary'].get('cancelled', ()):
+                    host_status = 'cancelled'
+                log_entries.append((host['id'], command, playbook_output, host_status))
+            self.db.log_commands(log_entries)
+        else:
+            self.db.log_command(
+                None,
+                command,
+                json.dumps(output),
+                'cancelled' if result.get('cancelled') else 'success' if result['success'] else 'failed'
+            )
+
+    def _use_fast_path(self, fast_path):
+        return self.fast_path.enabled if fast_path is None else bool(fast_path)
+
+    def execute_command(self, command, target_hosts=None, fast_path=None, cancel=None,
+                        aggregate=None, normalizers=None, log_grouped=False):
+        """执行命令
+
+        Args:
+            fast_path: 是否使用SSH快速通道，None 表示按 FAST_PATH_ENABLED 配置；
+                       含模板语法的命令及快速通道无法处理的主机会回退到 Ansible
+            cancel: 可选的 Job，被取消时中止执行，未运行的主机记为 cancelled
+            aggregate: 'hash' 或 'normalized' 时返回按输出分组的结果而非逐台主机的结果
+            normalizers: normalized 模式使用的归一化规则，默认 DEFAULT_NORMALIZERS
+            log_grouped: 命令日志中记录分组后的结果
+        """
         if target_hosts is None:
             target_hosts = self.db.get_hosts()
 
+        if self._use_fast_path(fast_path) and self.fast_path.supports(command):
+            with phase('fast_path'):
+                results, fallback_hosts = self.fast_path.run(command, target_hosts, cancel=cancel)
+            if fallback_hosts and not (cancel is not None and cancel.cancelled):
+                fallback_results = self._execute_command_ansible(command, fallback_hosts, cancel)
+                for status, host_results in fallback_results.items():
+                    results.setdefault(status, {}).update(host_results)
+        else:
+            results = self._execute_command_ansible(command, target_hosts, cancel)
+
+        self._mark_cancelled(results, target_hosts, cancel)
+        aggregator = ResultAggregator(aggregate, normalizers) if aggregate else None
+        self._log_results(command, results, target_hosts, aggregator if log_grouped else None)
+        if aggregator is not None:
+            with phase('aggregate'):
+                return aggregator.aggregate(results)
+        return results
+
+    def _execute_command_ansible(self, command, target_hosts, cancel=None):
+        """通过 Ansible shell 模块执行命令"""
         inventory_path = self.generate_inventory(target_hosts)
-        
+
         try:
-            loader = DataLoader()
-            inventory = InventoryManager(loader=loader, sources=inventory_path)
-            variable_manager = VariableManager(loader=loader, inventory=inventory)
-            
+            loader, inventory, variable_manager = self._load_inventory(inventory_path)
+
             play_source = dict(
                 name="Ansible Ad-Hoc",
                 hosts='managed_hosts',
@@ -88,22 +540,11 @@ class AnsibleManager:
                 tasks=[dict(action=dict(module='shell', args=command))]
             )
 
-            play = Play().load(play_source, variable_manager=variable_manager, loader=loader)
+            with phase('play_load'):
+                play = Play().load(play_source, variable_manager=variable_manager, loader=loader)
             results_callback = ResultCallback()
 
-            tqm = None
-            try:
-                tqm = TaskQueueManager(
-                    inventory=inventory,
-                    variable_manager=variable_manager,
-                    loader=loader,
-                    passwords=dict(),
-                    stdout_callback=results_callback
-                )
-                tqm.run(play)
-            finally:
-                if tqm is not None:
-                    tqm.cleanup()
+            self._run_plays('command', [play], inventory, variable_manager, loader, results_callback, cancel)
 
             results = {
                 'success': {},
@@ -117,56 +558,46 @@ class AnsibleManager:
                     'stderr': result._result.get('stderr', ''),
                     'rc': result._result.get('rc', 0)
                 }
-                host_id = next((h['id'] for h in target_hosts if h['address'] == host), None)
-                if host_id:
-                    self.db.log_command(
-                        host_id,
-                        command,
-                        json.dumps(results['success'][host]),
-                        'success'
-                    )
 
             for host, result in results_callback.host_failed.items():
                 results['failed'][host] = {
                     'msg': result._result.get('msg', ''),
                     'rc': result._result.get('rc', 1)
                 }
-                host_id = next((h['id'] for h in target_hosts if h['address'] == host), None)
-                if host_id:
-                    self.db.log_command(
-                        host_id,
-                        command,
-                        json.dumps(results['failed'][host]),
-                        'failed'
-                    )
 
             for host, result in results_callback.host_unreachable.items():
                 results['unreachable'][host] = {
                     'msg': result._result.get('msg', '')
                 }
-                host_id = next((h['id'] for h in target_hosts if h['address'] == host), None)
-                if host_id:
-                    self.db.log_command(
-                        host_id,
-                        command,
-                        json.dumps(results['unreachable'][host]),
-                        'unreachable'
-                    )
 
             return results
 
         finally:
             os.remove(inventory_path)
 
-    def execute_ping(self, target_hosts):
+    def execute_ping(self, target_hosts, fast_path=None, log=True):
+        """检查主机连通性，快速通道仅验证SSH登录与命令执行"""
+        if self._use_fast_path(fast_path):
+            with phase('fast_path'):
+                results, fallback_hosts = self.fast_path.ping(target_hosts)
+            if fallback_hosts:
+                fallback_results = self._execute_ping_ansible(fallback_hosts)
+                for status, host_results in fallback_results.items():
+                    results.setdefault(status, {}).update(host_results)
+        else:
+            results = self._execute_ping_ansible(target_hosts)
+
+        if log:
+            self._log_results('ping', results, target_hosts)
+        return results
+
+    def _execute_ping_ansible(self, target_hosts):
         """执行 Ansible ping 模块"""
         inventory_path = self.generate_inventory(target_hosts)
-        
+
         try:
-            loader = DataLoader()
-            inventory = InventoryManager(loader=loader, sources=inventory_path)
-            variable_manager = VariableManager(loader=loader, inventory=inventory)
-            
+            loader, inventory, variable_manager = self._load_inventory(inventory_path)
+
             play_source = dict(
                 name="Ansible Ping",
                 hosts='managed_hosts',
@@ -174,22 +605,11 @@ class AnsibleManager:
                 tasks=[dict(action=dict(module='ping'))]
             )
 
-            play = Play().load(play_source, variable_manager=variable_manager, loader=loader)
+            with phase('play_load'):
+                play = Play().load(play_source, variable_manager=variable_manager, loader=loader)
             results_callback = ResultCallback()
 
-            tqm = None
-            try:
-                tqm = TaskQueueManager(
-                    inventory=inventory,
-                    variable_manager=variable_manager,
-                    loader=loader,
-                    passwords=dict(),
-                    stdout_callback=results_callback
-                )
-                tqm.run(play)
-            finally:
-                if tqm is not None:
-                    tqm.cleanup()
+            self._run_plays('ping', [play], inventory, variable_manager, loader, results_callback)
 
             results = {
                 'success': {},
@@ -197,95 +617,93 @@ class AnsibleManager:
                 'unreachable': {}
             }
 
-            for host, result in results_callback.host_ok.items():
-                results['success'][host] = result._result
-                host_id = next((h['id'] for h in target_hosts if h['address'] == host), None)
-                if host_id:
-                    self.db.log_command(
-                        host_id,
-                        'ping',
-                        json.dumps(result._result),
-                        'success'
-                    )
-
-            for host, result in results_callback.host_failed.items():
-                results['failed'][host] = result._result
-                host_id = next((h['id'] for h in target_hosts if h['address'] == host), None)
-                if host_id:
-                    self.db.log_command(
-                        host_id,
-                        'ping',
-                        json.dumps(result._result),
-                        'failed'
-                    )
-
-            for host, result in results_callback.host_unreachable.items():
-                results['unreachable'][host] = result._result
-                host_id = next((h['id'] for h in target_hosts if h['address'] == host), None)
-                if host_id:
-                    self.db.log_command(
-                        host_id,
-                        'ping',
-                        json.dumps(result._result),
-                        'unreachable'
-                    )
+            for status, host_results in (
+                ('success', results_callback.host_ok),
+                ('failed', results_callback.host_failed),
+                ('unreachable', results_callback.host_unreachable)
+            ):
+                for host, result in host_results.items():
+                    results[status][host] = result._result
 
             return results
 
         finally:
             os.remove(inventory_path)
 
-    def get_host_facts(self, host_id):
-        """获取主机详细信息"""
-        host = self.db.get_host(host_id)
-        if not host:
-            return None
+    def gather_facts(self, target_hosts, gather_subset=None):
+        """在一次运行中通过 setup 模块收集多台主机的 facts
 
-        results = self.execute_command('ansible_facts', [host])
-        if host['address'] in results['success']:
-            return results['success'][host['address']]
-        return None
+        Returns:
+            dict: success 中为 {地址: ansible_facts}，failed/unreachable 为错误结果
+        """
+        results = {'success': {}, 'failed': {}, 'unreachable': {}}
+        if not target_hosts:
+            return results
 
-    def run_playbook(self, play, target_hosts=None):
-        """运行 playbook"""
+        inventory_path = self.generate_inventory(target_hosts)
         try:
-            loader = DataLoader()
-            
-            if target_hosts:
-                inventory_path = self.generate_inventory(target_hosts)
-            else:
-                inventory_path = self.generate_inventory(self.db.get_hosts())
+            loader, inventory, variable_manager = self._load_inventory(inventory_path)
 
-            inventory = InventoryManager(loader=loader, sources=inventory_path)
-            variable_manager = VariableManager(loader=loader, inventory=inventory)
-            
+            module_args = {}
+            if gather_subset:
+                module_args['gather_subset'] = list(gather_subset)
+            play_source = dict(
+                name="Gather Facts",
+                hosts='managed_hosts',
+                gather_facts='no',
+                tasks=[dict(action=dict(module='setup', args=module_args))]
+            )
+
+            with phase('play_load'):
+                play = Play().load(play_source, variable_manager=variable_manager, loader=loader)
             results_callback = ResultCallback()
 
-            tqm = None
-            try:
-                tqm = TaskQueueManager(
-                    inventory=inventory,
-                    variable_manager=variable_manager,
-                    loader=loader,
-                    passwords=dict(),
-                    stdout_callback=results_callback
-                )
-                for play_item in play:
-                    play_obj = Play().load(play_item, variable_manager=variable_manager, loader=loader)
-                    tqm.run(play_obj)
-            finally:
-                if tqm is not None:
-                    tqm.cleanup()
+            self._run_plays('facts', [play], inventory, variable_manager, loader, results_callback)
+
+            for host, result in results_callback.host_ok.items():
+                results['success'][host] = result._result.get('ansible_facts', {})
+            for status, host_results in (
+                ('failed', results_callback.host_failed),
+                ('unreachable', results_callback.host_unreachable)
+            ):
+                for host, result in host_results.items():
+                    results[status][host] = result._result
+            return results
+
+        finally:
+            os.remove(inventory_path)
 
-            return {
+    def run_playbook(self, play, target_hosts=None, cancel=None):
+        """运行 playbook，被取消时没有任何结果的主机列在 cancelled 中"""
+        inventory_path = None
+        try:
+            if not target_hosts:
+                target_hosts = self.db.get_hosts()
+            inventory_path = self.generate_inventory(target_hosts)
+
+            loader, inventory, variable_manager = self._load_inventory(inventory_path)
+            results_callback = ResultCallback()
+
+            with phase('play_load'):
+                plays = [
+                    Play().load(play_item, variable_manager=variable_manager, loader=loader)
+                    for play_item in play
+                ]
+            self._run_plays('playbook', plays, inventory, variable_manager, loader, results_callback, cancel)
+
+            results = {
                 'success': results_callback.host_ok,
                 'failed': results_callback.host_failed,
                 'unreachable': results_callback.host_unreachable
             }
+            return self._mark_cancelled(results, target_hosts, cancel)
         except Exception as e:
             raise Exception(f"执行 playbook 失败: {str(e)}")
+        finally:
+            if inventory_path:
+                os.remove(inventory_path)
 
-    def copy_file_to_hosts(self, src, dest, hosts):
+    def copy_file_to_hosts(self, src, dest, hosts, cancel=None):
         """复制文件到指定主机，返回详细的成功/失败结果"""
         if not isinstance(hosts, list):
             hosts = [hosts]
@@ -324,12 +742,12 @@ class AnsibleManager:
         }]
         
         try:
-            result = self.run_playbook(play, target_hosts=selected_hosts_data)
+            result = self.run_playbook(play, target_hosts=selected_hosts_data, cancel=cancel)
             return result
         except Exception as e:
             raise Exception(f"复制文件失败: {str(e)}")
 
-    def copy_file_to_all(self, src, dest):
+    def copy_file_to_all(self, src, dest, cancel=None):
         """复制文件到所有主机，返回详细的成功/失败结果"""
         all_hosts = self.db.get_hosts()
         play = [{
@@ -354,89 +772,62 @@ class AnsibleManager:
         }]
         
         try:
-            result = self.run_playbook(play, target_hosts=all_hosts)
+            result = self.run_playbook(play, target_hosts=all_hosts, cancel=cancel)
             return result
         except Exception as e:
             raise Exception(f"复制文件失败: {str(e)}")
 
-    def execute_custom_playbook(self, playbook_content, target_hosts=None):
-        """执行自定义Playbook"""
-        fd, playbook_path = tempfile.mkstemp(prefix='ansible_playbook_', suffix='.yml')
-        with os.fdopen(fd, 'w') as f:
-            f.write(playbook_content)
-        
+    def execute_custom_playbook(self, playbook_content, target_hosts=None, on_line=None, cancel=None, keep_logs=True):
+        """在进程内执行自定义Playbook，结构化地返回每个任务、每台主机的结果
+
+        playbook 按内容哈希缓存解析结果，相同内容再次执行时不再解析 YAML。
+
+        Args:
+            on_line: 可选回调，每产生一行文本日志即调用，用于流式返回日志
+            cancel: 可选的 Job，被取消时终止执行
+            keep_logs: 是否在结果中返回文本日志
+        """
+        inventory_path = None
+        playbook_hash = None
+        callback = PlaybookCallback(on_line=on_line, keep_logs=keep_logs)
+        return_code = 0
         try:
-            inventory_option = []
             if target_hosts:
                 inventory_path = self.generate_inventory(target_hosts)
-                inventory_option = ['-i', inventory_path]
-            
-            cmd = ['ansible-playbook', playbook_path] + inventory_option + ['-v']
-            logs = []
-            log_lock = threading.Lock()
-            
-            def process_output(process):
-                for line in iter(process.stdout.readline, b''):
-                    decoded_line = line.decode('utf-8').rstrip()
-                    with log_lock:
-                        logs.append(decoded_line)
-            
-            process = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                universal_newlines=False
-            )
-            
-            output_thread = threading.Thread(target=process_output, args=(process,))
-            output_thread.daemon = True
-            output_thread.start()
-            
-            process.wait()
-            output_thread.join()
-            result = {
-                'success': process.returncode == 0,
-                'return_code': process.returncode,
-                'logs': logs,
-                'summary': self._parse_playbook_result(logs)
-            }
-            
-            return result
-        
+            loader, inventory, variable_manager = self._load_inventory(inventory_path or C.DEFAULT_HOST_LIST)
+            try:
+                with phase('play_load'):
+                    playbook_hash, plays = self.playbook_cache.load_plays(playbook_content, variable_manager, loader)
+                self._run_plays('custom_playbook', plays, inventory, variable_manager, loader, callback, cancel)
+            except AnsibleError as e:
+                # 与 ansible-playbook 一致，语法与运行错误作为日志输出而非异常
+                callback.emit(f'ERROR! {e}')
+                return_code = 4 if not callback.tasks else 1
+            finally:
+                loader.cleanup_all_tmp_files()
         finally:
-            os.remove(playbook_path)
-            if target_hosts:
+            if inventory_path:
                 os.remove(inventory_path)
-    
-    def _parse_playbook_result(self, logs):
-        """解析Playbook执行结果，生成主机成功/失败统计"""
-        summary = {
-            'success': [],
-            'failed': [],
-            'unreachable': []
+
+        summary = callback.summary()
+        cancelled = cancel is not None and cancel.cancelled
+        if cancelled:
+            return_code = None
+            if target_hosts:
+                # 已完成汇总的主机保留其状态，其余视为未完成
+                finished = set(summary['success']) | set(summary['failed']) | set(summary['unreachable'])
+                summary['cancelled'] = [h['address'] for h in target_hosts if h['address'] not in finished]
+        elif return_code == 0:
+            return_code = 2 if summary['failed'] else 4 if summary['unreachable'] else 0
+        result = {
+            'success': return_code == 0,
+            'return_code': return_code,
+            'cancelled': cancelled,
+            'playbook_hash': playbook_hash,
+            'summary': summary,
+            'hosts': callback.stats,
+            'tasks': callback.tasks
         }
-        
-        success_pattern = re.compile(r'([\w\.-]+)\s+:\s+ok=\d+')
-        failed_pattern = re.compile(r'([\w\.-]+)\s+:\s+.*failed=([1-9]\d*)')
-        unreachable_pattern = re.compile(r'([\w\.-]+)\s+:\s+.*unreachable=([1-9]\d*)')
-        
-        for line in logs:
-            success_match = success_pattern.search(line)
-            if success_match and not failed_pattern.search(line) and not unreachable_pattern.search(line):
-                host = success_match.group(1)
-                if host not in summary['success']:
-                    summary['success'].append(host)
-            
-            failed_match = failed_pattern.search(line)
-            if failed_match:
-                host = failed_match.group(1)
-                if host not in summary['failed']:
-                    summary['failed'].append(host)
-            
-            unreachable_match = unreachable_pattern.search(line)
-            if unreachable_match:
-                host = unreachable_match.group(1)
-                if host not in summary['unreachable']:
-                    summary['unreachable'].append(host)
-        
-        return summary
+        if keep_logs:
+            result['logs'] = callback.logs
+        return result
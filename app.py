@@ -1,12 +1,33 @@
 from contextlib import contextmanager
-from flask import Flask, request, jsonify, send_from_directory, Response
+from flask import Flask, request, jsonify, Response, g, make_response
 from database import Database
 from ansible_manager import AnsibleManager
+from log_retention import LogRetention
+from metrics import REGISTRY, HTTP_REQUEST_SECONDS, TERMINAL_SESSIONS
+from ssh_executor import connect_ssh
+from health import HealthMonitor
+from facts import FactCache
+from static_assets import StaticAssets
+from json_provider import FastJSONProvider
+from compression import ResponseCompressor
+from sftp_batch import BatchSFTP, ARCHIVE_FORMATS
+from sftp_tree import SFTPTree, TreeError, normalize_path, delete_path, copy_paths
+from sftp_view import FileViewer, TailFollower
+from listing_cache import ListingCache
+from jobs import JobRegistry, DisconnectWatcher, STATUS_SUCCEEDED, STATUS_FAILED, STATUS_CANCELLED
+from admission import AdmissionController, AdmissionRejected
+from aggregation import MODE_HASH, validate_options as validate_aggregate
+from host_selector import SelectorError, validate_group_name, validate_tags
+from scheduler import Scheduler, CronError, SCHEDULE_KINDS, KIND_COMMAND, KIND_PLAYBOOK
+import queue
+import sqlite3
+from ansible.errors import AnsibleError
+from profiling import init_profiler
 import json
 import os
 from functools import wraps
 import secrets
-from flask_sock import Sock
+from flask_sock import Sock, ConnectionClosed
 import paramiko
 import threading
 import stat
@@ -16,9 +37,9 @@ import hmac
 import hashlib
 import jwt
 import datetime
-import logging
-from logging.handlers import RotatingFileHandler
-from crypto_utils import CryptoUtils, set_crypto_keys, derive_key_from_credentials
+from logging_setup import configure_logging, request_id_from_header, SAMPLED
+from crypto_utils import CryptoUtils, set_crypto_keys, derive_key_from_credentials, crypto_keys_ready
+from auth_cache import TokenCache
 
 def get_client_ip():
     """获取客户端真实IP地址
@@ -30,19 +51,45 @@ def get_client_ip():
         return request.headers.get('X-Real-IP')
     return request.remote_addr
 
-app = Flask(__name__, static_folder='public', static_url_path='')
+app = Flask(__name__, static_folder=None)
+app.json = FastJSONProvider(app)
 app.secret_key = secrets.token_hex(32)
 JWT_EXPIRATION = 5 * 60 * 60  # 5小时，以秒为单位
 JWT_SECRET = app.secret_key
-db = Database()
-ansible = AnsibleManager(db)
-crypto = CryptoUtils()
-
 ADMIN_USERNAME = os.getenv('ADMIN_USERNAME')
 ADMIN_PASSWORD = os.getenv('ADMIN_PASSWORD')
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+token_cache = TokenCache()
 
 if not ADMIN_USERNAME or not ADMIN_PASSWORD:
     app.logger.warning("未设置管理员凭证环境变量(ADMIN_USERNAME/ADMIN_PASSWORD)，请设置这些环境变量以确保系统安全")
+else:
+    # PBKDF2 派生耗时较长，在启动时完成一次，请求路径只检查标志；需在后台任务启动前完成
+    try:
+        set_crypto_keys(*derive_key_from_credentials(ADMIN_USERNAME, ADMIN_PASSWORD))
+    except Exception as e:
+        app.logger.error(f"密钥派生失败: {str(e)}")
+
+db = Database()
+ansible = AnsibleManager(db)
+crypto = CryptoUtils()
+log_retention = LogRetention(db)
+log_retention.start()
+profiler = init_profiler(db)
+compressor = ResponseCompressor()
+health_monitor = HealthMonitor(db, ansible)
+health_monitor.start()
+fact_cache = FactCache(db, ansible)
+batch_sftp = BatchSFTP(ansible.ssh_pool)
+sftp_tree = SFTPTree(ansible.ssh_pool)
+file_viewer = FileViewer()
+listing_cache = ListingCache(ansible.ssh_pool)
+SFTP_READ_MAX = int(os.getenv('SFTP_READ_MAX', str(10 << 20)))
+jobs = JobRegistry()
+admission = AdmissionController(ansible.fork_budget)
+scheduler = Scheduler(db, ansible, jobs, admission)
+scheduler.start()
+static_assets = StaticAssets(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'public'))
 
 sock = Sock(app)
 sock.init_app(app)
@@ -75,10 +122,8 @@ def get_request_token():
     return request.cookies.get('token') or request.args.get('token')
 
 def ensure_crypto_key():
-    """确保运行期加密密钥已初始化"""
-    from crypto_utils import CRYPTO_KEY
-
-    if isinstance(CRYPTO_KEY, bytes) and len(CRYPTO_KEY) == 32:
+    """确保运行期加密密钥已初始化，密钥通常已在启动时派生，此处只检查标志"""
+    if crypto_keys_ready():
         return True
 
     if not ADMIN_USERNAME or not ADMIN_PASSWORD:
@@ -98,19 +143,7 @@ def ensure_crypto_key():
 @contextmanager
 def ssh_client_for_host(host, timeout=10):
     """为指定主机创建并管理SSH连接"""
-    ssh = paramiko.SSHClient()
-    ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-
-    connect_args = {
-        'hostname': host['address'],
-        'port': host['port'],
-        'username': host['username'],
-        'timeout': timeout
-    }
-    if host['auth_method'] == 'password':
-        connect_args['password'] = host['password']
-
-    ssh.connect(**connect_args)
+    ssh = connect_ssh(host, timeout=timeout)
     try:
         yield ssh
     finally:
@@ -142,17 +175,137 @@ def auth_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def versioned(*topics):
+    """条件请求装饰器：ETag 由相关数据主题的版本号和查询参数决定，数据未变化时返回 304"""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            # 在查询前读取版本号，查询期间发生的写入只会导致下次请求多返回一次完整数据
+            versions = db.changes.versions(topics)
+            etag = hashlib.sha1(f"{request.full_path}|{versions}".encode('utf-8')).hexdigest()[:24]
+            if request.if_none_match.contains_weak(etag):
+                response = Response(status=304)
+            else:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag, weak=True)
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        return decorated_function
+    return decorator
+
+def admitted(endpoint):
+    """准入控制装饰器：超出并发上限时排队等待，队列已满或等待超时返回 429
+
+    流式响应在响应结束时释放名额；视图可调用 g.admission_ticket.hold() 将名额交给后台任务释放。
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            try:
+                ticket = admission.acquire(endpoint, label=g.get('request_id'))
+            except AdmissionRejected as e:
+                response = jsonify({
+                    'error': '系统繁忙，请稍后重试',
+                    'reason': e.reason,
+                    'retry_after': e.retry_after,
+                    'running': len(e.status['running']),
+                    'queued': len(e.status['queue'])
+                })
+                response.status_code = 429
+                response.headers['Retry-After'] = str(e.retry_after)
+                return response
+
+            g.admission_ticket = ticket
+            try:
+                response = make_response(f(*args, **kwargs))
+            except BaseException:
+                ticket.release()
+                raise
+            if not ticket.held:
+                if response.is_streamed:
+                    response.call_on_close(ticket.release)
+                else:
+                    ticket.release()
+            response.headers['X-Queue-Position'] = str(ticket.initial_position)
+            response.headers['X-Queue-Wait'] = f'{ticket.waited:.3f}'
+            return response
+        return decorated_function
+    return decorator
+
+def finish_run(run, result=None, error=None):
+    """结束一次可取消执行，已被取消时记为 cancelled"""
+    if run.cancelled:
+        run.finish(STATUS_CANCELLED, result=result, error=error)
+    else:
+        run.finish(STATUS_FAILED if error else STATUS_SUCCEEDED, result=result, error=error)
+
+def cancellable(kind):
+    """可取消执行装饰器：以请求 ID 登记为任务，响应头 X-Run-ID 返回任务 ID
+
+    执行期间可通过 POST /api/jobs/<id>/cancel 取消，客户端断开连接时也会自动取消。同步响应的 X-Run-ID
+    在执行结束后才返回，需要在执行期间取消的客户端应自带唯一的 X-Request-ID 作为任务 ID
+    （与已登记任务冲突时另行生成）。视图可调用 g.run_watcher.stop() 关闭断开检测，并将 g.run 作为
+    cancel 传给执行层；流式响应由视图负责结束任务。
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            run = jobs.track(kind, {'path': request.path}, job_id=g.get('request_id'))
+            run.start()
+            g.run = run
+            g.run_watcher = watcher = DisconnectWatcher(request.environ, run.cancel)
+            try:
+                response = make_response(f(*args, **kwargs))
+            except BaseException as e:
+                watcher.stop()
+                finish_run(run, error=str(e) or e.__class__.__name__)
+                raise
+            if response.is_streamed:
+                # 流式响应期间继续检测断开，响应结束后停止
+                response.call_on_close(watcher.stop)
+            else:
+                watcher.stop()
+                finish_run(run, result={'status_code': response.status_code})
+            response.headers['X-Run-ID'] = run.id
+            return response
+        return decorated_function
+    return decorator
+
 @app.before_request
 def before_request():
-    app.logger.info(f"处理请求: {request.path}")
+    g.request_started = time.perf_counter()
+    g.request_id = request_id_from_header(request.headers.get('X-Request-ID'))
+    profiler.start_request(request.method, request.path)
+    app.logger.debug("处理请求: %s", request.path, extra=SAMPLED)
 
     if request.method == 'OPTIONS':
         return None
 
+# 读取访问日志与变更流的请求不记录访问日志，否则每次读取都会使访问日志的 ETag 失效并产生变更事件
+UNLOGGED_READ_PATHS = ('/api/access-logs', '/api/changes')
+
+def _is_unlogged_read():
+    return request.method == 'GET' and any(
+        request.path == path or request.path.startswith(path + '/') for path in UNLOGGED_READ_PATHS
+    )
+
 @app.after_request
 def after_request(response):
-    
-    if request.path.startswith("/api/"):
+    if 'request_started' in g:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - g.request_started,
+            method=request.method,
+            route=route,
+            status=response.status_code
+        )
+    profiler.finish_request(response.status_code)
+    if 'request_id' in g:
+        response.headers['X-Request-ID'] = g.request_id
+
+    if request.path.startswith("/api/") and not _is_unlogged_read():
         status = 'success' if response.status_code < 400 else 'failed'
         db.add_access_log(
             get_client_ip(),
@@ -162,6 +315,13 @@ def after_request(response):
         )
     return response
 
+# 压缩在其余 after_request 之前执行（注册越晚越先执行），请求耗时指标包含压缩开销
+compressor.init_app(app)
+
+@app.teardown_request
+def teardown_request(exception):
+    profiler.discard()
+
 
 @app.route('/api/login', methods=['POST'])
 def login():
@@ -176,9 +336,9 @@ def login():
 
     if username == ADMIN_USERNAME and password == ADMIN_PASSWORD:
         try:
-            key, salt = derive_key_from_credentials(username, password)
-            set_crypto_keys(key, salt)
-            app.logger.info(f"已从用户凭证成功派生加密密钥，长度为: {len(key)} 字节")
+            # 登录凭证与管理员凭证一致，密钥已在启动时派生，仅在当时失败时重试
+            if not ensure_crypto_key():
+                raise RuntimeError('加密密钥未初始化')
             token = generate_token('admin')
             response_data = {'success': True, 'message': '登录成功', 'token': token}
             response = jsonify(response_data)
@@ -199,44 +359,94 @@ def login():
         return jsonify({'success': False, 'message': '用户名或密码不正确'}), 401
 
 
+@app.route('/metrics')
+def metrics():
+    """Prometheus 指标导出，设置 METRICS_TOKEN 时使用该令牌认证，否则需要登录令牌"""
+    token = get_request_token()
+    if METRICS_TOKEN:
+        authorized = token is not None and hmac.compare_digest(token, METRICS_TOKEN)
+    else:
+        authorized = token is not None and decode_token(token) is not None
+    if not authorized:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
 def serve_react_app(path):
     """处理前端路由 - 所有路由都交给React处理，除非是静态文件"""
-    app.logger.info(f"serve_react_app 处理 路径: '{path}'")
-    
-    if path.startswith('terminal'):
-        app.logger.info(f"明确处理终端路径: {path}")
-        return send_from_directory(app.static_folder, 'index.html')
-    
     if path.startswith('api/') or path.startswith('ws/'):
-        app.logger.info(f"API或WebSocket路径，返回404: {path}")
         return jsonify({'error': 'Not found'}), 404
-    
-    static_file_path = os.path.join(app.static_folder, path)
-    app.logger.info(f"尝试查找静态文件: {static_file_path}")
-    if path != "" and os.path.exists(static_file_path) and not os.path.isdir(static_file_path):
-        app.logger.info(f"找到静态文件，返回: {static_file_path}")
-        return send_from_directory(app.static_folder, path)
-    else:
-        app.logger.info(f"未找到静态文件，返回index.html用于前端路由: {path}")
-        return send_from_directory(app.static_folder, 'index.html')
+    return static_assets.serve(path)
+
+HOST_PAGE_MAX = 1000
 
 @app.route('/api/hosts', methods=['GET'])
 @handle_error
 @auth_required
+@versioned('hosts', 'host_health', 'host_groups')
 def get_hosts():
-    """获取所有主机列表"""
-    hosts = db.get_hosts()
+    """获取主机列表，附带缓存的巡检状态
+
+    参数均为可选，不带参数时返回全部主机（按创建时间倒序）:
+        limit/cursor: 游标分页，下一页游标通过 X-Next-Cursor 响应头返回
+        fields: 逗号分隔的返回字段，如 id,comment,address,health
+        q: 按备注或地址前缀搜索（不区分大小写）
+        ids: 逗号分隔的主机 id，配合变更订阅只拉取变化的主机
+        selector: 主机选择表达式，如 group:web and tag:env=prod，可用于预览执行目标
+        sort: 排序字段，前缀 - 表示倒序，如 -created_at、comment
+    满足条件的主机总数通过 X-Total-Count 响应头返回。
+    """
+    fields = None
+    virtual = {'password', 'health'}
+    if request.args.get('fields'):
+        fields = [f.strip() for f in request.args['fields'].split(',') if f.strip()]
+        virtual &= set(fields)
+        fields = [f for f in fields if f not in virtual]
+        if 'health' in virtual or not fields:
+            fields.append('id')
+
+    ids = None
+    if request.args.get('ids'):
+        try:
+            ids = [int(x) for x in request.args['ids'].split(',') if x.strip()]
+        except ValueError:
+            return jsonify({'error': 'Invalid hosts format'}), 400
+
+    sort = request.args.get('sort', '-created_at')
+    descending = sort.startswith('-')
+    limit = request.args.get('limit', type=int)
+    if limit is not None:
+        limit = max(1, min(limit, HOST_PAGE_MAX))
+
+    try:
+        hosts, total, next_cursor = db.list_hosts(
+            fields=fields,
+            search=request.args.get('q', '').strip(),
+            ids=ids,
+            sort=sort.lstrip('-'),
+            descending=descending,
+            limit=limit,
+            cursor=request.args.get('cursor'),
+            selector=request.args.get('selector')
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    health = health_monitor.snapshot() if 'health' in virtual else {}
     for host in hosts:
-        if host['auth_method'] == 'password':
-            host['is_password_encrypted'] = crypto.is_encrypted(host['encrypted_password'])
-        else:
-            host['is_password_encrypted'] = False
-        host['password'] = '********'
-        if 'encrypted_password' in host:
-            del host['encrypted_password']
-    return jsonify(hosts)
+        if 'password' in virtual:
+            host['password'] = '********'
+        if 'health' in virtual:
+            host['health'] = health.get(host['id'])
+
+    response = jsonify(hosts)
+    response.headers['X-Total-Count'] = str(total)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
 
 @app.route('/api/hosts/<int:host_id>', methods=['GET'])
 @handle_error
@@ -252,6 +462,7 @@ def get_host(host_id):
         host['password'] = '********'
         if 'encrypted_password' in host:
             del host['encrypted_password']
+        host.update(db.get_host_labels([host_id]).get(host_id, {'groups': [], 'tags': []}))
         return jsonify(host)
     return jsonify({'error': 'Host not found'}), 404
 
@@ -269,6 +480,9 @@ def add_host():
     
     if not all(field in host_data for field in required_fields):
         return jsonify({'error': 'Missing required fields'}), 400
+    error = validate_host_labels(host_data)
+    if error:
+        return jsonify({'error': error}), 400
     
     host_id = db.add_host(host_data)
     return jsonify({
@@ -293,6 +507,9 @@ def add_hosts_batch():
         
         if not all(field in host for field in required_fields):
             return jsonify({'error': f'Missing required fields in host data: {host}'}), 400
+        error = validate_host_labels(host)
+        if error:
+            return jsonify({'error': error}), 400
 
     count = db.add_hosts_batch(hosts_data)
     return jsonify({
@@ -310,11 +527,18 @@ def update_host(host_id):
     required_fields = ['comment', 'address', 'username', 'port']
     if not all(field in host_data for field in required_fields):
         return jsonify({'error': 'Missing required fields'}), 400
+    error = validate_host_labels(host_data)
+    if error:
+        return jsonify({'error': error}), 400
     
-    if not db.get_host(host_id):
+    current_host = db.get_host(host_id)
+    if not current_host:
         return jsonify({'error': 'Host not found'}), 404
         
     db.update_host(host_id, host_data)
+    ansible.ssh_pool.discard_host(current_host)
+    fact_cache.invalidate(host_id)
+    listing_cache.invalidate_host(host_id)
     return jsonify({'message': 'Host updated successfully'})
 
 @app.route('/api/hosts/<int:host_id>', methods=['DELETE'])
@@ -322,25 +546,157 @@ def update_host(host_id):
 @auth_required
 def delete_host(host_id):
     """删除主机"""
-    if not db.get_host(host_id):
+    host = db.get_host(host_id)
+    if not host:
         return jsonify({'error': 'Host not found'}), 404
         
     db.delete_host(host_id)
+    ansible.ssh_pool.discard_host(host)
+    health_monitor.forget(host_id)
+    listing_cache.invalidate_host(host_id)
     return jsonify({'message': 'Host deleted successfully'})
 
+@app.route('/api/groups', methods=['GET'])
+@handle_error
+@auth_required
+@versioned('host_groups')
+def list_groups():
+    """列出主机组及成员数"""
+    return jsonify(db.list_groups())
+
+@app.route('/api/groups', methods=['POST'])
+@handle_error
+@auth_required
+def add_group():
+    """添加主机组，可同时通过 host_ids 指定成员"""
+    data = request.json or {}
+    name = data.get('name')
+    error = validate_group_name(name)
+    if error:
+        return jsonify({'error': error}), 400
+    try:
+        group_id = db.add_group(name, data.get('description'))
+    except sqlite3.IntegrityError:
+        return jsonify({'error': f'主机组已存在: {name}'}), 409
+    if data.get('host_ids'):
+        db.update_group_members(group_id, add=data['host_ids'])
+    return jsonify(db.get_group(group_id)), 201
+
+@app.route('/api/groups/<int:group_id>', methods=['GET'])
+@handle_error
+@auth_required
+def get_group(group_id):
+    """获取主机组及其成员主机 id"""
+    group = db.get_group(group_id)
+    if not group:
+        return jsonify({'error': 'Group not found'}), 404
+    return jsonify(group)
+
+@app.route('/api/groups/<int:group_id>', methods=['PUT'])
+@handle_error
+@auth_required
+def update_group(group_id):
+    """修改主机组名称或描述"""
+    data = request.json or {}
+    name = data.get('name')
+    if name is not None:
+        error = validate_group_name(name)
+        if error:
+            return jsonify({'error': error}), 400
+    try:
+        updated = db.update_group(group_id, name, data.get('description'))
+    except sqlite3.IntegrityError:
+        return jsonify({'error': f'主机组已存在: {name}'}), 409
+    if not updated:
+        return jsonify({'error': 'Group not found'}), 404
+    return jsonify(db.get_group(group_id))
+
+@app.route('/api/groups/<int:group_id>', methods=['DELETE'])
+@handle_error
+@auth_required
+def delete_group(group_id):
+    """删除主机组，组内主机不受影响"""
+    if not db.delete_group(group_id):
+        return jsonify({'error': 'Group not found'}), 404
+    return jsonify({'message': 'Group deleted successfully'})
+
+@app.route('/api/groups/<int:group_id>/hosts', methods=['POST'])
+@handle_error
+@auth_required
+def update_group_members(group_id):
+    """批量调整组成员：add、remove 为主机 id 列表，也可用 selector 指定要加入的主机"""
+    data = request.json or {}
+    if not db.get_group(group_id):
+        return jsonify({'error': 'Group not found'}), 404
+    add, remove = data.get('add', []), data.get('remove', [])
+    if not isinstance(add, list) or not isinstance(remove, list):
+        return jsonify({'error': 'add 与 remove 必须是主机 id 列表'}), 400
+    if data.get('selector'):
+        selected, error = select_target_hosts(data['selector'])
+        if error:
+            return error
+        add = add + [host['id'] for host in selected]
+    db.update_group_members(group_id, add=add, remove=remove)
+    return jsonify(db.get_group(group_id))
+
+@app.route('/api/tags', methods=['GET'])
+@handle_error
+@auth_required
+@versioned('hosts')
+def list_tags():
+    """列出所有标签及使用的主机数"""
+    return jsonify(db.list_tags())
+
+@app.route('/api/hosts/tags', methods=['POST'])
+@handle_error
+@auth_required
+def update_host_tags():
+    """批量添加、移除标签：目标为 host_ids 或 selector，add、remove 为标签列表"""
+    data = request.json or {}
+    add, remove = data.get('add', []), data.get('remove', [])
+    error = validate_tags(add) or validate_tags(remove)
+    if error:
+        return jsonify({'error': error}), 400
+    hosts, error = resolve_target_hosts(data.get('host_ids'), data.get('selector'))
+    if error:
+        return error
+    host_ids = [host['id'] for host in hosts]
+    db.update_host_tags(host_ids, add=add, remove=remove)
+    return jsonify({'updated': len(host_ids)})
+
 @app.route('/api/execute', methods=['POST'])
 @handle_error
 @auth_required
+@admitted('execute')
+@cancellable('execute')
 def execute_command():
-    """执行命令"""
+    """执行命令
+
+    目标主机为 hosts（id 列表或 'all'），或 selector 选择表达式（如 group:web and tag:env=prod）。
+    aggregate 为 true/'hash' 时按输出完全相同分组返回，为 'normalized' 时按 normalize 规则
+    （host、timestamps、ids、ips、numbers、whitespace）归一化后分组；log_grouped 为 true 时
+    命令日志同样记录分组后的结果。
+    """
     data = request.json
     command = data.get('command')
     host_ids = data.get('hosts')
+    aggregate = MODE_HASH if data.get('aggregate') is True else data.get('aggregate') or None
+    normalizers = data.get('normalize')
 
     if not command:
         return jsonify({'error': 'Command is required'}), 400
-
-    if host_ids == 'all':
+    if aggregate:
+        if normalizers is not None and not isinstance(normalizers, list):
+            return jsonify({'error': 'normalize 必须是规则名称列表'}), 400
+        error = validate_aggregate(aggregate, normalizers)
+        if error:
+            return jsonify({'error': error}), 400
+
+    if data.get('selector'):
+        target_hosts, error = select_target_hosts(data['selector'])
+        if error:
+            return error
+    elif host_ids == 'all':
         target_hosts = db.get_hosts()
     else:
         if not isinstance(host_ids, list):
@@ -356,50 +712,203 @@ def execute_command():
     if not target_hosts:
         return jsonify({'error': 'No valid target hosts'}), 400
 
-    results = ansible.execute_command(command, target_hosts)
+    results = ansible.execute_command(
+        command, target_hosts, fast_path=data.get('fast_path'), cancel=g.run,
+        aggregate=aggregate, normalizers=normalizers, log_grouped=bool(aggregate and data.get('log_grouped'))
+    )
     return jsonify(results)
 
 @app.route('/api/logs', methods=['GET'])
 @handle_error
 @auth_required
+@versioned('command_logs', 'hosts')
 def get_logs():
-    """获取命令执行日志"""
+    """获取命令执行日志，since_id 用于只获取该 id 之后新增的日志"""
     limit = request.args.get('limit', default=100, type=int)
-    logs = db.get_command_logs(limit)
+    since_id = request.args.get('since_id', type=int)
+    logs = db.get_command_logs(limit, since_id=since_id)
     return jsonify(logs)
 
+CHANGE_FEED_MAX_WAIT = 30
+CHANGE_FEED_HEARTBEAT = 15
+
+def _change_topics():
+    return {t.strip() for t in request.args.get('topics', '').split(',') if t.strip()}
+
+@app.route('/api/changes', methods=['GET'])
+@handle_error
+@auth_required
+def get_changes():
+    """轮询数据变更：返回 since 版本之后的事件，wait 秒内无变化时返回空列表
+
+    reset 为 true 表示 since 已过期（超出缓冲区或服务重启），客户端需重新全量拉取。
+    不带 since 时仅返回当前版本号。
+    """
+    since = request.args.get('since', type=int)
+    if since is None:
+        return jsonify({'version': db.changes.version, 'events': [], 'reset': False})
+    wait = max(0.0, min(request.args.get('wait', default=0, type=float), CHANGE_FEED_MAX_WAIT))
+    events, version = db.changes.since(since, _change_topics(), timeout=wait)
+    return jsonify({'version': version, 'events': events or [], 'reset': events is None})
+
+@app.route('/api/changes/stream', methods=['GET'])
+@auth_required
+def stream_changes():
+    """以 Server-Sent Events 推送数据变更，支持 Last-Event-ID 断线续传"""
+    topics = _change_topics()
+    since = request.args.get('since', type=int)
+    if since is None:
+        last_event_id = request.headers.get('Last-Event-ID', '')
+        since = int(last_event_id) if last_event_id.isdigit() else db.changes.version
+
+    def generate():
+        cursor = since
+        yield 'retry: 3000\n\n'
+        while True:
+            events, version = db.changes.since(cursor, topics, timeout=CHANGE_FEED_HEARTBEAT)
+            if events is None:
+                yield f"id: {version}\nevent: reset\ndata: {json.dumps({'version': version})}\n\n"
+            elif not events:
+                yield ': keepalive\n\n'
+            else:
+                for event in events:
+                    yield f"id: {event['version']}\nevent: change\ndata: {json.dumps(event)}\n\n"
+            cursor = version
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@app.route('/api/logs/storage', methods=['GET'])
+@handle_error
+@auth_required
+def get_log_storage_stats():
+    """获取命令输出存储的去重与压缩统计"""
+    return jsonify(db.get_output_storage_stats())
+
+def _flag(name):
+    return request.args.get(name, '').lower() in ('1', 'true', 'yes')
+
 @app.route('/api/hosts/<int:host_id>/facts', methods=['GET'])
 @handle_error
 @auth_required
 def get_host_facts(host_id):
-    """获取主机详细信息"""
-    facts = ansible.get_host_facts(host_id)
-    if facts:
-        return jsonify(facts)
-    return jsonify({'error': 'Failed to get host facts'}), 404
+    """获取主机 facts，默认返回缓存，refresh=1 时重新收集"""
+    host = db.get_host(host_id)
+    if not host:
+        return jsonify({'error': 'Host not found'}), 404
+
+    entry = fact_cache.get(host, refresh=_flag('refresh'))
+    if entry['facts'] is None:
+        return jsonify({'error': entry.get('error') or 'Failed to get host facts'}), 502
+    return jsonify(entry)
+
+@app.route('/api/hosts/facts', methods=['GET'])
+@handle_error
+@auth_required
+@admitted('facts')
+def get_hosts_facts():
+    """批量获取主机 facts，keys 指定返回的键（逗号分隔），过期主机在一次运行中收集
+
+    参数: host_ids=1,2,3（默认全部）、keys、refresh=1 强制重新收集、gather=0 仅返回缓存
+    """
+    hosts = db.get_hosts()
+    host_ids = request.args.get('host_ids')
+    if host_ids:
+        try:
+            wanted = {int(x) for x in host_ids.split(',') if x.strip()}
+        except ValueError:
+            return jsonify({'error': 'Invalid hosts format'}), 400
+        hosts = [host for host in hosts if host['id'] in wanted]
+
+    keys = [k.strip() for k in request.args.get('keys', '').split(',') if k.strip()]
+    gather = request.args.get('gather', '1').lower() not in ('0', 'false', 'no')
+    entries = fact_cache.bulk(hosts, keys=keys, refresh=_flag('refresh'), gather=gather)
+
+    by_id = {host['id']: host for host in hosts}
+    for entry in entries:
+        host = by_id[entry['host_id']]
+        entry['address'] = host['address']
+        entry['comment'] = host['comment']
+    return jsonify(entries)
 
 @app.route('/api/hosts/<int:host_id>/ping', methods=['GET'])
 @handle_error
 @auth_required
+@admitted('ping')
 def ping_host(host_id):
     """检查主机连通性"""
     host = db.get_host(host_id)
     if not host:
         return jsonify({'error': 'Host not found'}), 404
     
-    results = ansible.execute_ping([host])
+    fast_path = request.args.get('fast_path')
+    if fast_path is not None:
+        fast_path = fast_path.lower() in ('1', 'true', 'yes')
+    results = ansible.execute_ping([host], fast_path=fast_path)
     host_address = host['address']
     if host_address in results['success']:
+        health_monitor.record_ping(host_id, 'success')
         return jsonify({'status': 'success', 'message': '连接正常'})
     elif host_address in results['unreachable']:
+        health_monitor.record_ping(host_id, 'unreachable')
         return jsonify({'status': 'unreachable', 'message': '无法连接'})
     else:
+        health_monitor.record_ping(host_id, 'failed')
         return jsonify({'status': 'failed', 'message': '失败'})
 
+@app.route('/api/hosts/health', methods=['GET'])
+@handle_error
+@auth_required
+def get_hosts_health():
+    """获取所有主机缓存的巡检状态"""
+    return jsonify({
+        'hosts': list(health_monitor.snapshot().values()),
+        'sweep': health_monitor.status()
+    })
+
+@app.route('/api/hosts/health/sweep', methods=['POST'])
+@handle_error
+@auth_required
+def trigger_health_sweep():
+    """触发一次后台巡检，可通过 host_ids 限定主机"""
+    data = request.get_json(silent=True) or {}
+    host_ids = data.get('host_ids')
+    if host_ids is not None and (
+        not isinstance(host_ids, list)
+        or not all(isinstance(host_id, int) and not isinstance(host_id, bool) for host_id in host_ids)
+    ):
+        return jsonify({'error': 'Invalid hosts format'}), 400
+    health_monitor.trigger(host_ids)
+    return jsonify({'message': '已提交巡检任务'}), 202
+
+def verify_ws_token(token, host_id):
+    """校验 generate_ws_token 生成的令牌，无效时抛出 ValueError"""
+    # token 格式: host_id:timestamp:signature
+    parts = token.split(':')
+    if len(parts) != 3 or parts[0] != str(host_id):
+        raise ValueError("Invalid token format")
+
+    token_timestamp = int(parts[1])
+    current_time = int(time.time())
+    if current_time - token_timestamp > 300:  # 5分钟有效期
+        raise ValueError("Token expired")
+
+    message = f"{host_id}:{token_timestamp}"
+    expected_signature = hmac.new(
+        app.secret_key.encode(),
+        message.encode(),
+        hashlib.sha256
+    ).hexdigest()
+
+    if parts[2] != expected_signature:
+        raise ValueError("Invalid token signature")
+
 @sock.route('/ws/terminal/<int:host_id>')
 def terminal_ws(ws, host_id):
     """处理终端 WebSocket 连接"""
-    app.logger.info(f"处理WebSocket连接请求: host_id={host_id}")
+    app.logger.debug("处理WebSocket连接请求: host_id=%s", host_id)
     
     token = request.args.get('token')
     if not token:
@@ -408,26 +917,7 @@ def terminal_ws(ws, host_id):
         return
     
     try:
-        # token 格式: host_id:timestamp:signature
-        parts = token.split(':')
-        if len(parts) != 3 or parts[0] != str(host_id):
-            raise ValueError("Invalid token format")
-            
-        token_timestamp = int(parts[1])
-        current_time = int(time.time())
-        if current_time - token_timestamp > 300:  # 5分钟有效期
-            raise ValueError("Token expired")
-            
-        message = f"{host_id}:{token_timestamp}"
-        expected_signature = hmac.new(
-            app.secret_key.encode(),
-            message.encode(),
-            hashlib.sha256
-        ).hexdigest()
-        
-        if parts[2] != expected_signature:
-            raise ValueError("Invalid token signature")
-            
+        verify_ws_token(token, host_id)
     except Exception:
         app.logger.error("终端WebSocket令牌验证失败")
         ws.send(json.dumps({"error": "Invalid or expired token"}))
@@ -439,15 +929,15 @@ def terminal_ws(ws, host_id):
         ws.send(json.dumps({"error": "Host not found"}))
         return
     
-    app.logger.info(f"找到主机信息: id={host_id}")
     
     try:
         with ssh_client_for_host(host, timeout=10) as ssh:
             term_width = 100
             term_height = 30
 
-            app.logger.info("SSH连接成功，创建终端会话")
+            app.logger.info("终端会话已建立: host_id=%s", host_id)
             channel = ssh.invoke_shell(term='xterm-256color', width=term_width, height=term_height)
+            TERMINAL_SESSIONS.inc()
 
             def send_data():
                 while True:
@@ -466,8 +956,6 @@ def terminal_ws(ws, host_id):
             thread.daemon = True
             thread.start()
 
-            app.logger.info("WebSocket连接已建立，后台线程已启动")
-
             welcome_msg = "\r\n\x1b[1;32m*** 已连接到主机 ***\x1b[0m\r\n"
             ws.send(welcome_msg)
 
@@ -475,7 +963,7 @@ def terminal_ws(ws, host_id):
                 try:
                     message = ws.receive()
                     if message is None:
-                        app.logger.info("WebSocket连接已关闭")
+                        app.logger.debug("WebSocket连接已关闭: host_id=%s", host_id)
                         break
 
                     data = json.loads(message)
@@ -504,15 +992,16 @@ def terminal_ws(ws, host_id):
         app.logger.error("终端连接错误")
         ws.send('\r\n\x1b[1;31m*** 连接错误 ***\x1b[0m\r\n')
     finally:
-        app.logger.info("关闭终端连接")
+        app.logger.info("关闭终端连接: host_id=%s", host_id)
         if 'channel' in locals():
             channel.close()
+            TERMINAL_SESSIONS.dec()
 
 @app.route('/api/sftp/<int:host_id>/list')
 @handle_error
 @auth_required
 def sftp_list(host_id):
-    """获取 SFTP 文件列表"""
+    """获取 SFTP 文件列表，结果经目录缓存，refresh=1 时强制重新列出"""
     path = request.args.get('path', '/')
     host = db.get_host(host_id)
 
@@ -520,20 +1009,32 @@ def sftp_list(host_id):
         return jsonify({'error': 'Host not found'}), 404
 
     try:
-        with sftp_client_for_host(host) as sftp:
-            file_list = []
-            for entry in sftp.listdir_attr(path):
-                file_list.append({
-                    'name': entry.filename,
-                    'type': 'directory' if stat.S_ISDIR(entry.st_mode) else 'file',
-                    'size': entry.st_size,
-                    'mtime': entry.st_mtime
-                })
-            return jsonify(file_list)
+        file_list, cache_status = listing_cache.list(host, path, refresh=_flag('refresh'))
+        response = jsonify(file_list)
+        response.headers['X-Cache'] = cache_status
+        return response
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/sftp/<int:host_id>/tree')
+@handle_error
+@auth_required
+def sftp_tree_list(host_id):
+    """递归列出目录树，max_depth 限制深度，返回条目与文件数、目录数、总字节数"""
+    host = db.get_host(host_id)
+    if not host:
+        return jsonify({'error': 'Host not found'}), 404
+
+    max_depth = request.args.get('max_depth', type=int)
+    try:
+        path = normalize_path(request.args.get('path', '/'))
+        return jsonify(sftp_tree.list(host, path, max_depth=max_depth))
+    except TreeError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/sftp/<int:host_id>/mkdir', methods=['POST'])
 @handle_error
 @auth_required
@@ -555,6 +1056,7 @@ def sftp_mkdir(host_id):
                 return jsonify({'error': 'Directory already exists'}), 400
             except IOError:
                 sftp.mkdir(path)
+        listing_cache.invalidate(host_id, path)
 
         return jsonify({'success': True})
     except Exception as e:
@@ -591,6 +1093,7 @@ def sftp_upload(host_id):
                     finally:
                         if os.path.exists(temp_path):
                             os.remove(temp_path)
+        listing_cache.invalidate(host_id, path)
 
         return jsonify({'success': True})
     except Exception as e:
@@ -620,6 +1123,7 @@ def sftp_rename(host_id):
                 return jsonify({'error': 'Destination already exists'}), 400
             except IOError:
                 sftp.rename(old_path, new_path)
+        listing_cache.invalidate(host_id, old_path, new_path, recursive=True)
 
         return jsonify({'success': True})
     except Exception as e:
@@ -649,6 +1153,7 @@ def sftp_touch(host_id):
             except IOError:
                 with sftp.file(path, 'w') as f:
                     f.write('')
+        listing_cache.invalidate(host_id, path)
 
         return jsonify({'success': True})
     except Exception as e:
@@ -659,22 +1164,96 @@ def sftp_touch(host_id):
 @handle_error
 @auth_required
 def sftp_read(host_id):
-    """读取文件内容"""
+    """读取文件内容
+
+    不带窗口参数时读取整个文件，超过 SFTP_READ_MAX 返回 413；大文件按以下方式分段读取：
+    offset/length 字节窗口（offset 为负数时从末尾倒数），offset/lines 从字节偏移读取若干行，
+    line/lines 从第 line 行开始读取，tail 读取最后 N 行。返回的 end 可作为下一段的 offset。
+    """
     host = db.get_host(host_id)
     if not host:
         return jsonify({'error': 'Host not found'}), 404
 
     path = request.args.get('path')
+    if not path:
+        return jsonify({'error': 'Path is required'}), 400
+    offset = request.args.get('offset', type=int)
+    length = request.args.get('length', type=int)
+    line = request.args.get('line', type=int)
+    lines = request.args.get('lines', type=int)
+    tail = request.args.get('tail', type=int)
+    if any(value is not None and value <= 0 for value in (length, line, lines, tail)):
+        return jsonify({'error': 'length, line, lines and tail must be positive'}), 400
 
     try:
-        with sftp_client_for_host(host) as sftp:
+        with ansible.ssh_pool.sftp(host) as sftp:
             with sftp.file(path, 'r') as f:
+                size = f.stat().st_size
+                if tail is not None:
+                    return jsonify(file_viewer.tail(f, size, tail))
+                if line is not None:
+                    start = file_viewer.find_line(f, size, line)
+                    window = file_viewer.read_lines(f, size, start, lines or file_viewer.max_lines)
+                    window['line'] = line
+                    return jsonify(window)
+                if lines is not None:
+                    return jsonify(file_viewer.read_lines(f, size, offset or 0, lines))
+                if offset is not None or length is not None:
+                    return jsonify(file_viewer.read_bytes(f, size, offset or 0, length))
+
+                if size > SFTP_READ_MAX:
+                    return jsonify({'error': 'File too large, use a ranged read', 'size': size}), 413
+                f.prefetch(size)
                 content = f.read().decode('utf-8', errors='replace')
-            return jsonify({'content': content})
+            return jsonify({'content': content, 'size': size})
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@sock.route('/ws/sftp/<int:host_id>/tail')
+def sftp_tail_ws(ws, host_id):
+    """tail -f：先发送最后 lines 行，之后持续推送文件新增的内容"""
+    token = request.args.get('token')
+    try:
+        verify_ws_token(token or '', host_id)
+    except Exception:
+        ws.send(json.dumps({"type": "error", "error": "Invalid or expired token"}))
+        return
+
+    host = db.get_host(host_id)
+    path = request.args.get('path')
+    if not host or not path:
+        ws.send(json.dumps({"type": "error", "error": "Host not found" if not host else "Path is required"}))
+        return
+
+    lines = request.args.get('lines', default=100, type=int)
+    try:
+        with ansible.ssh_pool.sftp(host) as sftp:
+            with sftp.file(path, 'r') as f:
+                size = f.stat().st_size
+                window = file_viewer.tail(f, size, lines) if lines > 0 else {
+                    'content': '', 'offset': size, 'end': size, 'size': size, 'eof': True}
+            ws.send(json.dumps(dict(window, type='data'), ensure_ascii=False))
+
+            follower = TailFollower(sftp, path, window['end'], file_viewer.max_bytes)
+            try:
+                while True:
+                    # receive 在客户端断开时抛出异常，同时充当轮询间隔
+                    follower.wait(lambda timeout: ws.receive(timeout=timeout))
+                    for event in follower.poll():
+                        ws.send(json.dumps(event, ensure_ascii=False))
+            except ConnectionClosed:
+                # 在连接池上下文内处理断开，SSH 连接可以归还复用
+                app.logger.debug("tail 连接已关闭: host_id=%s path=%s", host_id, path)
+    except ConnectionClosed:
+        pass
+    except Exception as e:
+        app.logger.error(f"SFTP tail error: {str(e)}")
+        try:
+            ws.send(json.dumps({"type": "error", "error": str(e)}))
+        except ConnectionClosed:
+            pass
+
 @app.route('/api/sftp/<int:host_id>/write', methods=['POST'])
 @handle_error
 @auth_required
@@ -695,6 +1274,7 @@ def sftp_write(host_id):
         with sftp_client_for_host(host) as sftp:
             with sftp.file(path, 'w') as f:
                 f.write(content)
+        listing_cache.invalidate(host_id, path)
 
         return jsonify({'success': True})
     except Exception as e:
@@ -717,23 +1297,75 @@ def sftp_delete(host_id):
         if not path:
             return jsonify({'error': 'Path is required'}), 400
 
+        if is_directory and data.get('recursive'):
+            # 递归删除可能耗时较长，作为后台任务执行，通过 /api/jobs/<id> 查询进度
+            try:
+                path = delete_path(path)
+            except TreeError as e:
+                return jsonify({'error': str(e)}), 400
+            def run_delete(job):
+                try:
+                    return sftp_tree.delete(host, path, job)
+                finally:
+                    listing_cache.invalidate(host_id, path, recursive=True)
+
+            job = jobs.submit('sftp_delete', run_delete, params={'host_id': host_id, 'path': path})
+            return jsonify({'job_id': job.id, 'job': job.to_dict()}), 202
+
         with sftp_client_for_host(host) as sftp:
             if is_directory:
                 if sftp.listdir(path):
-                    return jsonify({'error': 'Directory is not empty'}), 400
+                    return jsonify({'error': 'Directory is not empty, set recursive to delete it'}), 400
                 sftp.rmdir(path)
             else:
                 sftp.remove(path)
+        listing_cache.invalidate(host_id, path, recursive=is_directory)
 
         return jsonify({'success': True})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/sftp/<int:host_id>/copy', methods=['POST'])
+@handle_error
+@auth_required
+def sftp_copy(host_id):
+    """在主机内递归复制文件或目录，作为后台任务执行，目标路径必须不存在"""
+    host = db.get_host(host_id)
+    if not host:
+        return jsonify({'error': 'Host not found'}), 404
+
+    data = request.get_json(silent=True) or {}
+    if not data.get('source') or not data.get('destination'):
+        return jsonify({'error': 'Both source and destination are required'}), 400
+    try:
+        source, destination = copy_paths(data['source'], data['destination'])
+        with ansible.ssh_pool.sftp(host) as sftp:
+            sftp.lstat(source)
+            try:
+                sftp.lstat(destination)
+                return jsonify({'error': 'Destination already exists'}), 400
+            except IOError:
+                pass
+    except TreeError as e:
+        return jsonify({'error': str(e)}), 400
+    except IOError as e:
+        return jsonify({'error': str(e)}), 400
+
+    def run_copy(job):
+        try:
+            return sftp_tree.copy(host, source, destination, job)
+        finally:
+            listing_cache.invalidate(host_id, destination, recursive=True)
+
+    job = jobs.submit('sftp_copy', run_copy,
+                      params={'host_id': host_id, 'source': source, 'destination': destination})
+    return jsonify({'job_id': job.id, 'job': job.to_dict()}), 202
+
 @app.route('/api/sftp/<int:host_id>/download')
 @handle_error
 @auth_required
 def sftp_download(host_id):
-    """下载文件"""
+    """下载文件；目录按 format（tar/tgz/zip，默认 tgz）打包后流式返回"""
     host = db.get_host(host_id)
     if not host:
         return jsonify({'error': 'Host not found'}), 404
@@ -747,7 +1379,7 @@ def sftp_download(host_id):
         with sftp_client_for_host(host) as sftp:
             file_attr = sftp.stat(path)
             if stat.S_ISDIR(file_attr.st_mode):
-                return jsonify({'error': 'Cannot download a directory'}), 400
+                return sftp_download_directory(host, path)
 
             # 仅使用文件名，避免目录遍历。
             temp_path = os.path.join('/tmp', secure_filename(filename))
@@ -769,6 +1401,173 @@ def sftp_download(host_id):
         app.logger.error(f"SFTP download error: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+def sftp_download_directory(host, path):
+    archive_format = request.args.get('format', 'tgz')
+    if archive_format not in ARCHIVE_FORMATS:
+        return jsonify({'error': f"format must be one of: {', '.join(ARCHIVE_FORMATS)}"}), 400
+    path = normalize_path(path)
+
+    job = jobs.track('sftp_download', params={'host_id': host['id'], 'path': path, 'format': archive_format})
+    basename = secure_filename(os.path.basename(path)) or 'root'
+    extension = {'tar': 'tar', 'tgz': 'tar.gz', 'zip': 'zip'}[archive_format]
+    mimetype = {'tar': 'application/x-tar', 'tgz': 'application/gzip', 'zip': 'application/zip'}[archive_format]
+    return Response(
+        sftp_tree.download_archive(host, path, archive_format, job),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename="{basename}.{extension}"', 'X-Job-ID': job.id}
+    )
+
+@app.route('/api/admission', methods=['GET'])
+@handle_error
+@auth_required
+def get_admission_status():
+    """准入控制状态：正在执行与排队中的请求（含排队位置、等待时长）以及 fork 预算占用"""
+    return jsonify(admission.status())
+
+@app.route('/api/jobs', methods=['GET'])
+@handle_error
+@auth_required
+def list_jobs():
+    """列出后台任务，可按 kind 过滤"""
+    return jsonify([job.to_dict() for job in jobs.list(request.args.get('kind'))])
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+@handle_error
+@auth_required
+def get_job(job_id):
+    """查询后台任务的状态、进度与结果"""
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+@handle_error
+@auth_required
+def cancel_job(job_id):
+    """取消后台任务，已在处理中的条目完成后停止"""
+    job = jobs.cancel(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict()), 202
+
+def validate_host_labels(host_data):
+    """检查主机数据中可选的 groups、tags 字段，返回错误信息或 None"""
+    groups = host_data.get('groups')
+    if groups is not None:
+        if not isinstance(groups, list):
+            return 'groups 必须是组名列表'
+        for name in groups:
+            error = validate_group_name(name)
+            if error:
+                return error
+    if host_data.get('tags') is not None:
+        return validate_tags(host_data['tags'])
+    return None
+
+def select_target_hosts(selector):
+    """按选择表达式解析目标主机，返回 (hosts, 错误响应)"""
+    try:
+        hosts = db.select_hosts(selector)
+    except SelectorError as e:
+        return None, (jsonify({'error': str(e)}), 400)
+    if not hosts:
+        return None, (jsonify({'error': f'没有主机匹配选择表达式: {selector}'}), 400)
+    return hosts, None
+
+def resolve_target_hosts(host_ids, selector=None):
+    """将请求中的 host_ids（id 列表或 'all'）或 selector 解析为主机列表，返回 (hosts, 错误响应)"""
+    if selector:
+        return select_target_hosts(selector)
+    if host_ids == 'all':
+        hosts = db.get_hosts()
+    elif isinstance(host_ids, list):
+        hosts = []
+        for host_id in host_ids:
+            host = db.get_host(host_id)
+            if not host:
+                return None, (jsonify({'error': f'Host not found: {host_id}'}), 404)
+            hosts.append(host)
+    else:
+        return None, (jsonify({'error': 'Invalid hosts format'}), 400)
+
+    if not hosts:
+        return None, (jsonify({'error': 'No valid target hosts'}), 400)
+    return hosts, None
+
+def _batch_sftp_request():
+    data = request.get_json(silent=True) or {}
+    path = data.get('path')
+    if not path:
+        return data, None, (jsonify({'error': 'Path is required'}), 400)
+    hosts, error = resolve_target_hosts(data.get('host_ids'), data.get('selector'))
+    return data, hosts, error
+
+def _batch_response(results):
+    failed = sum(1 for entry in results if 'error' in entry)
+    return jsonify({
+        'results': results,
+        'summary': {'total': len(results), 'succeeded': len(results) - failed, 'failed': failed}
+    })
+
+@app.route('/api/sftp/batch/stat', methods=['POST'])
+@handle_error
+@auth_required
+@admitted('sftp_batch')
+def sftp_batch_stat():
+    """并发获取多台主机上同一路径的文件信息"""
+    data, hosts, error = _batch_sftp_request()
+    if error:
+        return error
+    return _batch_response(batch_sftp.stat(hosts, data['path']))
+
+@app.route('/api/sftp/batch/read', methods=['POST'])
+@handle_error
+@auth_required
+@admitted('sftp_batch')
+def sftp_batch_read():
+    """并发读取多台主机上的同一文件，结果附带 sha256 便于比较"""
+    data, hosts, error = _batch_sftp_request()
+    if error:
+        return error
+    return _batch_response(batch_sftp.read(hosts, data['path'], max_bytes=data.get('max_bytes')))
+
+@app.route('/api/sftp/batch/list', methods=['POST'])
+@handle_error
+@auth_required
+@admitted('sftp_batch')
+def sftp_batch_list():
+    """并发列出多台主机上的同一目录"""
+    data, hosts, error = _batch_sftp_request()
+    if error:
+        return error
+    return _batch_response(batch_sftp.list(hosts, data['path']))
+
+@app.route('/api/sftp/batch/download', methods=['POST'])
+@handle_error
+@auth_required
+@admitted('sftp_batch')
+def sftp_batch_download():
+    """并发下载多台主机上的同一文件，以单个 tar/tgz/zip 归档流式返回
+
+    归档内为 <id-地址>/<文件名>，下载失败的主机记录在 errors.json 中。
+    """
+    data, hosts, error = _batch_sftp_request()
+    if error:
+        return error
+    archive_format = data.get('format', 'tar')
+    if archive_format not in ARCHIVE_FORMATS:
+        return jsonify({'error': f"format must be one of: {', '.join(ARCHIVE_FORMATS)}"}), 400
+
+    basename = secure_filename(os.path.basename(data['path'].rstrip('/'))) or 'files'
+    extension = {'tar': 'tar', 'tgz': 'tar.gz', 'zip': 'zip'}[archive_format]
+    mimetype = {'tar': 'application/x-tar', 'tgz': 'application/gzip', 'zip': 'application/zip'}[archive_format]
+    return Response(
+        batch_sftp.download_archive(hosts, data['path'], archive_format),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename="{basename}.{extension}"'}
+    )
+
 @app.errorhandler(404)
 def not_found_error(error):
     """处理404错误"""
@@ -777,7 +1576,7 @@ def not_found_error(error):
     if request.path.startswith('/api/') or request.path.startswith('/ws/'):
         return jsonify({'error': 'Not found'}), 404
     
-    return send_from_directory(app.static_folder, 'index.html')
+    return static_assets.serve_index()
 
 @app.errorhandler(500)
 def internal_error(error):
@@ -787,21 +1586,85 @@ def internal_error(error):
 @app.route('/api/access-logs', methods=['GET'])
 @handle_error
 @auth_required
+@versioned('access_logs')
 def get_access_logs():
-    """获取访问日志"""
+    """获取访问日志，since_id 用于只获取该 id 之后新增的日志"""
     limit = request.args.get('limit', default=100, type=int)
     ip_filter = request.args.get('ip', '').strip()
     path_filter = request.args.get('path', '').strip()
-    logs = db.get_access_logs(limit=limit, ip_filter=ip_filter, path_filter=path_filter)
+    since_id = request.args.get('since_id', type=int)
+    logs = db.get_access_logs(limit=limit, ip_filter=ip_filter, path_filter=path_filter, since_id=since_id)
     return jsonify(logs)
 
 @app.route('/api/access-logs/cleanup', methods=['POST'])
 @handle_error
 @auth_required
 def cleanup_logs():
-    """清理旧日志"""
-    db.cleanup_old_logs()
-    return jsonify({'message': '已清理3天前的访问日志和命令日志'})
+    """清理旧日志：唤醒后台保留引擎分批清理，立即返回"""
+    log_retention.trigger()
+    return jsonify({
+        'message': '已提交日志清理任务，将在后台分批清理过期的访问日志和命令日志',
+        'retention': log_retention.status()
+    }), 202
+
+@app.route('/api/admin/profiling', methods=['GET'])
+@handle_error
+@auth_required
+def get_profiling_settings():
+    """获取剖析配置"""
+    return jsonify(profiler.settings())
+
+@app.route('/api/admin/profiling', methods=['PUT'])
+@handle_error
+@auth_required
+def update_profiling_settings():
+    """运行时开启/关闭剖析或调整阈值"""
+    data = request.json or {}
+    paths = data.get('paths')
+    if paths is not None and not isinstance(paths, list):
+        return jsonify({'error': 'paths 必须是数组'}), 400
+    threshold_ms = data.get('threshold_ms')
+    if threshold_ms is not None and (isinstance(threshold_ms, bool) or not isinstance(threshold_ms, int) or threshold_ms < 0):
+        return jsonify({'error': 'threshold_ms 必须是非负整数（毫秒）'}), 400
+    profiler.configure(
+        enabled=data.get('enabled'),
+        threshold_ms=threshold_ms,
+        paths=paths,
+        use_cprofile=data.get('use_cprofile')
+    )
+    return jsonify(profiler.settings())
+
+@app.route('/api/admin/profiles', methods=['GET'])
+@handle_error
+@auth_required
+def list_profiles():
+    """列出已保存的慢请求剖析结果"""
+    limit = request.args.get('limit', default=50, type=int)
+    path_filter = request.args.get('path', '').strip()
+    profiles = db.get_profiles(limit=limit, path_filter=path_filter)
+    for item in profiles:
+        item['phases'] = json.loads(item['phases']) if item['phases'] else []
+        item['has_stats'] = bool(item['has_stats'])
+    return jsonify(profiles)
+
+@app.route('/api/admin/profiles/<int:profile_id>', methods=['GET'])
+@handle_error
+@auth_required
+def get_profile(profile_id):
+    """获取单条剖析结果，包括 cProfile 统计文本"""
+    profile = db.get_profile(profile_id)
+    if not profile:
+        return jsonify({'error': 'Profile not found'}), 404
+    profile['phases'] = json.loads(profile['phases']) if profile['phases'] else []
+    return jsonify(profile)
+
+@app.route('/api/admin/profiles', methods=['DELETE'])
+@handle_error
+@auth_required
+def clear_profiles():
+    """清空剖析结果"""
+    db.clear_profiles()
+    return jsonify({'message': '已清空剖析结果'})
 
 def create_required_directories():
     """创建必要的目录"""
@@ -812,6 +1675,8 @@ def create_required_directories():
 @app.route('/api/upload', methods=['POST'])
 @handle_error
 @auth_required
+@admitted('upload')
+@cancellable('upload')
 def api_upload():
     """API版本的文件上传处理，适配前端发送的格式，支持部分成功场景"""
     if 'file' not in request.files:
@@ -825,6 +1690,12 @@ def api_upload():
         filename = secure_filename(file.filename)
         remote_path = request.form.get('remote_path', '/tmp/')
         hosts_json = request.form.get('hosts', 'all')
+        selector = request.form.get('selector')
+        if selector:
+            selected, error = select_target_hosts(selector)
+            if error:
+                return error
+            hosts_json = json.dumps([host['id'] for host in selected])
         
         file_path = os.path.join(UPLOAD_FOLDER, filename)
         file.save(file_path)
@@ -843,12 +1714,12 @@ def api_upload():
                 host_ids = [str(h) for h in hosts]
                 all_hosts = db.get_hosts()
                 host_map = {str(h['id']): h for h in all_hosts}
-                result = ansible.copy_file_to_hosts(file_path, remote_file_path, hosts)
+                result = ansible.copy_file_to_hosts(file_path, remote_file_path, hosts, cancel=g.run)
             else:
                 all_hosts = db.get_hosts()
                 host_map = {str(h['id']): h for h in all_hosts}
                 host_ids = list(host_map.keys())
-                result = ansible.copy_file_to_all(file_path, remote_file_path)
+                result = ansible.copy_file_to_all(file_path, remote_file_path, cancel=g.run)
             
             if os.path.exists(file_path):
                 os.remove(file_path)
@@ -870,6 +1741,11 @@ def api_upload():
                 host_id = next((id for id, h in host_map.items() if h['address'] == host), None)
                 if host_id:
                     failed_hosts[host_id] = '主机不可达'
+
+            for host, res in result.get('cancelled', {}).items():
+                host_id = next((id for id, h in host_map.items() if h['address'] == host), None)
+                if host_id:
+                    failed_hosts[host_id] = '已取消，未上传'
             
             total = len(host_ids)
             succeeded = len(successful_hosts)
@@ -927,9 +1803,13 @@ def generate_token(user_id):
     return jwt.encode(payload, JWT_SECRET, algorithm='HS256')
 
 def decode_token(token):
-    """解码并验证JWT令牌"""
+    """解码并验证JWT令牌，验证成功的令牌在过期前缓存"""
+    payload = token_cache.get(token)
+    if payload is not None:
+        return payload
     try:
         payload = jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
+        token_cache.put(token, payload)
         return payload
     except jwt.ExpiredSignatureError:
         return None
@@ -959,68 +1839,358 @@ def get_ws_token(host_id):
         
     return jsonify({'token': generate_ws_token(host_id)})
 
+def validate_playbook(content):
+    """解析并校验 playbook，返回 (内容哈希, 错误信息)；结果进入解析缓存，执行时不再解析"""
+    try:
+        digest, _ = ansible.playbook_cache.parse(content)
+        return digest, None
+    except AnsibleError as e:
+        return None, f'Playbook校验失败: {e}'
+
+@app.route('/api/playbooks', methods=['GET'])
+@handle_error
+@auth_required
+@versioned('playbooks')
+def list_playbooks():
+    """列出已保存的 Playbook"""
+    return jsonify(db.list_playbooks())
+
+@app.route('/api/playbooks', methods=['POST'])
+@handle_error
+@auth_required
+def add_playbook():
+    """保存 Playbook，保存前校验语法与模块参数"""
+    data = request.json or {}
+    name = (data.get('name') or '').strip()
+    content = data.get('playbook')
+    if not name or not content:
+        return jsonify({'error': '缺少 name 或 playbook'}), 400
+
+    digest, error = validate_playbook(content)
+    if error:
+        return jsonify({'error': error}), 400
+    try:
+        playbook_id = db.add_playbook(name, content, digest, data.get('description'))
+    except sqlite3.IntegrityError:
+        return jsonify({'error': f'Playbook名称已存在: {name}'}), 409
+    return jsonify({'id': playbook_id, 'version': 1, 'content_hash': digest}), 201
+
+@app.route('/api/playbooks/<int:playbook_id>', methods=['GET'])
+@handle_error
+@auth_required
+def get_playbook(playbook_id):
+    """获取 Playbook 的当前版本，或通过 version 参数获取历史版本"""
+    playbook = db.get_playbook(playbook_id, request.args.get('version', type=int))
+    if not playbook:
+        return jsonify({'error': 'Playbook not found'}), 404
+    return jsonify(playbook)
+
+@app.route('/api/playbooks/<int:playbook_id>', methods=['PUT'])
+@handle_error
+@auth_required
+def update_playbook(playbook_id):
+    """更新 Playbook 名称、描述或内容，内容变化时生成新版本"""
+    data = request.json or {}
+    content = data.get('playbook')
+    name = data.get('name')
+    if name is not None and not name.strip():
+        return jsonify({'error': 'name 不能为空'}), 400
+
+    digest = None
+    if content is not None:
+        digest, error = validate_playbook(content)
+        if error:
+            return jsonify({'error': error}), 400
+    try:
+        version = db.update_playbook(
+            playbook_id, name=name and name.strip(), description=data.get('description'),
+            content=content, content_hash=digest
+        )
+    except sqlite3.IntegrityError:
+        return jsonify({'error': f'Playbook名称已存在: {name}'}), 409
+    if version is None:
+        return jsonify({'error': 'Playbook not found'}), 404
+    return jsonify({'id': playbook_id, 'version': version})
+
+@app.route('/api/playbooks/<int:playbook_id>', methods=['DELETE'])
+@handle_error
+@auth_required
+def delete_playbook(playbook_id):
+    """删除 Playbook 及其所有版本，被计划引用时拒绝删除"""
+    used_by = [s['name'] for s in db.list_schedules() if s['playbook_id'] == playbook_id]
+    if used_by:
+        return jsonify({'error': f"Playbook被计划引用: {', '.join(used_by)}"}), 409
+    if not db.delete_playbook(playbook_id):
+        return jsonify({'error': 'Playbook not found'}), 404
+    return jsonify({'message': 'Playbook deleted successfully'})
+
+@app.route('/api/playbooks/<int:playbook_id>/versions', methods=['GET'])
+@handle_error
+@auth_required
+def get_playbook_versions(playbook_id):
+    """列出 Playbook 的历史版本"""
+    versions = db.get_playbook_versions(playbook_id)
+    if not versions:
+        return jsonify({'error': 'Playbook not found'}), 404
+    return jsonify(versions)
+
 @app.route('/api/playbook/execute', methods=['POST'])
 @handle_error
 @auth_required
+@admitted('playbook')
+@cancellable('playbook')
 def execute_playbook():
-    """执行用户自定义的Ansible Playbook"""
+    """执行用户自定义的Ansible Playbook
+
+    可直接提供 playbook 内容，或通过 playbook_id（及可选的 version）执行已保存的 Playbook。
+    目标主机为 host_ids 或 selector 选择表达式，主机组与标签（tag_<标签>）在 inventory 中是同名的 Ansible 组。
+    结果中 hosts 为各主机的 PLAY RECAP 统计，tasks 为每个任务在各主机上的结果；
+    请求中 logs 为 false 时不返回文本日志。
+    """
     data = request.json
     playbook_content = data.get('playbook')
     host_ids = data.get('host_ids', [])
-    
+    selector = data.get('selector')
+    command = 'Custom Playbook Execution'
+
+    if data.get('playbook_id') is not None:
+        saved = db.get_playbook(data['playbook_id'], data.get('version'))
+        if not saved:
+            return jsonify({'error': 'Playbook not found'}), 404
+        playbook_content = saved['content']
+        command = f"Playbook {saved['name']} v{saved['version']}"
+
     if not playbook_content:
         return jsonify({'error': '未提供Playbook内容'}), 400
     
     target_hosts = None
-    if host_ids:
+    if selector:
+        target_hosts, error = select_target_hosts(selector)
+        if error:
+            return error
+    elif host_ids:
         target_hosts = [db.get_host(host_id) for host_id in host_ids]
         target_hosts = [host for host in target_hosts if host]
     
+    cancel_on_disconnect = data.get('cancel_on_disconnect', True)
+    if not cancel_on_disconnect:
+        g.run_watcher.stop()
+
+    if data.get('stream') or request.accept_mimetypes.best_match(
+            ['application/json', 'application/x-ndjson']) == 'application/x-ndjson':
+        # 名额由执行线程释放；cancel_on_disconnect 为 false 时客户端断开后 Playbook 继续执行
+        return stream_playbook(
+            playbook_content, target_hosts, ticket=g.admission_ticket.hold(), run=g.run,
+            cancel_on_disconnect=cancel_on_disconnect, command=command
+        )
+
     try:
-        result = ansible.execute_custom_playbook(playbook_content, target_hosts)
-        
-        if target_hosts:
-            for host in target_hosts:
-                host_status = 'success'
-                if host['address'] in result['summary']['failed']:
-                    host_status = 'failed'
-                elif host['address'] in result['summary']['unreachable']:
-                    host_status = 'unreachable'
-                
-                db.log_command(
-                    host['id'],
-                    'Custom Playbook Execution',
-                    json.dumps({'playbook_logs': result['logs']}),
-                    host_status
-                )
-        else:
-            db.log_command(
-                None,
-                'Custom Playbook Execution',
-                json.dumps({'playbook_logs': result['logs']}),
-                'success' if result['success'] else 'failed'
-            )
-        
+        result = ansible.execute_custom_playbook(
+            playbook_content, target_hosts, cancel=g.run, keep_logs=data.get('logs', True)
+        )
+        ansible.log_playbook_result(result, target_hosts, command)
         return jsonify(result)
     except Exception as e:
         app.logger.error(f"Playbook执行错误: {str(e)}")
         return jsonify({'error': f'Playbook执行失败: {str(e)}'}), 500
 
+PLAYBOOK_STREAM_BATCH = 200
+
+def stream_playbook(playbook_content, target_hosts, ticket=None, run=None, cancel_on_disconnect=True,
+                    command='Custom Playbook Execution'):
+    """以 NDJSON 流式返回 Playbook 输出
+
+    每行一个 JSON 对象: {"type": "log", "lines": [...]} 为新产生的输出（按批合并），
+    最后一行 {"type": "result", ...} 为执行结果（不再重复包含 logs），出错时为 {"type": "error"}。
+    客户端断开时取消执行；cancel_on_disconnect 为 False 时 Playbook 仍会执行完毕并记录日志。
+    """
+    events = queue.Queue()
+    done = object()
+
+    def execute():
+        result = error = None
+        try:
+            result = ansible.execute_custom_playbook(playbook_content, target_hosts, on_line=events.put, cancel=run)
+            ansible.log_playbook_result(result, target_hosts, command)
+            events.put({'type': 'result', **{k: v for k, v in result.items() if k != 'logs'}})
+        except Exception as e:
+            app.logger.error(f"Playbook执行错误: {str(e)}")
+            error = f'Playbook执行失败: {str(e)}'
+            events.put({'type': 'error', 'error': error})
+        finally:
+            if run is not None:
+                finish_run(run, result=result and result['summary'], error=error)
+            if ticket is not None:
+                ticket.release()
+            events.put(done)
+
+    threading.Thread(target=execute, name='playbook-stream', daemon=True).start()
+
+    def generate():
+        finished = False
+        try:
+            while not finished:
+                lines = [events.get()]
+                # 合并已积压的输出行，减少小块写入
+                while len(lines) < PLAYBOOK_STREAM_BATCH:
+                    try:
+                        lines.append(events.get_nowait())
+                    except queue.Empty:
+                        break
+                chunk = []
+                pending = []
+                for item in lines:
+                    if isinstance(item, str):
+                        pending.append(item)
+                        continue
+                    if pending:
+                        chunk.append({'type': 'log', 'lines': pending})
+                        pending = []
+                    if item is done:
+                        finished = True
+                    else:
+                        chunk.append(item)
+                if pending:
+                    chunk.append({'type': 'log', 'lines': pending})
+                yield b''.join(app.json.dumps_bytes(item) + b'\n' for item in chunk)
+        finally:
+            # 未读完就被关闭说明客户端已断开
+            if not finished and run is not None and cancel_on_disconnect:
+                app.logger.info("客户端已断开，取消 Playbook 执行")
+                run.cancel()
+
+    return Response(generate(), mimetype='application/x-ndjson', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+def parse_schedule(data, current=None):
+    """校验计划字段并计算下一次触发时间，返回 (字段, 错误信息)；current 为更新前的计划"""
+    values = {field: data[field] for field in ('name', 'command', 'playbook_id', 'playbook_version', 'cron',
+                                                'jitter', 'enabled') if field in data}
+    if 'host_ids' in data:
+        host_ids = data['host_ids']
+        if host_ids in (None, 'all'):
+            values['host_ids'] = None
+        elif isinstance(host_ids, list) and host_ids and all(isinstance(i, int) for i in host_ids):
+            values['host_ids'] = host_ids
+        else:
+            return None, "host_ids 必须是主机 id 列表或 'all'"
+    if 'kind' in data or current is None:
+        values['kind'] = data.get('kind') or (KIND_PLAYBOOK if data.get('playbook_id') else KIND_COMMAND)
+    if 'name' in values and not str(values['name']).strip():
+        return None, 'name 不能为空'
+    merged = {**(current or {'jitter': scheduler.default_jitter, 'enabled': True}), **values}
+    if not merged.get('name') or not merged.get('cron'):
+        return None, '缺少 name 或 cron'
+    if merged['kind'] not in SCHEDULE_KINDS:
+        return None, f"kind 必须是 {' 或 '.join(SCHEDULE_KINDS)}"
+    if merged['kind'] == KIND_COMMAND and not merged.get('command'):
+        return None, 'Command is required'
+    if merged['kind'] == KIND_PLAYBOOK and not db.get_playbook(merged.get('playbook_id'), merged.get('playbook_version')):
+        return None, 'Playbook not found'
+    if not isinstance(merged['jitter'], int) or merged['jitter'] < 0:
+        return None, 'jitter 必须是非负整数（秒）'
+    values.setdefault('jitter', merged['jitter'])
+    try:
+        # 新建、启用或修改时间规则时重新计算下一次触发时间
+        if current is None or {'cron', 'jitter', 'enabled'} & set(values):
+            values['next_run_at'] = scheduler.next_run_at(merged['cron'], merged['jitter']) if merged['enabled'] else None
+    except CronError as e:
+        return None, str(e)
+    return values, None
+
+@app.route('/api/schedules', methods=['GET'])
+@handle_error
+@auth_required
+@versioned('schedules', 'schedule_runs')
+def list_schedules():
+    """列出计划，running 为正在执行的任务 ID"""
+    running = scheduler.running()
+    schedules = db.list_schedules()
+    for schedule in schedules:
+        schedule['running'] = running.get(schedule['id'])
+    return jsonify(schedules)
+
+@app.route('/api/schedules', methods=['POST'])
+@handle_error
+@auth_required
+def add_schedule():
+    """添加计划：cron 时间规则，执行命令（command）或已保存的 Playbook（playbook_id）"""
+    values, error = parse_schedule(request.json or {})
+    if error:
+        return jsonify({'error': error}), 400
+    try:
+        schedule_id = db.add_schedule(values)
+    except sqlite3.IntegrityError:
+        return jsonify({'error': f"计划名称已存在: {values['name']}"}), 409
+    scheduler.wake()
+    return jsonify(db.get_schedule(schedule_id)), 201
+
+@app.route('/api/schedules/<int:schedule_id>', methods=['GET'])
+@handle_error
+@auth_required
+def get_schedule(schedule_id):
+    """获取计划"""
+    schedule = db.get_schedule(schedule_id)
+    if not schedule:
+        return jsonify({'error': 'Schedule not found'}), 404
+    schedule['running'] = scheduler.running().get(schedule_id)
+    return jsonify(schedule)
+
+@app.route('/api/schedules/<int:schedule_id>', methods=['PUT'])
+@handle_error
+@auth_required
+def update_schedule(schedule_id):
+    """修改计划的部分字段"""
+    current = db.get_schedule(schedule_id)
+    if not current:
+        return jsonify({'error': 'Schedule not found'}), 404
+    values, error = parse_schedule(request.json or {}, current)
+    if error:
+        return jsonify({'error': error}), 400
+    try:
+        db.update_schedule(schedule_id, values)
+    except sqlite3.IntegrityError:
+        return jsonify({'error': f"计划名称已存在: {values['name']}"}), 409
+    scheduler.wake()
+    return jsonify(db.get_schedule(schedule_id))
+
+@app.route('/api/schedules/<int:schedule_id>', methods=['DELETE'])
+@handle_error
+@auth_required
+def delete_schedule(schedule_id):
+    """删除计划及其执行历史，正在进行的执行不受影响"""
+    if not db.delete_schedule(schedule_id):
+        return jsonify({'error': 'Schedule not found'}), 404
+    return jsonify({'message': 'Schedule deleted successfully'})
+
+@app.route('/api/schedules/<int:schedule_id>/runs', methods=['GET'])
+@handle_error
+@auth_required
+@versioned('schedule_runs')
+def get_schedule_runs(schedule_id):
+    """计划的执行历史：计划时间、实际开始的延迟、耗时、状态与结果汇总"""
+    if not db.get_schedule(schedule_id):
+        return jsonify({'error': 'Schedule not found'}), 404
+    limit = min(request.args.get('limit', 50, type=int), scheduler.history_limit)
+    return jsonify(db.get_schedule_runs(schedule_id, limit))
+
+@app.route('/api/schedules/<int:schedule_id>/run', methods=['POST'])
+@handle_error
+@auth_required
+def run_schedule(schedule_id):
+    """立即执行一次计划，不影响下一次定时触发；通过 /api/jobs/<id> 查询或取消"""
+    schedule = db.get_schedule(schedule_id)
+    if not schedule:
+        return jsonify({'error': 'Schedule not found'}), 404
+    job = scheduler.launch(schedule)
+    if job is None:
+        return jsonify({'error': '上一次执行尚未结束'}), 409
+    return jsonify({'job_id': job.id, 'job': job.to_dict()}), 202
+
 if __name__ == '__main__':
     create_required_directories()
+    configure_logging(app)
 
-    file_handler = RotatingFileHandler(
-        'logs/app.log',
-        maxBytes=1_048_576,
-        backupCount=3,
-    )
-    file_handler.setFormatter(logging.Formatter(
-        '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
-    ))
-
-    root_logger = logging.getLogger()
-    root_logger.setLevel(logging.INFO)
-    root_logger.handlers.clear()
-    root_logger.addHandler(file_handler)
-    
     app.run(host='0.0.0.0', port=5000)
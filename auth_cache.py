@@ -0,0 +1,64 @@
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+class TokenCache:
+    """已验证 JWT 的有界缓存
+
+    以令牌的 SHA-256 作为键，保存解码后的 payload，命中时跳过签名校验；
+    条目在令牌的 exp 到期后失效，容量超出 AUTH_TOKEN_CACHE_SIZE 时按最近最少使用淘汰。
+    只缓存验证成功的令牌，伪造的令牌不会占用缓存。
+    """
+
+    def __init__(self, max_size=None):
+        self.max_size = max_size if max_size is not None else int(os.getenv('AUTH_TOKEN_CACHE_SIZE', '1024'))
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(token):
+        return hashlib.sha256(token.encode('utf-8')).digest()
+
+    def get(self, token):
+        """返回缓存的 payload，未命中或已过期时返回 None"""
+        if self.max_size <= 0:
+            return None
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            payload, expires_at = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return payload
+
+    def put(self, token, payload):
+        if self.max_size <= 0:
+            return
+        exp = payload.get('exp')
+        expires_at = float(exp) if isinstance(exp, (int, float)) else None
+        key = self._key(token)
+        with self._lock:
+            self._entries[key] = (payload, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._entries), 'max_size': self.max_size, 'hits': self.hits, 'misses': self.misses}
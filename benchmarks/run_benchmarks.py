@@ -0,0 +1,350 @@
+"""基准测试入口
+
+在临时工作目录中加载应用（独立的 SQLite 数据库），启动本地 SSH 替身并注册为主机，
+通过 Flask test client 测量各执行路径，结果以 JSON 输出，便于版本间对比。
+
+用法（在仓库根目录）:
+    python -m benchmarks.run_benchmarks --hosts 1,5,10 --output bench.json
+
+执行/ping 基准依赖 ansible、ssh 与 sshpass，与生产镜像一致。
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import datetime
+import tempfile
+import statistics
+import subprocess
+import concurrent.futures
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STANDIN_PASSWORD = 'standin'
+SUITES = ('execute', 'ping', 'fastpath', 'sftp', 'terminal', 'db', 'auth')
+
+
+def summarize(samples):
+    """返回耗时样本（秒）的统计摘要，单位毫秒"""
+    ordered = sorted(samples)
+
+    def percentile(p):
+        index = min(len(ordered) - 1, max(0, round(p * (len(ordered) - 1))))
+        return ordered[index]
+
+    return {
+        'count': len(ordered),
+        'min_ms': round(ordered[0] * 1000, 3),
+        'p50_ms': round(percentile(0.5) * 1000, 3),
+        'p95_ms': round(percentile(0.95) * 1000, 3),
+        'max_ms': round(ordered[-1] * 1000, 3),
+        'mean_ms': round(statistics.mean(ordered) * 1000, 3)
+    }
+
+
+def timed(func, iterations, warmup=1):
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=REPO_ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+
+class BenchmarkHarness:
+    def __init__(self, host_counts, iterations, db_rows):
+        self.host_counts = host_counts
+        self.iterations = iterations
+        self.db_rows = db_rows
+        self.results = []
+
+        self.workdir = tempfile.mkdtemp(prefix='ansible_ui_bench_')
+        os.chdir(self.workdir)
+        os.environ.setdefault('ADMIN_USERNAME', 'bench')
+        os.environ.setdefault('ADMIN_PASSWORD', 'bench-password')
+        os.environ.setdefault('ANSIBLE_HOST_KEY_CHECKING', 'False')
+        sys.path.insert(0, REPO_ROOT)
+
+        import app as app_module
+        from benchmarks.ssh_standin import start_standins
+
+        self.app_module = app_module
+        self.client = app_module.app.test_client()
+        self.token = self._login()
+        self.standins = start_standins(max(host_counts), password=STANDIN_PASSWORD)
+        self.host_ids = [self._register(standin) for standin in self.standins]
+
+    def _login(self):
+        response = self.client.post('/api/login', json={
+            'username': os.environ['ADMIN_USERNAME'],
+            'password': os.environ['ADMIN_PASSWORD']
+        })
+        if response.status_code != 200:
+            raise RuntimeError(f"登录失败: {response.get_data(as_text=True)}")
+        return response.get_json()['token']
+
+    @property
+    def headers(self):
+        return {'Authorization': f'Bearer {self.token}'}
+
+    def _register(self, standin):
+        response = self.client.post('/api/hosts', headers=self.headers, json={
+            'comment': f'standin-{standin.address}',
+            'address': standin.address,
+            'username': os.getenv('USER', 'root'),
+            'port': standin.port,
+            'password': STANDIN_PASSWORD,
+            'auth_method': 'password'
+        })
+        return response.get_json()['host_id']
+
+    def request(self, method, url, client=None, expect=(200,), headers=None, **kwargs):
+        client = client or self.client
+        response = client.open(url, method=method, headers=headers or self.headers, **kwargs)
+        if response.status_code not in expect:
+            raise RuntimeError(f"{method} {url} 返回 {response.status_code}: {response.get_data(as_text=True)[:200]}")
+        return response
+
+    def record(self, name, params, samples, **extra):
+        entry = {'name': name, 'params': params, 'stats': summarize(samples)}
+        entry.update(extra)
+        self.results.append(entry)
+        print(f"{name} {params} -> p50 {entry['stats']['p50_ms']}ms", file=sys.stderr)
+
+    def bench_execute(self):
+        for count in self.host_counts:
+            ids = self.host_ids[:count]
+            samples = timed(
+                lambda: self.request('POST', '/api/execute', json={'command': 'echo ok', 'hosts': ids}),
+                self.iterations
+            )
+            self.record('execute', {'hosts': count}, samples,
+                        hosts_per_second=round(count / statistics.mean(samples), 3))
+
+    def bench_ping(self):
+        app = self.app_module.app
+        for count in self.host_counts:
+            ids = self.host_ids[:count]
+
+            def fan_out():
+                with concurrent.futures.ThreadPoolExecutor(max_workers=count) as pool:
+                    list(pool.map(
+                        lambda host_id: self.request('GET', f'/api/hosts/{host_id}/ping', client=app.test_client()),
+                        ids
+                    ))
+
+            samples = timed(fan_out, self.iterations)
+            self.record('ping_fanout', {'hosts': count}, samples,
+                        hosts_per_second=round(count / statistics.mean(samples), 3))
+
+    def bench_fastpath(self):
+        """对比SSH快速通道与完整 Ansible 路径的执行与ping耗时"""
+        for mode, fast_path in (('fast_path', True), ('ansible', False)):
+            for count in self.host_counts:
+                ids = self.host_ids[:count]
+                try:
+                    samples = timed(
+                        lambda: self.request('POST', '/api/execute', json={
+                            'command': 'uptime', 'hosts': ids, 'fast_path': fast_path
+                        }),
+                        self.iterations
+                    )
+                except Exception as e:
+                    self.results.append({'name': 'fastpath_execute', 'params': {'mode': mode, 'hosts': count}, 'error': str(e)})
+                    continue
+                self.record('fastpath_execute', {'mode': mode, 'hosts': count}, samples,
+                            hosts_per_second=round(count / statistics.mean(samples), 3))
+
+            host_id = self.host_ids[0]
+            try:
+                samples = timed(
+                    lambda: self.request('GET', f'/api/hosts/{host_id}/ping',
+                                         query_string={'fast_path': str(fast_path).lower()}),
+                    self.iterations
+                )
+            except Exception as e:
+                self.results.append({'name': 'fastpath_ping', 'params': {'mode': mode}, 'error': str(e)})
+                continue
+            self.record('fastpath_ping', {'mode': mode}, samples)
+
+    def bench_sftp(self):
+        data_dir = os.path.join(self.workdir, 'sftp_data')
+        listing_dir = os.path.join(data_dir, 'listing')
+        os.makedirs(listing_dir, exist_ok=True)
+        for index in range(500):
+            with open(os.path.join(listing_dir, f'file_{index:04d}.txt'), 'w') as f:
+                f.write('x' * 128)
+
+        sizes = {'1MB': 1 << 20, '16MB': 16 << 20}
+        for label, size in sizes.items():
+            with open(os.path.join(data_dir, f'blob_{label}.bin'), 'wb') as f:
+                f.write(os.urandom(size))
+
+        host_id = self.host_ids[0]
+        samples = timed(
+            lambda: self.request('GET', f'/api/sftp/{host_id}/list', query_string={'path': listing_dir}),
+            self.iterations
+        )
+        self.record('sftp_list', {'entries': 500}, samples)
+
+        for label, size in sizes.items():
+            path = os.path.join(data_dir, f'blob_{label}.bin')
+            # 超过 SFTP_READ_MAX 的文件整体读取返回 413，按客户端的方式以 offset/length 窗口分段读完
+            windowed = size > self.app_module.SFTP_READ_MAX
+            operations = {
+                'read': (lambda: self.read_windows(host_id, path)) if windowed else
+                        (lambda: self.request('GET', f'/api/sftp/{host_id}/read', query_string={'path': path})),
+                'download': lambda: self.request('GET', f'/api/sftp/{host_id}/download', query_string={'path': path})
+            }
+            for operation, func in operations.items():
+                samples = timed(func, self.iterations)
+                params = {'size': label}
+                if operation == 'read' and windowed:
+                    params['mode'] = 'windowed'
+                self.record(f'sftp_{operation}', params, samples,
+                            megabytes_per_second=round(size / (1 << 20) / statistics.mean(samples), 3))
+
+    def read_windows(self, host_id, path):
+        """按 offset/length 窗口依次读取整个文件，返回请求次数"""
+        offset, requests = 0, 0
+        while True:
+            window = self.request('GET', f'/api/sftp/{host_id}/read',
+                                  query_string={'path': path, 'offset': offset, 'length': 1 << 20}).get_json()
+            requests += 1
+            if window['eof'] or window['end'] <= offset:
+                return requests
+            offset = window['end']
+
+    def bench_terminal(self):
+        """测量终端路径中 SSH 通道的按键回显往返延迟"""
+        host = self.app_module.db.get_host(self.host_ids[0])
+        with self.app_module.ssh_client_for_host(host) as ssh:
+            channel = ssh.invoke_shell(term='xterm-256color', width=100, height=30)
+            samples = []
+            for _ in range(self.iterations * 20):
+                start = time.perf_counter()
+                channel.send(b'x')
+                channel.recv(16)
+                samples.append(time.perf_counter() - start)
+            channel.close()
+        self.record('terminal_echo', {'keystrokes': len(samples)}, samples)
+
+    def bench_db(self):
+        batch = [{
+            'comment': f'bench-{index}',
+            'address': f'10.{index // 65536 % 256}.{index // 256 % 256}.{index % 256}',
+            'username': 'root',
+            'port': 22,
+            'password': 'secret'
+        } for index in range(self.db_rows)]
+        self.request('POST', '/api/hosts/batch', json=batch)
+
+        db = self.app_module.db
+        db.log_commands([
+            (self.host_ids[0], 'uptime', json.dumps({'stdout': f'up {index % 10} days', 'rc': 0}), 'success')
+            for index in range(self.db_rows)
+        ])
+
+        for name, url in (
+            ('db_hosts', '/api/hosts'),
+            ('db_logs', '/api/logs?limit=100'),
+            ('db_access_logs', '/api/access-logs?limit=100'),
+        ):
+            samples = timed(lambda: self.request('GET', url), self.iterations * 5)
+            self.record(name, {'rows': self.db_rows}, samples)
+
+    def bench_auth(self):
+        """测量每个请求的认证开销：令牌校验（缓存命中/未命中）、密钥检查与完整的认证请求"""
+        app_module = self.app_module
+        iterations = self.iterations * 1000
+
+        app_module.token_cache.clear()
+        token = self.token
+        samples = timed(lambda: (app_module.token_cache.clear(), app_module.decode_token(token)), iterations)
+        self.record('auth_decode_token', {'cache': 'miss'}, samples)
+
+        samples = timed(lambda: app_module.decode_token(token), iterations)
+        self.record('auth_decode_token', {'cache': 'hit'}, samples)
+
+        samples = timed(app_module.ensure_crypto_key, iterations)
+        self.record('auth_ensure_crypto_key', {}, samples)
+
+        # 不带 since 的 /api/changes 只返回版本号，耗时基本都是认证与请求框架开销
+        samples = timed(lambda: self.request('GET', '/api/changes'), self.iterations * 100)
+        self.record('auth_request', {'endpoint': '/api/changes'}, samples)
+        samples = timed(
+            lambda: self.request('GET', '/api/changes', headers={'Authorization': 'Bearer invalid'}, expect=(401,)),
+            self.iterations * 100
+        )
+        self.record('auth_request_rejected', {'endpoint': '/api/changes'}, samples)
+
+    def run(self, suites):
+        for suite in suites:
+            try:
+                getattr(self, f'bench_{suite}')()
+            except Exception as e:
+                self.results.append({'name': suite, 'error': str(e)})
+                print(f"{suite} 失败: {e}", file=sys.stderr)
+
+        return {
+            'meta': {
+                'revision': git_revision(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpu_count': os.cpu_count(),
+                'timestamp': datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+                'host_counts': self.host_counts,
+                'iterations': self.iterations
+            },
+            'results': self.results
+        }
+
+    def close(self):
+        for standin in self.standins:
+            standin.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='ansible-ui 基准测试')
+    parser.add_argument('--hosts', default='1,5,10', help='逗号分隔的主机数量梯度')
+    parser.add_argument('--iterations', type=int, default=5, help='每项测量的重复次数')
+    parser.add_argument('--db-rows', type=int, default=2000, help='数据库基准预置的主机/日志行数')
+    parser.add_argument('--only', default=','.join(SUITES), help=f'要运行的测试集，可选: {",".join(SUITES)}')
+    parser.add_argument('--output', help='结果输出文件，默认输出到标准输出')
+    args = parser.parse_args(argv)
+
+    host_counts = sorted({int(x) for x in args.hosts.split(',') if x.strip()})
+    suites = [s.strip() for s in args.only.split(',') if s.strip()]
+    unknown = set(suites) - set(SUITES)
+    if unknown:
+        parser.error(f"未知的测试集: {','.join(sorted(unknown))}")
+
+    output_path = os.path.abspath(args.output) if args.output else None
+    harness = BenchmarkHarness(host_counts, args.iterations, args.db_rows)
+    try:
+        report = harness.run(suites)
+    finally:
+        harness.close()
+
+    payload = json.dumps(report, indent=2, ensure_ascii=False)
+    if output_path:
+        with open(output_path, 'w') as f:
+            f.write(payload)
+    else:
+        print(payload)
+
+
+if __name__ == '__main__':
+    main()
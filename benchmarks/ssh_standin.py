@@ -0,0 +1,272 @@
+"""本地 SSH/SFTP 替身服务器
+
+基于 paramiko 在回环地址上启动若干 SSH 服务实例，作为基准测试的目标主机：
+- exec 请求在本机通过 /bin/sh 执行，足以支撑 Ansible 的 shell/ping/copy 模块；
+- shell 请求原样回显输入，用于测量终端往返延迟；
+- sftp 子系统直接映射到本机文件系统（与 exec 看到的路径一致）。
+
+仅用于基准测试，请勿暴露在非回环地址上。
+"""
+import os
+import socket
+import logging
+import threading
+import subprocess
+import paramiko
+
+# 客户端断开时服务端 transport 会记录连接重置等错误，基准测试中无需关注
+logging.getLogger('benchmarks.standin').setLevel(logging.CRITICAL)
+
+_HOST_KEY = None
+_HOST_KEY_LOCK = threading.Lock()
+
+
+def _host_key():
+    global _HOST_KEY
+    with _HOST_KEY_LOCK:
+        if _HOST_KEY is None:
+            _HOST_KEY = paramiko.RSAKey.generate(2048)
+        return _HOST_KEY
+
+
+class _LocalSFTPHandle(paramiko.SFTPHandle):
+    def stat(self):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def chattr(self, attr):
+        return paramiko.SFTP_OK
+
+
+class _LocalSFTPServer(paramiko.SFTPServerInterface):
+    """将 SFTP 请求映射到本机文件系统"""
+
+    def _wrap(self, func, *args):
+        try:
+            return func(*args)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def list_folder(self, path):
+        def _list():
+            entries = []
+            for name in os.listdir(path):
+                attr = paramiko.SFTPAttributes.from_stat(os.lstat(os.path.join(path, name)))
+                attr.filename = name
+                entries.append(attr)
+            return entries
+        return self._wrap(_list)
+
+    def stat(self, path):
+        return self._wrap(lambda: paramiko.SFTPAttributes.from_stat(os.stat(path)))
+
+    def lstat(self, path):
+        return self._wrap(lambda: paramiko.SFTPAttributes.from_stat(os.lstat(path)))
+
+    def open(self, path, flags, attr):
+        def _open():
+            mode = getattr(attr, 'st_mode', None) or 0o644
+            fd = os.open(path, flags, mode)
+            if flags & os.O_WRONLY:
+                fstr = 'ab' if flags & os.O_APPEND else 'wb'
+            elif flags & os.O_RDWR:
+                fstr = 'a+b' if flags & os.O_APPEND else 'r+b'
+            else:
+                fstr = 'rb'
+            f = os.fdopen(fd, fstr)
+            handle = _LocalSFTPHandle(flags)
+            handle.filename = path
+            handle.readfile = f
+            handle.writefile = f
+            return handle
+        return self._wrap(_open)
+
+    def remove(self, path):
+        return self._wrap(lambda: os.remove(path) or paramiko.SFTP_OK)
+
+    def rename(self, oldpath, newpath):
+        return self._wrap(lambda: os.rename(oldpath, newpath) or paramiko.SFTP_OK)
+
+    def posix_rename(self, oldpath, newpath):
+        return self._wrap(lambda: os.replace(oldpath, newpath) or paramiko.SFTP_OK)
+
+    def mkdir(self, path, attr):
+        return self._wrap(lambda: os.mkdir(path) or paramiko.SFTP_OK)
+
+    def rmdir(self, path):
+        return self._wrap(lambda: os.rmdir(path) or paramiko.SFTP_OK)
+
+    def chattr(self, path, attr):
+        def _chattr():
+            if attr.st_mode is not None:
+                os.chmod(path, attr.st_mode & 0o7777)
+            if attr.st_atime is not None and attr.st_mtime is not None:
+                os.utime(path, (attr.st_atime, attr.st_mtime))
+            return paramiko.SFTP_OK
+        return self._wrap(_chattr)
+
+    def symlink(self, target_path, path):
+        return self._wrap(lambda: os.symlink(target_path, path) or paramiko.SFTP_OK)
+
+    def readlink(self, path):
+        return self._wrap(lambda: os.readlink(path))
+
+    def canonicalize(self, path):
+        return os.path.normpath(path if os.path.isabs(path) else os.path.join(os.path.expanduser('~'), path))
+
+
+class _StandinServer(paramiko.ServerInterface):
+    def __init__(self, password):
+        self.password = password
+
+    def get_allowed_auths(self, username):
+        return 'password,publickey'
+
+    def check_auth_password(self, username, password):
+        if self.password is None or password == self.password:
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def check_auth_publickey(self, username, key):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def check_channel_request(self, kind, chanid):
+        if kind == 'session':
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_pty_request(self, channel, term, width, height, pixelwidth, pixelheight, modes):
+        return True
+
+    def check_channel_window_change_request(self, channel, width, height, pixelwidth, pixelheight):
+        return True
+
+    def check_channel_env_request(self, channel, name, value):
+        return True
+
+    def check_channel_shell_request(self, channel):
+        threading.Thread(target=_echo_shell, args=(channel,), daemon=True).start()
+        return True
+
+    def check_channel_exec_request(self, channel, command):
+        threading.Thread(target=_run_exec, args=(channel, command), daemon=True).start()
+        return True
+
+
+def _echo_shell(channel):
+    """交互式 shell 替身：原样回显收到的数据"""
+    try:
+        while True:
+            data = channel.recv(4096)
+            if not data:
+                break
+            channel.sendall(data)
+    except Exception:
+        pass
+    finally:
+        channel.close()
+
+
+def _run_exec(channel, command):
+    """在本机执行 exec 请求，并转发标准输入输出"""
+    process = subprocess.Popen(
+        command.decode('utf-8') if isinstance(command, bytes) else command,
+        shell=True,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE
+    )
+
+    def pump_stdin():
+        try:
+            while True:
+                data = channel.recv(32768)
+                if not data:
+                    break
+                process.stdin.write(data)
+                process.stdin.flush()
+        except Exception:
+            pass
+        finally:
+            try:
+                process.stdin.close()
+            except Exception:
+                pass
+
+    def pump(stream, send):
+        for chunk in iter(lambda: stream.read1(32768), b''):
+            send(chunk)
+
+    threads = [
+        threading.Thread(target=pump_stdin, daemon=True),
+        threading.Thread(target=pump, args=(process.stdout, channel.sendall), daemon=True),
+        threading.Thread(target=pump, args=(process.stderr, channel.sendall_stderr), daemon=True),
+    ]
+    for thread in threads:
+        thread.start()
+    threads[1].join()
+    threads[2].join()
+    channel.send_exit_status(process.wait())
+    channel.close()
+
+
+class SSHStandin:
+    """单个监听在回环地址上的 SSH 替身实例"""
+
+    def __init__(self, address='127.0.0.1', port=0, password=None):
+        self.password = password
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind((address, port))
+        self._sock.listen(128)
+        self.address, self.port = self._sock.getsockname()
+        self._transports = []
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._accept_loop, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _accept_loop(self):
+        while not self._closed.is_set():
+            try:
+                client, _ = self._sock.accept()
+            except OSError:
+                break
+            transport = paramiko.Transport(client)
+            transport.set_log_channel('benchmarks.standin')
+            transport.add_server_key(_host_key())
+            transport.set_subsystem_handler('sftp', paramiko.SFTPServer, _LocalSFTPServer)
+            self._transports.append(transport)
+            # 握手在各自的线程中进行，避免串行握手影响并发与扇出的测量结果
+            threading.Thread(target=self._handshake, args=(transport,), daemon=True).start()
+
+    def _handshake(self, transport):
+        try:
+            transport.start_server(server=_StandinServer(self.password))
+        except Exception:
+            transport.close()
+
+    def stop(self):
+        self._closed.set()
+        try:
+            self._sock.close()
+        except OSError:
+            pass
+        for transport in self._transports:
+            transport.close()
+
+
+def start_standins(count, password='standin', base_port=2222):
+    """在 127.0.0.2 起的连续回环地址上启动 count 个替身
+
+    每个实例使用独立的地址，保证按地址回填结果的逻辑（inventory 主机名即地址）不会冲突。
+    """
+    standins = []
+    for index in range(count):
+        address = f"127.0.{(index + 2) // 256}.{(index + 2) % 256}"
+        standins.append(SSHStandin(address=address, port=base_port, password=password).start())
+    return standins
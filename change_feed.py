@@ -0,0 +1,91 @@
+import time
+import datetime
+import threading
+from collections import deque
+
+DEFAULT_CAPACITY = 1000
+
+
+class ChangeFeed:
+    """数据变更版本号与最近变更的环形缓冲
+
+    每次数据库写入提交后调用 publish，全局版本号递增并记录事件（主题、动作、涉及的行 id）。
+    版本号以启动时的毫秒时间戳为起点，重启后不会与旧版本重复，可直接用于 ETag。
+    客户端通过 since 获取某版本之后的事件；早于缓冲区的版本返回 None，需重新全量拉取。
+    coalesce 中的高频主题（如访问日志）连续发布时合并为缓冲区中的一条事件，主题版本号照常递增，
+    避免其挤出其他主题的事件。
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, coalesce=()):
+        self._events = deque(maxlen=capacity)
+        self._coalesce = frozenset(coalesce)
+        self._version = int(time.time() * 1000)
+        # 缓冲区中保留了该版本之后的全部事件（被合并的事件由合并后的那条代表）
+        self._floor = self._version
+        self._topic_versions = {}
+        self._condition = threading.Condition()
+
+    @property
+    def version(self):
+        with self._condition:
+            return self._version
+
+    def publish(self, topic, action, ids=None):
+        """记录一次变更并唤醒等待中的订阅者，返回新的版本号"""
+        with self._condition:
+            self._version += 1
+            self._topic_versions[topic] = self._version
+            last = self._events[-1] if self._events else None
+            if topic in self._coalesce and last is not None and last['topic'] == topic:
+                # 合并到上一条同主题事件：版本更新为最新，已读过旧版本的订阅者会再次收到；
+                # 合并后涉及的行不再逐一列出
+                self._events[-1] = {
+                    'version': self._version,
+                    'topic': topic,
+                    'action': action if last['action'] == action else 'update',
+                    'ids': None,
+                    'at': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='milliseconds')
+                }
+                self._condition.notify_all()
+                return self._version
+            if len(self._events) == self._events.maxlen:
+                self._floor = self._events[0]['version']
+            self._events.append({
+                'version': self._version,
+                'topic': topic,
+                'action': action,
+                'ids': list(ids) if ids is not None else None,
+                'at': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='milliseconds')
+            })
+            self._condition.notify_all()
+            return self._version
+
+    def versions(self, topics):
+        """返回各主题最近一次变更的版本号，未变更过的主题为 0"""
+        with self._condition:
+            return [self._topic_versions.get(topic, 0) for topic in topics]
+
+    def _collect(self, since, topics):
+        if since < self._floor or since > self._version:
+            return None
+        return [
+            event for event in self._events
+            if event['version'] > since and (not topics or event['topic'] in topics)
+        ]
+
+    def since(self, since, topics=None, timeout=0):
+        """返回 since 之后的事件，没有新事件时最多等待 timeout 秒
+
+        Returns:
+            tuple: (events, version)，events 为 None 表示 since 已超出缓冲区
+        """
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while True:
+                events = self._collect(since, topics)
+                if events is None or events:
+                    return events, self._version
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return [], self._version
+                self._condition.wait(remaining)
@@ -0,0 +1,92 @@
+import os
+import zlib
+import gzip
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # brotli 为可选依赖，未安装时只提供 gzip
+    brotli = None
+
+COMPRESSIBLE_TYPES = ('application/json', 'application/x-ndjson', 'text/plain', 'text/csv', 'text/html')
+
+
+class ResponseCompressor:
+    """按 Accept-Encoding 协商压缩 API 响应
+
+    仅处理 /api/ 下超过 COMPRESS_MIN_SIZE 字节的 JSON/文本响应；流式响应（如 NDJSON）
+    逐块压缩并同步刷新，客户端可以边接收边解析。已设置 Content-Encoding 的响应与 SSE 不做处理。
+    """
+
+    def __init__(self, app=None):
+        self.min_size = int(os.getenv('COMPRESS_MIN_SIZE', '1024'))
+        self.level = int(os.getenv('COMPRESS_LEVEL', '6'))
+        self.brotli_quality = int(os.getenv('COMPRESS_BROTLI_QUALITY', '4'))
+        self.enabled = os.getenv('COMPRESS_ENABLED', '1').lower() not in ('0', 'false', 'no')
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.after_request(self.after_request)
+
+    @staticmethod
+    def _choose_encoding():
+        accepted = request.accept_encodings
+        if brotli is not None and accepted['br']:
+            return 'br'
+        if accepted['gzip']:
+            return 'gzip'
+        return None
+
+    def after_request(self, response):
+        if (not self.enabled
+                or not request.path.startswith('/api/')
+                or response.status_code < 200 or response.status_code in (204, 304)
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESSIBLE_TYPES):
+            return response
+
+        encoding = self._choose_encoding()
+        response.vary.add('Accept-Encoding')
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            response.response = self._compress_stream(response.response, encoding)
+            response.direct_passthrough = False
+        else:
+            body = response.get_data()
+            if len(body) < self.min_size:
+                return response
+            if encoding == 'br':
+                response.set_data(brotli.compress(body, quality=self.brotli_quality))
+            else:
+                response.set_data(gzip.compress(body, compresslevel=self.level))
+
+        response.headers['Content-Encoding'] = encoding
+        response.headers.pop('Content-Length', None)
+        if response.headers.get('ETag') and not response.headers['ETag'].startswith('W/'):
+            response.headers['ETag'] = 'W/' + response.headers['ETag']
+        return response
+
+    def _compress_stream(self, chunks, encoding):
+        """逐块压缩可迭代的响应体，每块后刷新以保证实时性"""
+        if encoding == 'br':
+            compressor = brotli.Compressor(quality=self.brotli_quality)
+            compress, flush, finish = compressor.process, compressor.flush, compressor.finish
+        else:
+            compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+            compress = compressor.compress
+            flush = lambda: compressor.flush(zlib.Z_SYNC_FLUSH)
+            finish = compressor.flush
+        try:
+            for chunk in chunks:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode('utf-8')
+                data = compress(chunk) + flush()
+                if data:
+                    yield data
+            yield finish()
+        finally:
+            if hasattr(chunks, 'close'):
+                chunks.close()
@@ -4,9 +4,12 @@ from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 import hashlib
+import threading
 
 CRYPTO_KEY = None
 CRYPTO_SALT = None
+# 已设置由管理员凭证派生的正式密钥（区别于启动时的占位密钥）
+_KEYS_READY = threading.Event()
 
 class CryptoUtils:
     """加密工具类，用于处理密码加密和解密"""
@@ -88,6 +91,16 @@ def set_crypto_keys(key, salt):
     CRYPTO_KEY = key
     CRYPTO_SALT = salt
 
+    # 单例在导入时已持有占位密钥，需要同步更新，否则加解密仍使用随机密钥
+    if CryptoUtils._instance is not None:
+        CryptoUtils._instance.key = key
+        CryptoUtils._instance.salt = salt
+    _KEYS_READY.set()
+
+def crypto_keys_ready():
+    """是否已设置正式密钥"""
+    return _KEYS_READY.is_set()
+
 def derive_key_from_credentials(username, password):
     """从用户名和密码派生加密密钥
     
@@ -1,12 +1,90 @@
 import sqlite3
 from contextlib import contextmanager
+from functools import wraps
 import os
+import json
+import base64
+import time
 from crypto_utils import CryptoUtils
+from output_store import OutputStore
+from change_feed import ChangeFeed
+from metrics import DB_QUERY_SECONDS
+from host_selector import compile_selector
+
+# 统一使用UTC的ISO-8601格式存储时间戳，保证字典序与时间序一致，便于索引范围扫描
+UTC_TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+SQL_UTC_NOW = f"(strftime('{UTC_TIMESTAMP_FORMAT}', 'now'))"
+
+# 日志表及其时间列，供保留策略按批次清理
+LOG_TABLES = {
+    'access_logs': 'access_time',
+    'command_logs': 'executed_at',
+}
+
+SCHEMA_VERSION = 3
+
+# 主机列表可返回的字段及对应的SQL表达式，列表查询不读取也不解密密码
+HOST_LIST_FIELDS = {
+    'id': 'id',
+    'comment': 'comment',
+    'address': 'address',
+    'username': 'username',
+    'port': 'port',
+    'auth_method': 'auth_method',
+    'created_at': 'created_at',
+    'is_password_encrypted': "(auth_method = 'password' AND substr(password, 1, 4) = 'ENC:')",
+    'groups': """(SELECT json_group_array(g.name) FROM host_group_members m
+                  JOIN host_groups g ON g.id = m.group_id WHERE m.host_id = hosts.id)""",
+    'tags': "(SELECT json_group_array(tag) FROM host_tags WHERE host_id = hosts.id)",
+}
+HOST_LABEL_FIELDS = ('groups', 'tags')
+
+# 计划中可修改的字段
+SCHEDULE_FIELDS = (
+    'name', 'kind', 'command', 'playbook_id', 'playbook_version', 'host_ids', 'cron', 'jitter', 'enabled', 'next_run_at'
+)
+
+# 可排序字段及排序表达式，均有 (列, id) 复合索引支持游标分页
+HOST_SORT_KEYS = {
+    'created_at': 'created_at',
+    'comment': 'comment COLLATE NOCASE',
+    'address': 'address COLLATE NOCASE',
+    'id': 'id',
+}
+
+
+def _encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def _decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+    if not isinstance(values, list) or len(values) != 2:
+        raise ValueError('Invalid cursor')
+    return values
+
+def timed_query(f):
+    """记录数据库操作耗时的装饰器"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return f(*args, **kwargs)
+        finally:
+            DB_QUERY_SECONDS.observe(time.perf_counter() - start, operation=f.__name__)
+    return decorated_function
 
 class Database:
     def __init__(self, db_path="db/ansible.db"):
         self.db_path = db_path
         self.crypto = CryptoUtils()
+        self.outputs = OutputStore()
+        # 每个 API 请求都会写访问日志，其变更事件合并记录
+        self.changes = ChangeFeed(coalesce=('access_logs',))
 
         db_dir = os.path.dirname(self.db_path)
         if not os.path.exists(db_dir):
@@ -30,29 +108,209 @@ class Database:
                 )
             """)
             
-            conn.execute("""
+            conn.execute(f"""
                 CREATE TABLE IF NOT EXISTS command_logs (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     host_id INTEGER,
                     command TEXT NOT NULL,
                     output TEXT,
                     status TEXT NOT NULL,
-                    executed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    executed_at TIMESTAMP DEFAULT {SQL_UTC_NOW},
                     FOREIGN KEY (host_id) REFERENCES hosts (id)
                 )
             """)
 
-            conn.execute("""
+            conn.execute(f"""
                 CREATE TABLE IF NOT EXISTS access_logs (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     ip_address TEXT NOT NULL,
                     path TEXT NOT NULL,
                     status TEXT NOT NULL,
                     status_code INTEGER NOT NULL,
-                    access_time TIMESTAMP DEFAULT (datetime('now', '+8 hours'))
+                    access_time TIMESTAMP DEFAULT {SQL_UTC_NOW}
+                )
+            """)
+
+            conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS command_outputs (
+                    hash TEXT PRIMARY KEY,
+                    codec TEXT NOT NULL,
+                    data BLOB NOT NULL,
+                    raw_size INTEGER NOT NULL,
+                    stored_size INTEGER NOT NULL,
+                    created_at TIMESTAMP DEFAULT {SQL_UTC_NOW}
+                )
+            """)
+
+            conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS profiles (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    method TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    status_code INTEGER,
+                    duration_ms REAL NOT NULL,
+                    phases TEXT,
+                    stats TEXT,
+                    created_at TIMESTAMP DEFAULT {SQL_UTC_NOW}
+                )
+            """)
+
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS host_health (
+                    host_id INTEGER PRIMARY KEY,
+                    status TEXT,
+                    latency_ms REAL,
+                    banner TEXT,
+                    error TEXT,
+                    ping_status TEXT,
+                    checked_at TIMESTAMP,
+                    last_seen TIMESTAMP,
+                    FOREIGN KEY (host_id) REFERENCES hosts (id)
+                )
+            """)
+
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS host_facts (
+                    host_id INTEGER PRIMARY KEY,
+                    codec TEXT NOT NULL,
+                    data BLOB NOT NULL,
+                    gathered_at TIMESTAMP NOT NULL,
+                    FOREIGN KEY (host_id) REFERENCES hosts (id)
+                )
+            """)
+
+            conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS playbooks (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    name TEXT NOT NULL UNIQUE,
+                    description TEXT,
+                    current_version INTEGER NOT NULL,
+                    created_at TIMESTAMP DEFAULT {SQL_UTC_NOW},
+                    updated_at TIMESTAMP DEFAULT {SQL_UTC_NOW}
+                )
+            """)
+
+            conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS playbook_versions (
+                    playbook_id INTEGER NOT NULL,
+                    version INTEGER NOT NULL,
+                    content TEXT NOT NULL,
+                    content_hash TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT {SQL_UTC_NOW},
+                    PRIMARY KEY (playbook_id, version),
+                    FOREIGN KEY (playbook_id) REFERENCES playbooks (id)
+                )
+            """)
+
+            conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS schedules (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    name TEXT NOT NULL UNIQUE,
+                    kind TEXT NOT NULL,
+                    command TEXT,
+                    playbook_id INTEGER,
+                    playbook_version INTEGER,
+                    host_ids TEXT,
+                    cron TEXT NOT NULL,
+                    jitter INTEGER NOT NULL DEFAULT 0,
+                    enabled INTEGER NOT NULL DEFAULT 1,
+                    next_run_at TIMESTAMP,
+                    created_at TIMESTAMP DEFAULT {SQL_UTC_NOW},
+                    updated_at TIMESTAMP DEFAULT {SQL_UTC_NOW},
+                    FOREIGN KEY (playbook_id) REFERENCES playbooks (id)
                 )
             """)
 
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS schedule_runs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    schedule_id INTEGER NOT NULL,
+                    job_id TEXT,
+                    trigger TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    scheduled_at TIMESTAMP NOT NULL,
+                    started_at TIMESTAMP,
+                    finished_at TIMESTAMP,
+                    lateness_ms REAL,
+                    duration_ms REAL,
+                    summary TEXT,
+                    error TEXT,
+                    instance TEXT,
+                    FOREIGN KEY (schedule_id) REFERENCES schedules (id)
+                )
+            """)
+
+            conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS host_groups (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    name TEXT NOT NULL UNIQUE,
+                    description TEXT,
+                    created_at TIMESTAMP DEFAULT {SQL_UTC_NOW}
+                )
+            """)
+
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS host_group_members (
+                    group_id INTEGER NOT NULL,
+                    host_id INTEGER NOT NULL,
+                    PRIMARY KEY (group_id, host_id),
+                    FOREIGN KEY (group_id) REFERENCES host_groups (id),
+                    FOREIGN KEY (host_id) REFERENCES hosts (id)
+                ) WITHOUT ROWID
+            """)
+
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS host_tags (
+                    host_id INTEGER NOT NULL,
+                    tag TEXT NOT NULL,
+                    PRIMARY KEY (host_id, tag),
+                    FOREIGN KEY (host_id) REFERENCES hosts (id)
+                ) WITHOUT ROWID
+            """)
+
+            self._migrate(conn)
+
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_command_logs_executed_at ON command_logs(executed_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_access_logs_access_time ON access_logs(access_time)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_command_logs_output_hash ON command_logs(output_hash)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_hosts_created_at ON hosts(created_at, id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_hosts_comment ON hosts(comment COLLATE NOCASE, id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_hosts_address ON hosts(address COLLATE NOCASE, id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_host_group_members_host ON host_group_members(host_id, group_id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_host_tags_tag ON host_tags(tag, host_id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_schedules_next_run_at ON schedules(enabled, next_run_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_schedule_runs_schedule ON schedule_runs(schedule_id, id)")
+
+    def _migrate(self, conn):
+        """按 user_version 执行一次性的结构迁移"""
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+
+        if version < 1:
+            # 旧版本中访问日志为北京时间、命令日志为UTC空格格式，统一转换为UTC ISO格式
+            conn.execute(f"""
+                UPDATE access_logs
+                SET access_time = strftime('{UTC_TIMESTAMP_FORMAT}', access_time, '-8 hours')
+                WHERE access_time NOT LIKE '%Z'
+            """)
+            conn.execute(f"""
+                UPDATE command_logs
+                SET executed_at = strftime('{UTC_TIMESTAMP_FORMAT}', executed_at)
+                WHERE executed_at NOT LIKE '%Z'
+            """)
+
+        if version < 2:
+            columns = {row['name'] for row in conn.execute("PRAGMA table_info(command_logs)")}
+            if 'output_hash' not in columns:
+                conn.execute("ALTER TABLE command_logs ADD COLUMN output_hash TEXT")
+
+        if version < 3:
+            columns = {row['name'] for row in conn.execute("PRAGMA table_info(schedule_runs)")}
+            if 'instance' not in columns:
+                conn.execute("ALTER TABLE schedule_runs ADD COLUMN instance TEXT")
+
+        if version < SCHEMA_VERSION:
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
     def init_users_table(self):
         """初始化用户表"""
         with self.get_connection() as conn:
@@ -79,6 +337,15 @@ class Database:
         finally:
             conn.close()
 
+    @staticmethod
+    def _inserted_ids(conn, table, count):
+        """返回当前事务中刚插入的 count 行的 id（写锁持有期间自增 id 连续）"""
+        if count <= 0:
+            return []
+        last_id = conn.execute(f"SELECT MAX(id) FROM {table}").fetchone()[0]
+        return list(range(last_id - count + 1, last_id + 1))
+
+    @timed_query
     def add_host(self, host_data):
         """添加单个主机"""
         with self.get_connection() as conn:
@@ -99,8 +366,13 @@ class Database:
                 encrypted_password,
                 auth_method
             ))
-            return cursor.lastrowid
+            self._replace_labels(conn, [cursor.lastrowid], host_data.get('groups'), host_data.get('tags'))
+        if host_data.get('groups'):
+            self.changes.publish('host_groups', 'update')
+        self.changes.publish('hosts', 'insert', [cursor.lastrowid])
+        return cursor.lastrowid
 
+    @timed_query
     def add_hosts_batch(self, hosts_data):
         """批量添加主机"""
         with self.get_connection() as conn:
@@ -125,12 +397,28 @@ class Database:
                 INSERT INTO hosts (comment, address, username, port, password, auth_method)
                 VALUES (?, ?, ?, ?, ?, ?)
             """, processed_hosts)
-            return cursor.rowcount
+            ids = self._inserted_ids(conn, 'hosts', cursor.rowcount)
+            for host_id, host in zip(ids, hosts_data):
+                self._replace_labels(conn, [host_id], host.get('groups'), host.get('tags'))
+        if any(host.get('groups') for host in hosts_data):
+            self.changes.publish('host_groups', 'update')
+        self.changes.publish('hosts', 'insert', ids)
+        return len(ids)
 
+    @timed_query
     def get_hosts(self):
         """获取所有主机"""
+        return self._query_hosts()
+
+    @timed_query
+    def select_hosts(self, selector):
+        """按选择表达式获取主机，表达式无效时抛出 SelectorError"""
+        selector_sql, params = compile_selector(selector)
+        return self._query_hosts(selector_sql, params)
+
+    def _query_hosts(self, where='1', params=()):
         with self.get_connection() as conn:
-            cursor = conn.execute("SELECT * FROM hosts ORDER BY created_at DESC")
+            cursor = conn.execute(f"SELECT * FROM hosts WHERE {where} ORDER BY created_at DESC", params)
             hosts = [dict(row) for row in cursor.fetchall()]
             
             for host in hosts:
@@ -141,6 +429,86 @@ class Database:
                     host['password'] = None
             return hosts
 
+    @timed_query
+    def list_hosts(self, fields=None, search='', ids=None, sort='created_at', descending=True, limit=None, cursor=None,
+                   selector=None):
+        """按条件分页查询主机列表（不解密密码）
+
+        Args:
+            fields: 返回的字段列表，默认全部 HOST_LIST_FIELDS
+            search: 按备注或地址前缀匹配（不区分大小写），由 NOCASE 索引支持
+            ids: 只返回指定 id 的主机
+            selector: 主机选择表达式，见 host_selector.compile_selector
+            sort: HOST_SORT_KEYS 中的排序字段，id 作为次级排序保证顺序稳定
+            limit: 每页数量，None 表示返回全部
+            cursor: 上一页返回的游标
+
+        Returns:
+            tuple: (hosts, total, next_cursor)
+        """
+        if sort not in HOST_SORT_KEYS:
+            raise ValueError(f'Invalid sort field: {sort}')
+        fields = list(fields or HOST_LIST_FIELDS)
+        unknown = set(fields) - set(HOST_LIST_FIELDS)
+        if unknown:
+            raise ValueError(f"Invalid fields: {','.join(sorted(unknown))}")
+
+        sort_expr = HOST_SORT_KEYS[sort]
+        where, params = [], []
+        if search:
+            pattern = search.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+            where.append("(comment LIKE ? ESCAPE '\\' OR address LIKE ? ESCAPE '\\')")
+            params += [pattern, pattern]
+        if ids is not None:
+            where.append(f"id IN ({','.join('?' * len(ids))})" if ids else "0")
+            params += list(ids)
+        if selector:
+            selector_sql, selector_params = compile_selector(selector)
+            where.append(selector_sql)
+            params += selector_params
+
+        with self.get_connection() as conn:
+            filter_sql = f"WHERE {' AND '.join(where)}" if where else ''
+            total = conn.execute(f"SELECT COUNT(*) FROM hosts {filter_sql}", params).fetchone()[0]
+
+            page_where, page_params = list(where), list(params)
+            if cursor:
+                page_where.append(f"({sort_expr}, id) {'<' if descending else '>'} (?, ?)")
+                page_params += _decode_cursor(cursor)
+
+            columns = ', '.join(f"{HOST_LIST_FIELDS[f]} AS {f}" for f in fields)
+            direction = 'DESC' if descending else 'ASC'
+            query = f"""
+                SELECT {columns}, {sort} AS _sort_value, id AS _sort_id FROM hosts
+                {f"WHERE {' AND '.join(page_where)}" if page_where else ''}
+                ORDER BY {sort_expr} {direction}, id {direction}
+            """
+            if limit is not None:
+                query += " LIMIT ?"
+                page_params.append(limit + 1)
+            rows = [dict(row) for row in conn.execute(query, page_params).fetchall()]
+
+        next_cursor = None
+        if limit is not None and len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = _encode_cursor([rows[-1]['_sort_value'], rows[-1]['_sort_id']])
+        for row in rows:
+            del row['_sort_value'], row['_sort_id']
+            if 'is_password_encrypted' in row:
+                row['is_password_encrypted'] = bool(row['is_password_encrypted'])
+            for field in HOST_LABEL_FIELDS:
+                if field in row:
+                    row[field] = json.loads(row[field])
+        return rows, total, next_cursor
+
+    @timed_query
+    def get_host_endpoints(self):
+        """获取所有主机的连接地址，不解密密码"""
+        with self.get_connection() as conn:
+            cursor = conn.execute("SELECT id, address, port FROM hosts")
+            return [dict(row) for row in cursor.fetchall()]
+
+    @timed_query
     def get_host(self, host_id):
         """获取单个主机信息"""
         with self.get_connection() as conn:
@@ -156,6 +524,7 @@ class Database:
                 return host
             return None
 
+    @timed_query
     def update_host(self, host_id, host_data):
         """更新主机信息"""
         with self.get_connection() as conn:
@@ -186,47 +555,159 @@ class Database:
                 auth_method,
                 host_id
             ))
+            self._replace_labels(conn, [host_id], host_data.get('groups'), host_data.get('tags'))
+        if host_data.get('groups') is not None:
+            self.changes.publish('host_groups', 'update')
+        self.changes.publish('hosts', 'update', [host_id])
 
+    @timed_query
     def delete_host(self, host_id):
         """删除主机"""
         with self.get_connection() as conn:
             conn.execute("DELETE FROM command_logs WHERE host_id = ?", (host_id,))
+            conn.execute("DELETE FROM host_health WHERE host_id = ?", (host_id,))
+            conn.execute("DELETE FROM host_facts WHERE host_id = ?", (host_id,))
+            conn.execute("DELETE FROM host_group_members WHERE host_id = ?", (host_id,))
+            conn.execute("DELETE FROM host_tags WHERE host_id = ?", (host_id,))
             conn.execute("DELETE FROM hosts WHERE id = ?", (host_id,))
+        self.changes.publish('command_logs', 'delete')
+        self.changes.publish('hosts', 'delete', [host_id])
 
     def log_command(self, host_id, command, output, status):
         """记录命令执行日志"""
+        self.log_commands([(host_id, command, output, status)])
+
+    @timed_query
+    def log_commands(self, entries):
+        """在一个事务中批量记录命令执行日志，输出按内容去重压缩存储
+
+        Args:
+            entries: (host_id, command, output, status) 元组列表
+        """
+        if not entries:
+            return
         with self.get_connection() as conn:
-            conn.execute("""
-                INSERT INTO command_logs (host_id, command, output, status)
-                VALUES (?, ?, ?, ?)
-            """, (host_id, command, output, status))
+            # 先取得写锁再检查输出是否已存在，避免清理线程在检查与插入日志之间删除该输出
+            conn.execute("BEGIN IMMEDIATE")
+            seen = set()
+            rows = [
+                (host_id, command, self.outputs.put(conn, output, seen), status)
+                for host_id, command, output, status in entries
+            ]
+            conn.executemany(f"""
+                INSERT INTO command_logs (host_id, command, output_hash, status, executed_at)
+                VALUES (?, ?, ?, ?, {SQL_UTC_NOW})
+            """, rows)
+            ids = self._inserted_ids(conn, 'command_logs', len(rows))
+        self.changes.publish('command_logs', 'insert', ids)
 
-    def get_command_logs(self, limit=100):
-        """获取命令执行日志"""
+    @timed_query
+    def get_command_logs(self, limit=100, since_id=None):
+        """获取命令执行日志，since_id 用于只返回该 id 之后新增的日志"""
         with self.get_connection() as conn:
-            cursor = conn.execute("""
-                SELECT cl.*, h.comment, h.address 
+            where_sql = "WHERE cl.id > ?" if since_id is not None else ""
+            params = (since_id, limit) if since_id is not None else (limit,)
+            cursor = conn.execute(f"""
+                SELECT cl.*, h.comment, h.address,
+                       co.codec AS output_codec, co.data AS output_data
                 FROM command_logs cl
                 LEFT JOIN hosts h ON cl.host_id = h.id
+                LEFT JOIN command_outputs co ON cl.output_hash = co.hash
+                {where_sql}
                 ORDER BY cl.executed_at DESC
                 LIMIT ?
-            """, (limit,))
-            return [dict(row) for row in cursor.fetchall()]
+            """, params)
+            return self.outputs.resolve_rows([dict(row) for row in cursor.fetchall()])
+
+    def _load_log_rows(self, conn, table, ids):
+        """按 id 读取待归档的完整日志行，命令日志会还原去重存储的输出"""
+        time_column = LOG_TABLES[table]
+        placeholders = ','.join('?' * len(ids))
+        if table == 'command_logs':
+            cursor = conn.execute(f"""
+                SELECT cl.*, co.codec AS output_codec, co.data AS output_data
+                FROM command_logs cl
+                LEFT JOIN command_outputs co ON cl.output_hash = co.hash
+                WHERE cl.id IN ({placeholders})
+                ORDER BY cl.executed_at
+            """, ids)
+            return self.outputs.resolve_rows([dict(row) for row in cursor.fetchall()])
+
+        cursor = conn.execute(f"""
+            SELECT * FROM {table}
+            WHERE id IN ({placeholders})
+            ORDER BY {time_column}
+        """, ids)
+        return [dict(row) for row in cursor.fetchall()]
+
+    @timed_query
+    def get_output_storage_stats(self):
+        """统计命令输出存储的去重与压缩效果"""
+        with self.get_connection() as conn:
+            logical = conn.execute("""
+                SELECT COUNT(cl.id) AS log_count,
+                       COALESCE(SUM(co.raw_size), 0) AS deduplicated_bytes,
+                       COALESCE(SUM(LENGTH(CAST(cl.output AS BLOB))), 0) AS legacy_bytes
+                FROM command_logs cl
+                LEFT JOIN command_outputs co ON cl.output_hash = co.hash
+            """).fetchone()
+            stored = conn.execute("""
+                SELECT COUNT(*) AS blob_count,
+                       COALESCE(SUM(raw_size), 0) AS raw_bytes,
+                       COALESCE(SUM(stored_size), 0) AS stored_bytes
+                FROM command_outputs
+            """).fetchone()
+            page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+            page_count = conn.execute("PRAGMA page_count").fetchone()[0]
 
+        logical_bytes = logical['deduplicated_bytes'] + logical['legacy_bytes']
+        stored_bytes = stored['stored_bytes'] + logical['legacy_bytes']
+        return {
+            'log_count': logical['log_count'],
+            'unique_outputs': stored['blob_count'],
+            'logical_bytes': logical_bytes,
+            'stored_bytes': stored_bytes,
+            'saved_bytes': logical_bytes - stored_bytes,
+            'savings_ratio': round(1 - stored_bytes / logical_bytes, 4) if logical_bytes else 0,
+            'database_bytes': page_size * page_count
+        }
+
+    @timed_query
+    def prune_orphan_outputs(self, batch_size):
+        """删除不再被任何命令日志引用的输出，返回删除的行数"""
+        with self.get_connection() as conn:
+            cursor = conn.execute("""
+                DELETE FROM command_outputs WHERE hash IN (
+                    SELECT co.hash FROM command_outputs co
+                    WHERE NOT EXISTS (
+                        SELECT 1 FROM command_logs cl WHERE cl.output_hash = co.hash
+                    )
+                    LIMIT ?
+                )
+            """, (batch_size,))
+            return cursor.rowcount
+
+    @timed_query
     def add_access_log(self, ip_address, path, status, status_code):
         """添加访问日志"""
         with self.get_connection() as conn:
-            conn.execute("""
-                INSERT INTO access_logs (ip_address, path, status, status_code)
-                VALUES (?, ?, ?, ?)
+            cursor = conn.execute(f"""
+                INSERT INTO access_logs (ip_address, path, status, status_code, access_time)
+                VALUES (?, ?, ?, ?, {SQL_UTC_NOW})
             """, (ip_address, path, status, status_code))
+        self.changes.publish('access_logs', 'insert', [cursor.lastrowid])
 
-    def get_access_logs(self, limit=100, ip_filter='', path_filter=''):
-        """获取访问日志"""
+    @timed_query
+    def get_access_logs(self, limit=100, ip_filter='', path_filter='', since_id=None):
+        """获取访问日志，since_id 用于只返回该 id 之后新增的日志"""
         with self.get_connection() as conn:
             clauses = []
             params = []
 
+            if since_id is not None:
+                clauses.append("id > ?")
+                params.append(since_id)
+
             if ip_filter:
                 clauses.append("ip_address LIKE ?")
                 params.append(f"%{ip_filter}%")
@@ -247,14 +728,566 @@ class Database:
             cursor = conn.execute(query, tuple(params))
             return [dict(row) for row in cursor.fetchall()]
 
-    def cleanup_old_logs(self):
-        """清理3天前的访问日志和命令日志（使用北京时间）"""
+    @timed_query
+    def prune_logs_batch(self, table, cutoff, batch_size, archive=None):
+        """按时间索引删除一批早于 cutoff 的日志，返回删除的行数
+
+        Args:
+            table: 日志表名，必须在 LOG_TABLES 中
+            cutoff: UTC ISO格式的截止时间
+            batch_size: 单批最多删除的行数
+            archive: 可选回调，删除前接收该批行数据(list[dict])用于归档
+        """
+        time_column = LOG_TABLES[table]
         with self.get_connection() as conn:
-            conn.execute("""
-                DELETE FROM access_logs 
-                WHERE access_time < datetime('now', '+8 hours', '-3 days')
+            rows = conn.execute(f"""
+                SELECT id FROM {table}
+                WHERE {time_column} < ?
+                ORDER BY {time_column}
+                LIMIT ?
+            """, (cutoff, batch_size)).fetchall()
+            if not rows:
+                return 0
+
+            ids = [row['id'] for row in rows]
+            if archive:
+                # 归档与删除使用同一组 id，保证归档的正是被删除的行
+                archive(self._load_log_rows(conn, table, ids))
+
+            placeholders = ','.join('?' * len(ids))
+            conn.execute(f"DELETE FROM {table} WHERE id IN ({placeholders})", ids)
+        self.changes.publish(table, 'delete', ids)
+        return len(ids)
+
+    @timed_query
+    def add_profile(self, method, path, status_code, duration_ms, phases, stats):
+        """保存一次慢请求的剖析结果"""
+        with self.get_connection() as conn:
+            cursor = conn.execute("""
+                INSERT INTO profiles (method, path, status_code, duration_ms, phases, stats)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (method, path, status_code, duration_ms, phases, stats))
+        self.changes.publish('profiles', 'insert', [cursor.lastrowid])
+        return cursor.lastrowid
+
+    @timed_query
+    def get_profiles(self, limit=50, path_filter=''):
+        """获取剖析结果列表（不含 cProfile 统计文本）"""
+        with self.get_connection() as conn:
+            params = []
+            where_sql = ""
+            if path_filter:
+                where_sql = "WHERE path LIKE ?"
+                params.append(f"%{path_filter}%")
+            params.append(limit)
+            cursor = conn.execute(f"""
+                SELECT id, method, path, status_code, duration_ms, phases,
+                       stats IS NOT NULL AS has_stats, created_at
+                FROM profiles
+                {where_sql}
+                ORDER BY id DESC
+                LIMIT ?
+            """, tuple(params))
+            return [dict(row) for row in cursor.fetchall()]
+
+    @timed_query
+    def get_profile(self, profile_id):
+        """获取单条剖析结果"""
+        with self.get_connection() as conn:
+            row = conn.execute("SELECT * FROM profiles WHERE id = ?", (profile_id,)).fetchone()
+            return dict(row) if row else None
+
+    @timed_query
+    def prune_profiles(self, keep):
+        """只保留最近 keep 条剖析结果"""
+        with self.get_connection() as conn:
+            cursor = conn.execute("""
+                DELETE FROM profiles WHERE id <= (
+                    SELECT id FROM profiles ORDER BY id DESC LIMIT 1 OFFSET ?
+                )
+            """, (keep,))
+        if cursor.rowcount:
+            self.changes.publish('profiles', 'delete')
+
+    @timed_query
+    def clear_profiles(self):
+        """清空剖析结果"""
+        with self.get_connection() as conn:
+            conn.execute("DELETE FROM profiles")
+        self.changes.publish('profiles', 'delete')
+
+    @timed_query
+    def get_host_health(self):
+        """获取所有主机的巡检状态"""
+        with self.get_connection() as conn:
+            cursor = conn.execute("SELECT * FROM host_health")
+            return [dict(row) for row in cursor.fetchall()]
+
+    @timed_query
+    def save_host_health(self, states):
+        """批量保存主机巡检状态"""
+        with self.get_connection() as conn:
+            conn.executemany("""
+                INSERT OR REPLACE INTO host_health
+                    (host_id, status, latency_ms, banner, error, ping_status, checked_at, last_seen)
+                VALUES (:host_id, :status, :latency_ms, :banner, :error, :ping_status, :checked_at, :last_seen)
+            """, states)
+        self.changes.publish('host_health', 'update', [state['host_id'] for state in states])
+
+    @timed_query
+    def get_host_facts(self, host_ids=None):
+        """获取缓存的主机 facts，返回 {host_id: {'facts': dict, 'gathered_at': str}}"""
+        query = "SELECT host_id, codec, data, gathered_at FROM host_facts"
+        params = ()
+        if host_ids is not None:
+            host_ids = list(host_ids)
+            if not host_ids:
+                return {}
+            query += f" WHERE host_id IN ({','.join('?' * len(host_ids))})"
+            params = host_ids
+        with self.get_connection() as conn:
+            rows = conn.execute(query, params).fetchall()
+        return {
+            row['host_id']: {
+                'facts': json.loads(OutputStore.decode(row['codec'], row['data'])),
+                'gathered_at': row['gathered_at']
+            }
+            for row in rows
+        }
+
+    @timed_query
+    def save_host_facts(self, facts_by_host):
+        """批量保存主机 facts，facts_by_host 为 {host_id: facts}"""
+        entries = []
+        for host_id, facts in facts_by_host.items():
+            codec, data = self.outputs.encode(json.dumps(facts, sort_keys=True))
+            entries.append((host_id, codec, data))
+        with self.get_connection() as conn:
+            conn.executemany(f"""
+                INSERT OR REPLACE INTO host_facts (host_id, codec, data, gathered_at)
+                VALUES (?, ?, ?, {SQL_UTC_NOW})
+            """, entries)
+        self.changes.publish('host_facts', 'update', list(facts_by_host))
+
+    @timed_query
+    def delete_host_facts(self, host_id):
+        """清除主机缓存的 facts"""
+        with self.get_connection() as conn:
+            conn.execute("DELETE FROM host_facts WHERE host_id = ?", (host_id,))
+        self.changes.publish('host_facts', 'delete', [host_id])
+
+    @timed_query
+    def add_playbook(self, name, content, content_hash, description=None):
+        """保存新的 playbook，作为第 1 个版本"""
+        with self.get_connection() as conn:
+            cursor = conn.execute(
+                "INSERT INTO playbooks (name, description, current_version) VALUES (?, ?, 1)",
+                (name, description)
+            )
+            conn.execute(
+                "INSERT INTO playbook_versions (playbook_id, version, content, content_hash) VALUES (?, 1, ?, ?)",
+                (cursor.lastrowid, content, content_hash)
+            )
+        self.changes.publish('playbooks', 'insert', [cursor.lastrowid])
+        return cursor.lastrowid
+
+    @timed_query
+    def list_playbooks(self):
+        """列出已保存的 playbook 及其当前版本的哈希，不读取内容"""
+        with self.get_connection() as conn:
+            cursor = conn.execute("""
+                SELECT p.id, p.name, p.description, p.current_version, v.content_hash, p.created_at, p.updated_at
+                FROM playbooks p
+                JOIN playbook_versions v ON v.playbook_id = p.id AND v.version = p.current_version
+                ORDER BY p.name COLLATE NOCASE
+            """)
+            return [dict(row) for row in cursor.fetchall()]
+
+    @timed_query
+    def get_playbook(self, playbook_id, version=None):
+        """获取 playbook 的指定版本（默认当前版本）及其内容"""
+        with self.get_connection() as conn:
+            row = conn.execute(f"""
+                SELECT p.id, p.name, p.description, p.current_version, v.version, v.content, v.content_hash,
+                       p.created_at, p.updated_at, v.created_at AS version_created_at
+                FROM playbooks p
+                JOIN playbook_versions v ON v.playbook_id = p.id AND v.version = {'?' if version else 'p.current_version'}
+                WHERE p.id = ?
+            """, (version, playbook_id) if version else (playbook_id,)).fetchone()
+            return dict(row) if row else None
+
+    @timed_query
+    def update_playbook(self, playbook_id, name=None, description=None, content=None, content_hash=None):
+        """更新 playbook；内容变化时新增一个版本，返回当前版本号，playbook 不存在时返回 None"""
+        with self.get_connection() as conn:
+            current = conn.execute("""
+                SELECT p.current_version, v.content_hash
+                FROM playbooks p
+                JOIN playbook_versions v ON v.playbook_id = p.id AND v.version = p.current_version
+                WHERE p.id = ?
+            """, (playbook_id,)).fetchone()
+            if current is None:
+                return None
+            version = current['current_version']
+            if content is not None and content_hash != current['content_hash']:
+                version = conn.execute(
+                    "SELECT MAX(version) FROM playbook_versions WHERE playbook_id = ?", (playbook_id,)
+                ).fetchone()[0] + 1
+                conn.execute(
+                    "INSERT INTO playbook_versions (playbook_id, version, content, content_hash) VALUES (?, ?, ?, ?)",
+                    (playbook_id, version, content, content_hash)
+                )
+            conn.execute(f"""
+                UPDATE playbooks
+                SET name = COALESCE(?, name), description = COALESCE(?, description),
+                    current_version = ?, updated_at = {SQL_UTC_NOW}
+                WHERE id = ?
+            """, (name, description, version, playbook_id))
+        self.changes.publish('playbooks', 'update', [playbook_id])
+        return version
+
+    @timed_query
+    def get_playbook_versions(self, playbook_id):
+        """列出 playbook 的所有版本，不读取内容"""
+        with self.get_connection() as conn:
+            cursor = conn.execute("""
+                SELECT version, content_hash, length(content) AS size, created_at
+                FROM playbook_versions WHERE playbook_id = ?
+                ORDER BY version DESC
+            """, (playbook_id,))
+            return [dict(row) for row in cursor.fetchall()]
+
+    @timed_query
+    def delete_playbook(self, playbook_id):
+        """删除 playbook 及其所有版本，返回是否存在"""
+        with self.get_connection() as conn:
+            conn.execute("DELETE FROM playbook_versions WHERE playbook_id = ?", (playbook_id,))
+            deleted = conn.execute("DELETE FROM playbooks WHERE id = ?", (playbook_id,)).rowcount
+        if deleted:
+            self.changes.publish('playbooks', 'delete', [playbook_id])
+        return bool(deleted)
+
+    @staticmethod
+    def _schedule_row(row):
+        schedule = dict(row)
+        schedule['host_ids'] = json.loads(schedule['host_ids']) if schedule['host_ids'] else None
+        schedule['enabled'] = bool(schedule['enabled'])
+        return schedule
+
+    @staticmethod
+    def _schedule_values(data):
+        values = {field: data[field] for field in SCHEDULE_FIELDS if field in data}
+        if 'host_ids' in values:
+            values['host_ids'] = json.dumps(values['host_ids']) if values['host_ids'] is not None else None
+        if 'enabled' in values:
+            values['enabled'] = int(bool(values['enabled']))
+        return values
+
+    @timed_query
+    def add_schedule(self, data):
+        """添加计划，data 为 SCHEDULE_FIELDS 中的字段，host_ids 为 None 表示所有主机"""
+        values = self._schedule_values(data)
+        with self.get_connection() as conn:
+            cursor = conn.execute(
+                f"INSERT INTO schedules ({', '.join(values)}) VALUES ({', '.join('?' * len(values))})",
+                list(values.values())
+            )
+        self.changes.publish('schedules', 'insert', [cursor.lastrowid])
+        return cursor.lastrowid
+
+    @timed_query
+    def list_schedules(self):
+        """列出所有计划及其最近一次执行的状态"""
+        with self.get_connection() as conn:
+            cursor = conn.execute("""
+                SELECT s.*, r.status AS last_status, r.scheduled_at AS last_run_at, r.duration_ms AS last_duration_ms
+                FROM schedules s
+                LEFT JOIN schedule_runs r ON r.id = (
+                    SELECT MAX(id) FROM schedule_runs WHERE schedule_id = s.id
+                )
+                ORDER BY s.name COLLATE NOCASE
             """)
+            return [self._schedule_row(row) for row in cursor.fetchall()]
+
+    @timed_query
+    def get_schedule(self, schedule_id):
+        """获取单个计划"""
+        with self.get_connection() as conn:
+            row = conn.execute("SELECT * FROM schedules WHERE id = ?", (schedule_id,)).fetchone()
+            return self._schedule_row(row) if row else None
+
+    @timed_query
+    def update_schedule(self, schedule_id, data):
+        """更新计划的部分字段，返回计划是否存在"""
+        values = self._schedule_values(data)
+        with self.get_connection() as conn:
+            assignments = ''.join(f"{field} = ?, " for field in values)
+            updated = conn.execute(
+                f"UPDATE schedules SET {assignments}updated_at = {SQL_UTC_NOW} WHERE id = ?",
+                [*values.values(), schedule_id]
+            ).rowcount
+        if updated:
+            self.changes.publish('schedules', 'update', [schedule_id])
+        return bool(updated)
+
+    @timed_query
+    def delete_schedule(self, schedule_id):
+        """删除计划及其执行历史，返回计划是否存在"""
+        with self.get_connection() as conn:
+            conn.execute("DELETE FROM schedule_runs WHERE schedule_id = ?", (schedule_id,))
+            deleted = conn.execute("DELETE FROM schedules WHERE id = ?", (schedule_id,)).rowcount
+        if deleted:
+            self.changes.publish('schedules', 'delete', [schedule_id])
+        return bool(deleted)
+
+    @timed_query
+    def get_due_schedules(self, now):
+        """获取已到期的启用计划"""
+        with self.get_connection() as conn:
+            cursor = conn.execute("""
+                SELECT * FROM schedules
+                WHERE enabled = 1 AND next_run_at IS NOT NULL AND next_run_at <= ?
+                ORDER BY next_run_at
+            """, (now,))
+            return [self._schedule_row(row) for row in cursor.fetchall()]
+
+    @timed_query
+    def get_next_schedule_time(self):
+        """获取最早的下一次触发时间"""
+        with self.get_connection() as conn:
+            return conn.execute(
+                "SELECT MIN(next_run_at) FROM schedules WHERE enabled = 1 AND next_run_at IS NOT NULL"
+            ).fetchone()[0]
+
+    @timed_query
+    def claim_schedule(self, schedule_id, expected_run_at, next_run_at):
+        """将到期计划的 next_run_at 推进到下一次，返回是否认领成功（已被其他进程认领时为 False）"""
+        with self.get_connection() as conn:
+            claimed = conn.execute("""
+                UPDATE schedules SET next_run_at = ?
+                WHERE id = ? AND enabled = 1 AND next_run_at = ?
+            """, (next_run_at, schedule_id, expected_run_at)).rowcount
+        if claimed:
+            self.changes.publish('schedules', 'update', [schedule_id])
+        return bool(claimed)
+
+    @timed_query
+    def add_schedule_run(self, schedule_id, job_id, trigger, status, scheduled_at, started_at=None, error=None,
+                         instance=None):
+        """记录一次计划执行，返回记录 id；instance 为执行该计划的调度器进程"""
+        with self.get_connection() as conn:
+            cursor = conn.execute("""
+                INSERT INTO schedule_runs (schedule_id, job_id, trigger, status, scheduled_at, started_at, error, instance)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, (schedule_id, job_id, trigger, status, scheduled_at, started_at, error, instance))
+        self.changes.publish('schedule_runs', 'insert', [cursor.lastrowid])
+        return cursor.lastrowid
+
+    @timed_query
+    def finish_schedule_run(self, run_id, status, finished_at, duration_ms, lateness_ms, summary=None, error=None):
+        """记录计划执行的结果与耗时"""
+        with self.get_connection() as conn:
             conn.execute("""
-                DELETE FROM command_logs
-                WHERE datetime(executed_at, '+8 hours') < datetime('now', '+8 hours', '-3 days')
+                UPDATE schedule_runs
+                SET status = ?, finished_at = ?, duration_ms = ?, lateness_ms = ?, summary = ?, error = ?
+                WHERE id = ?
+            """, (status, finished_at, duration_ms, lateness_ms,
+                  json.dumps(summary) if summary is not None else None, error, run_id))
+        self.changes.publish('schedule_runs', 'update', [run_id])
+
+    @timed_query
+    def get_schedule_runs(self, schedule_id, limit=50):
+        """获取计划的执行历史，最新的在前"""
+        with self.get_connection() as conn:
+            cursor = conn.execute("""
+                SELECT * FROM schedule_runs WHERE schedule_id = ?
+                ORDER BY id DESC LIMIT ?
+            """, (schedule_id, limit))
+            runs = [dict(row) for row in cursor.fetchall()]
+        for run in runs:
+            run['summary'] = json.loads(run['summary']) if run['summary'] else None
+        return runs
+
+    @timed_query
+    def prune_schedule_runs(self, schedule_id, keep):
+        """只保留计划最近 keep 条执行历史"""
+        with self.get_connection() as conn:
+            deleted = conn.execute("""
+                DELETE FROM schedule_runs
+                WHERE schedule_id = ? AND id <= (
+                    SELECT id FROM schedule_runs WHERE schedule_id = ? ORDER BY id DESC LIMIT 1 OFFSET ?
+                )
+            """, (schedule_id, schedule_id, keep)).rowcount
+        if deleted:
+            self.changes.publish('schedule_runs', 'delete')
+        return deleted
+
+    @timed_query
+    def get_running_schedule_runs(self):
+        """获取仍处于 running 状态的计划执行记录"""
+        with self.get_connection() as conn:
+            cursor = conn.execute("SELECT id, instance FROM schedule_runs WHERE status = 'running'")
+            return [dict(row) for row in cursor.fetchall()]
+
+    @timed_query
+    def interrupt_schedule_runs(self, run_ids):
+        """将指定的 running 记录标记为 interrupted，返回数量"""
+        run_ids = list(run_ids)
+        if not run_ids:
+            return 0
+        with self.get_connection() as conn:
+            count = conn.execute(f"""
+                UPDATE schedule_runs SET status = 'interrupted', finished_at = {SQL_UTC_NOW}
+                WHERE status = 'running' AND id IN ({','.join('?' * len(run_ids))})
+            """, run_ids).rowcount
+        if count:
+            self.changes.publish('schedule_runs', 'update', run_ids)
+        return count
+
+    @timed_query
+    def get_host_labels(self, host_ids=None):
+        """获取主机所属的组与标签，返回 {host_id: {'groups': [...], 'tags': [...]}}"""
+        labels = {}
+        with self.get_connection() as conn:
+            groups = conn.execute("""
+                SELECT m.host_id, g.name FROM host_group_members m
+                JOIN host_groups g ON g.id = m.group_id ORDER BY g.name
+            """).fetchall()
+            tags = conn.execute("SELECT host_id, tag FROM host_tags ORDER BY tag").fetchall()
+        wanted = set(host_ids) if host_ids is not None else None
+        for key, rows in (('groups', groups), ('tags', tags)):
+            for host_id, value in rows:
+                if wanted is None or host_id in wanted:
+                    labels.setdefault(host_id, {'groups': [], 'tags': []})[key].append(value)
+        return labels
+
+    @staticmethod
+    def _ensure_groups(conn, names):
+        """返回组名到 id 的映射，不存在的组自动创建"""
+        conn.executemany("INSERT OR IGNORE INTO host_groups (name) VALUES (?)", [(name,) for name in names])
+        if not names:
+            return {}
+        rows = conn.execute(
+            f"SELECT name, id FROM host_groups WHERE name IN ({','.join('?' * len(names))})", list(names)
+        ).fetchall()
+        return {row['name']: row['id'] for row in rows}
+
+    def _replace_labels(self, conn, host_ids, groups=None, tags=None):
+        """在当前事务中替换主机的组成员关系与标签，None 表示不修改该项"""
+        if groups is not None:
+            group_ids = self._ensure_groups(conn, sorted(set(groups)))
+            conn.executemany("DELETE FROM host_group_members WHERE host_id = ?", [(i,) for i in host_ids])
+            conn.executemany(
+                "INSERT INTO host_group_members (group_id, host_id) VALUES (?, ?)",
+                [(group_id, host_id) for host_id in host_ids for group_id in group_ids.values()]
+            )
+        if tags is not None:
+            conn.executemany("DELETE FROM host_tags WHERE host_id = ?", [(i,) for i in host_ids])
+            conn.executemany(
+                "INSERT INTO host_tags (host_id, tag) VALUES (?, ?)",
+                [(host_id, tag) for host_id in host_ids for tag in sorted(set(tags))]
+            )
+
+    @timed_query
+    def set_host_labels(self, host_ids, groups=None, tags=None):
+        """替换主机的组成员关系与标签，None 表示不修改该项"""
+        host_ids = list(host_ids)
+        with self.get_connection() as conn:
+            self._replace_labels(conn, host_ids, groups, tags)
+        if groups is not None:
+            self.changes.publish('host_groups', 'update')
+        self.changes.publish('hosts', 'update', host_ids)
+
+    @timed_query
+    def update_host_tags(self, host_ids, add=(), remove=()):
+        """批量为主机添加、移除标签"""
+        host_ids = list(host_ids)
+        with self.get_connection() as conn:
+            conn.executemany(
+                "DELETE FROM host_tags WHERE host_id = ? AND tag = ?",
+                [(host_id, tag) for host_id in host_ids for tag in remove]
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO host_tags (host_id, tag) VALUES (?, ?)",
+                [(host_id, tag) for host_id in host_ids for tag in add]
+            )
+        self.changes.publish('hosts', 'update', host_ids)
+
+    @timed_query
+    def list_tags(self):
+        """列出所有标签及使用的主机数"""
+        with self.get_connection() as conn:
+            cursor = conn.execute("SELECT tag, COUNT(*) AS host_count FROM host_tags GROUP BY tag ORDER BY tag")
+            return [dict(row) for row in cursor.fetchall()]
+
+    @timed_query
+    def add_group(self, name, description=None):
+        """添加主机组"""
+        with self.get_connection() as conn:
+            cursor = conn.execute("INSERT INTO host_groups (name, description) VALUES (?, ?)", (name, description))
+        self.changes.publish('host_groups', 'insert', [cursor.lastrowid])
+        return cursor.lastrowid
+
+    @timed_query
+    def list_groups(self):
+        """列出主机组及成员数"""
+        with self.get_connection() as conn:
+            cursor = conn.execute("""
+                SELECT g.*, (SELECT COUNT(*) FROM host_group_members m WHERE m.group_id = g.id) AS host_count
+                FROM host_groups g ORDER BY g.name
             """)
+            return [dict(row) for row in cursor.fetchall()]
+
+    @timed_query
+    def get_group(self, group_id):
+        """获取主机组及其成员主机 id"""
+        with self.get_connection() as conn:
+            row = conn.execute("SELECT * FROM host_groups WHERE id = ?", (group_id,)).fetchone()
+            if not row:
+                return None
+            group = dict(row)
+            group['host_ids'] = [r[0] for r in conn.execute(
+                "SELECT host_id FROM host_group_members WHERE group_id = ? ORDER BY host_id", (group_id,)
+            )]
+            return group
+
+    @timed_query
+    def update_group(self, group_id, name=None, description=None):
+        """修改主机组名称或描述，返回组是否存在"""
+        with self.get_connection() as conn:
+            updated = conn.execute("""
+                UPDATE host_groups SET name = COALESCE(?, name), description = COALESCE(?, description)
+                WHERE id = ?
+            """, (name, description, group_id)).rowcount
+        if updated:
+            self.changes.publish('host_groups', 'update', [group_id])
+        return bool(updated)
+
+    @timed_query
+    def delete_group(self, group_id):
+        """删除主机组（不删除主机），返回组是否存在"""
+        with self.get_connection() as conn:
+            host_ids = [r[0] for r in conn.execute(
+                "SELECT host_id FROM host_group_members WHERE group_id = ?", (group_id,)
+            )]
+            conn.execute("DELETE FROM host_group_members WHERE group_id = ?", (group_id,))
+            deleted = conn.execute("DELETE FROM host_groups WHERE id = ?", (group_id,)).rowcount
+        if deleted:
+            self.changes.publish('host_groups', 'delete', [group_id])
+            self.changes.publish('hosts', 'update', host_ids)
+        return bool(deleted)
+
+    @timed_query
+    def update_group_members(self, group_id, add=(), remove=()):
+        """为主机组添加、移除成员，只处理存在的主机"""
+        with self.get_connection() as conn:
+            conn.executemany(
+                "DELETE FROM host_group_members WHERE group_id = ? AND host_id = ?",
+                [(group_id, host_id) for host_id in remove]
+            )
+            conn.executemany("""
+                INSERT OR IGNORE INTO host_group_members (group_id, host_id)
+                SELECT ?, id FROM hosts WHERE id = ?
+            """, [(group_id, host_id) for host_id in add])
+        self.changes.publish('host_groups', 'update', [group_id])
+        self.changes.publish('hosts', 'update', list(add) + list(remove))
@@ -0,0 +1,124 @@
+import os
+import calendar
+import threading
+import time
+import logging
+from database import UTC_TIMESTAMP_FORMAT
+
+logger = logging.getLogger(__name__)
+
+
+def _age_seconds(gathered_at):
+    return time.time() - calendar.timegm(time.strptime(gathered_at, UTC_TIMESTAMP_FORMAT))
+
+
+def select_keys(facts, keys):
+    """按键名挑选 facts，支持以点号访问嵌套字段，如 ansible_default_ipv4.address"""
+    selected = {}
+    for key in keys:
+        value = facts
+        for part in key.split('.'):
+            if not isinstance(value, dict) or part not in value:
+                value = None
+                break
+            value = value[part]
+        selected[key] = value
+    return selected
+
+
+class FactCache:
+    """主机 facts 缓存
+
+    facts 通过 setup 模块批量收集并保存在 host_facts 表中，FACTS_TTL 秒内直接返回缓存；
+    过期或缺失的主机在同一次 Ansible 运行中一并收集。收集失败时保留旧缓存并标记为 stale。
+    """
+
+    def __init__(self, db, ansible):
+        self.db = db
+        self.ansible = ansible
+        self.ttl = int(os.getenv('FACTS_TTL', '3600'))
+        subset = os.getenv('FACTS_GATHER_SUBSET', '')
+        self.gather_subset = [s.strip() for s in subset.split(',') if s.strip()] or None
+        self._gather_lock = threading.Lock()
+
+    def _fresh(self, entry):
+        return entry is not None and _age_seconds(entry['gathered_at']) < self.ttl
+
+    def _gather(self, hosts, force):
+        """收集 facts 并返回 {host_id: 错误信息}；并发请求串行执行，避免重复收集同一批主机"""
+        with self._gather_lock:
+            if not force:
+                cached = self.db.get_host_facts(host['id'] for host in hosts)
+                hosts = [host for host in hosts if not self._fresh(cached.get(host['id']))]
+            if not hosts:
+                return {}
+
+            results = self.ansible.gather_facts(hosts, gather_subset=self.gather_subset)
+            gathered = {}
+            errors = {}
+            for host in hosts:
+                address = host['address']
+                if address in results['success']:
+                    gathered[host['id']] = results['success'][address]
+                elif address in results['unreachable']:
+                    errors[host['id']] = results['unreachable'][address].get('msg') or '无法连接'
+                elif address in results['failed']:
+                    errors[host['id']] = results['failed'][address].get('msg') or '收集失败'
+                else:
+                    errors[host['id']] = '未返回结果'
+            if gathered:
+                self.db.save_host_facts(gathered)
+            return errors
+
+    def _entries(self, hosts, refresh, gather):
+        cached = self.db.get_host_facts(host['id'] for host in hosts)
+        if refresh:
+            pending = list(hosts)
+        elif gather:
+            pending = [host for host in hosts if not self._fresh(cached.get(host['id']))]
+        else:
+            pending = []
+
+        errors = {}
+        if pending:
+            try:
+                errors = self._gather(pending, force=refresh)
+            except Exception as e:
+                logger.error(f"收集主机 facts 失败: {str(e)}")
+                errors = {host['id']: str(e) for host in pending}
+            cached = self.db.get_host_facts(host['id'] for host in hosts)
+
+        pending_ids = {host['id'] for host in pending}
+        entries = []
+        for host in hosts:
+            entry = cached.get(host['id'])
+            item = {
+                'host_id': host['id'],
+                'facts': entry['facts'] if entry else None,
+                'gathered_at': entry['gathered_at'] if entry else None,
+                'cached': host['id'] not in pending_ids,
+                'stale': not self._fresh(entry)
+            }
+            if host['id'] in errors:
+                item['error'] = errors[host['id']]
+            entries.append(item)
+        return entries
+
+    def get(self, host, refresh=False):
+        """获取单台主机的 facts，缓存有效时不连接主机"""
+        return self._entries([host], refresh, gather=True)[0]
+
+    def bulk(self, hosts, keys=None, refresh=False, gather=True):
+        """获取多台主机的 facts，可只返回指定键；过期主机在一次运行中收集"""
+        entries = self._entries(hosts, refresh, gather)
+        if keys:
+            for entry in entries:
+                if entry['facts'] is not None:
+                    entry['facts'] = select_keys(entry['facts'], keys)
+        return entries
+
+    def invalidate(self, host_id):
+        self.db.delete_host_facts(host_id)
+
+    def status(self):
+        return {'ttl': self.ttl, 'gather_subset': self.gather_subset}
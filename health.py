@@ -0,0 +1,216 @@
+import os
+import time
+import asyncio
+import datetime
+import threading
+import logging
+from database import UTC_TIMESTAMP_FORMAT
+
+logger = logging.getLogger(__name__)
+
+STATUS_ONLINE = 'online'
+STATUS_NO_BANNER = 'no_banner'
+STATUS_UNREACHABLE = 'unreachable'
+
+
+def _utc_now():
+    return datetime.datetime.now(datetime.timezone.utc).strftime(UTC_TIMESTAMP_FORMAT)
+
+
+class HealthMonitor:
+    """全量主机可达性巡检
+
+    后台线程按 HEALTH_SWEEP_INTERVAL 周期在 asyncio 中并发执行 TCP 连接与 SSH banner 检查，
+    并发数由 HEALTH_SWEEP_CONCURRENCY 限制；设置 HEALTH_ANSIBLE_PING=1 时对在线主机
+    额外执行一次批量 ping。结果缓存在内存中并持久化到 host_health 表。
+    """
+
+    def __init__(self, db, ansible):
+        self.db = db
+        self.ansible = ansible
+        self.interval = int(os.getenv('HEALTH_SWEEP_INTERVAL', '300'))
+        self.concurrency = int(os.getenv('HEALTH_SWEEP_CONCURRENCY', '100'))
+        self.connect_timeout = float(os.getenv('HEALTH_CONNECT_TIMEOUT', '5'))
+        self.ansible_ping = os.getenv('HEALTH_ANSIBLE_PING', '').lower() in ('1', 'true', 'yes')
+
+        self._states = {state['host_id']: state for state in db.get_host_health()}
+        self._lock = threading.Lock()
+        self._sweep_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._pending_ids = set()
+        self._pending_all = False
+        self._thread = None
+        self.last_sweep = None
+
+    def start(self):
+        """启动后台巡检线程，间隔为 0 时只响应手动触发"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._loop, name='health-sweep', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+
+    def trigger(self, host_ids=None):
+        """请求立即巡检，可限定主机"""
+        with self._lock:
+            if host_ids is None:
+                self._pending_all = True
+            else:
+                self._pending_ids |= {int(i) for i in host_ids}
+        self._wakeup.set()
+
+    def _loop(self):
+        if self.interval > 0:
+            self._run(None)
+        while not self._stop.is_set():
+            woke = self._wakeup.wait(self.interval if self.interval > 0 else None)
+            self._wakeup.clear()
+            if self._stop.is_set():
+                break
+            with self._lock:
+                # 定时触发或请求了全量巡检时检查所有主机
+                host_ids = None if not woke or self._pending_all else self._pending_ids
+                self._pending_ids = set()
+                self._pending_all = False
+            self._run(host_ids)
+
+    def _run(self, host_ids):
+        try:
+            self.sweep(host_ids)
+        except Exception as e:
+            logger.error(f"主机巡检失败: {str(e)}")
+
+    def sweep(self, host_ids=None):
+        """同步执行一次巡检并返回本次更新的状态列表"""
+        with self._sweep_lock:
+            hosts = self.db.get_host_endpoints()
+            if host_ids:
+                hosts = [h for h in hosts if h['id'] in host_ids]
+            if not hosts:
+                return []
+
+            started = time.perf_counter()
+            checks = asyncio.run(self._check_all(hosts))
+            if self.ansible_ping:
+                self._apply_ansible_ping(hosts, checks)
+
+            states = [self._merge(host['id'], check) for host, check in zip(hosts, checks)]
+            self.db.save_host_health(states)
+            self.last_sweep = {
+                'finished_at': _utc_now(),
+                'hosts': len(states),
+                'duration_ms': round((time.perf_counter() - started) * 1000, 3)
+            }
+            return states
+
+    async def _check_all(self, hosts):
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def bounded(host):
+            async with semaphore:
+                return await self._check_host(host)
+
+        return await asyncio.gather(*(bounded(host) for host in hosts))
+
+    async def _check_host(self, host):
+        started = time.perf_counter()
+        writer = None
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(host['address'], host['port']),
+                timeout=self.connect_timeout
+            )
+            latency_ms = round((time.perf_counter() - started) * 1000, 3)
+            try:
+                banner = await asyncio.wait_for(reader.readline(), timeout=self.connect_timeout)
+            except asyncio.TimeoutError:
+                banner = b''
+            banner = banner.decode('utf-8', errors='replace').strip()
+            if banner.startswith('SSH-'):
+                return {'status': STATUS_ONLINE, 'latency_ms': latency_ms, 'banner': banner, 'error': None}
+            return {'status': STATUS_NO_BANNER, 'latency_ms': latency_ms, 'banner': banner or None,
+                    'error': '未收到SSH banner'}
+        except Exception as e:
+            return {'status': STATUS_UNREACHABLE, 'latency_ms': None, 'banner': None,
+                    'error': str(e) or e.__class__.__name__}
+        finally:
+            if writer is not None:
+                writer.close()
+                try:
+                    await writer.wait_closed()
+                except Exception:
+                    pass
+
+    def _apply_ansible_ping(self, hosts, checks):
+        online_ids = {host['id'] for host, check in zip(hosts, checks) if check['status'] == STATUS_ONLINE}
+        if not online_ids:
+            return
+        online = [host for host in self.db.get_hosts() if host['id'] in online_ids]
+        try:
+            results = self.ansible.execute_ping(online, log=False)
+        except Exception as e:
+            logger.error(f"巡检 ping 失败: {str(e)}")
+            return
+        for host, check in zip(hosts, checks):
+            if check['status'] != STATUS_ONLINE:
+                continue
+            for status in ('success', 'failed', 'unreachable'):
+                if host['address'] in results[status]:
+                    check['ping_status'] = status
+
+    def _merge(self, host_id, check):
+        now = _utc_now()
+        with self._lock:
+            previous = self._states.get(host_id, {})
+            state = {
+                'host_id': host_id,
+                'status': check['status'],
+                'latency_ms': check['latency_ms'],
+                'banner': check['banner'],
+                'error': check['error'],
+                'ping_status': check.get('ping_status', previous.get('ping_status')),
+                'checked_at': now,
+                'last_seen': now if check['status'] != STATUS_UNREACHABLE else previous.get('last_seen')
+            }
+            self._states[host_id] = state
+            return state
+
+    def record_ping(self, host_id, ping_status):
+        """记录手动 ping 的结果"""
+        now = _utc_now()
+        with self._lock:
+            state = dict(self._states.get(host_id) or {
+                'host_id': host_id, 'status': None, 'latency_ms': None, 'banner': None, 'error': None,
+                'last_seen': None, 'ping_status': None
+            })
+            state['ping_status'] = ping_status
+            state['checked_at'] = now
+            if ping_status == 'success':
+                state['last_seen'] = now
+            self._states[host_id] = state
+        self.db.save_host_health([state])
+
+    def forget(self, host_id):
+        with self._lock:
+            self._states.pop(host_id, None)
+
+    def get(self, host_id):
+        with self._lock:
+            state = self._states.get(host_id)
+            return dict(state) if state else None
+
+    def snapshot(self):
+        with self._lock:
+            return {host_id: dict(state) for host_id, state in self._states.items()}
+
+    def status(self):
+        return {
+            'interval': self.interval,
+            'concurrency': self.concurrency,
+            'ansible_ping': self.ansible_ping,
+            'last_sweep': self.last_sweep
+        }
@@ -0,0 +1,184 @@
+import re
+
+# 防止超长表达式生成过深的 SQL
+MAX_TERMS = 100
+# 括号与 not 的最大嵌套层数，避免递归解析过深
+MAX_DEPTH = 50
+
+# 组名需同时是合法的 Ansible 组名
+GROUP_NAME_PATTERN = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+RESERVED_GROUPS = {'all', 'ungrouped', 'managed_hosts'}
+TAG_PATTERN = re.compile(r'^[^\s(),!&"]{1,128}$')
+
+_TOKEN = re.compile(r'\s*(?:(\()|(\))|(!)|(&)|(,)|"([^"]*)"|([^\s(),!&"]+)(?:"([^"]*)")?)')
+_WILDCARDS = re.compile(r'[*?\[]')
+
+_GROUP_SQL = ("hosts.id IN (SELECT m.host_id FROM host_group_members m "
+              "JOIN host_groups g ON g.id = m.group_id WHERE g.name {op} ?)")
+_TAG_SQL = "hosts.id IN (SELECT host_id FROM host_tags WHERE tag {op} ?)"
+
+
+class SelectorError(ValueError):
+    """无效的主机选择表达式"""
+
+
+def validate_group_name(name):
+    if not isinstance(name, str) or not GROUP_NAME_PATTERN.match(name) or name.lower() in RESERVED_GROUPS:
+        return f'无效的组名: {name}（只能包含字母、数字和下划线，不能以数字开头或使用保留名称）'
+    return None
+
+
+def validate_tags(tags):
+    if not isinstance(tags, list) or not all(isinstance(tag, str) and TAG_PATTERN.match(tag) for tag in tags):
+        return 'tags 必须是不含空白、括号、逗号、!、& 和引号的字符串列表'
+    return None
+
+
+def tag_group_name(tag):
+    """标签对应的 inventory 组名，与云 inventory 插件的 tag_ 命名方式一致"""
+    return 'tag_' + re.sub(r'[^A-Za-z0-9_]', '_', tag)
+
+
+def _tokenize(expression):
+    tokens, position = [], 0
+    expression = expression.rstrip()
+    while position < len(expression):
+        match = _TOKEN.match(expression, position)
+        if not match:
+            raise SelectorError(f'无法解析选择表达式: {expression[position:]}')
+        position = match.end()
+        lparen, rparen, bang, amp, comma, quoted, word, quoted_value = match.groups()
+        if lparen:
+            tokens.append('(')
+        elif rparen:
+            tokens.append(')')
+        elif bang:
+            tokens.append('not')
+        elif amp:
+            tokens.append('and')
+        elif comma:
+            tokens.append('or')
+        elif quoted is not None:
+            tokens.append(('word', quoted))
+        elif quoted_value is not None:
+            # key:"含空格的取值"
+            tokens.append(('word', word + quoted_value))
+        elif word.lower() in ('and', 'or', 'not'):
+            tokens.append(word.lower())
+        else:
+            tokens.append(('word', word))
+    return tokens
+
+
+class _Compiler:
+    """递归下降解析，优先级 not > and > or；相邻的项之间省略 and"""
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.position = 0
+        self.params = []
+        self.terms = 0
+        self.depth = 0
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def take(self):
+        token = self.peek()
+        self.position += 1
+        return token
+
+    def compile(self):
+        if not self.tokens:
+            raise SelectorError('选择表达式为空')
+        sql = self.parse_or()
+        if self.peek() is not None:
+            raise SelectorError(f'选择表达式中有多余的内容: {self.peek()}')
+        return sql, self.params
+
+    def parse_or(self):
+        parts = [self.parse_and()]
+        while self.peek() == 'or':
+            self.take()
+            parts.append(self.parse_and())
+        return parts[0] if len(parts) == 1 else '(' + ' OR '.join(parts) + ')'
+
+    def parse_and(self):
+        parts = [self.parse_unary()]
+        while self.peek() == 'and' or self.peek() in ('not', '(') or isinstance(self.peek(), tuple):
+            if self.peek() == 'and':
+                self.take()
+            parts.append(self.parse_unary())
+        return parts[0] if len(parts) == 1 else '(' + ' AND '.join(parts) + ')'
+
+    def parse_unary(self):
+        token = self.take()
+        if token in ('not', '('):
+            self.depth += 1
+            if self.depth > MAX_DEPTH:
+                raise SelectorError(f'选择表达式的括号与 not 最多嵌套 {MAX_DEPTH} 层')
+            try:
+                if token == 'not':
+                    return f'NOT {self.parse_unary()}'
+                sql = self.parse_or()
+                if self.take() != ')':
+                    raise SelectorError('括号不匹配')
+                return sql
+            finally:
+                self.depth -= 1
+        if isinstance(token, tuple):
+            return self.term(token[1])
+        raise SelectorError(f'选择表达式不完整: {token or "结尾"}')
+
+    def term(self, word):
+        self.terms += 1
+        if self.terms > MAX_TERMS:
+            raise SelectorError(f'选择表达式最多包含 {MAX_TERMS} 项')
+        if word in ('all', '*'):
+            return '1'
+        key, separator, value = word.partition(':')
+        if not separator:
+            # 不带前缀的名称视为组名
+            key, value = 'group', word
+        if not value:
+            raise SelectorError(f'缺少取值: {word}')
+        op = 'GLOB' if _WILDCARDS.search(value) else '='
+        if key == 'group':
+            sql = _GROUP_SQL.format(op=op)
+        elif key == 'tag':
+            sql = _TAG_SQL.format(op=op)
+        elif key == 'address':
+            sql = f'hosts.address {op} ?'
+        elif key == 'comment':
+            sql = f'hosts.comment {op} ?'
+        elif key == 'id':
+            return self.id_term(value)
+        else:
+            raise SelectorError(f'未知的选择条件: {key}（支持 group、tag、address、comment、id）')
+        self.params.append(value)
+        return sql
+
+    def id_term(self, value):
+        try:
+            if '-' in value:
+                low, high = (int(part) for part in value.split('-', 1))
+                self.params += [low, high]
+                return 'hosts.id BETWEEN ? AND ?'
+            self.params.append(int(value))
+            return 'hosts.id = ?'
+        except ValueError:
+            raise SelectorError(f'无效的 id 条件: {value}')
+
+
+def compile_selector(expression):
+    """将主机选择表达式编译为针对 hosts 表的 (SQL 条件, 参数)
+
+    条件: group:<组名>、tag:<标签>、address:<地址>、comment:<备注>、id:<id 或 a-b>、all；
+    不带前缀的名称视为组名，取值含 * ? [ 时按 GLOB 匹配。
+    组合: and（或 &、相邻省略）、or（或 ,）、not（或 !）与括号，例如
+    "group:web and tag:env=prod and not tag:canary"、"db,cache"。
+    组与标签条件均由成员表索引支持。
+    """
+    if not isinstance(expression, str):
+        raise SelectorError('selector 必须是字符串')
+    return _Compiler(_tokenize(expression)).compile()
@@ -0,0 +1,242 @@
+import os
+import time
+import select
+import socket
+import secrets
+import datetime
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from database import UTC_TIMESTAMP_FORMAT
+
+logger = logging.getLogger(__name__)
+
+STATUS_PENDING = 'pending'
+STATUS_RUNNING = 'running'
+STATUS_SUCCEEDED = 'succeeded'
+STATUS_FAILED = 'failed'
+STATUS_CANCELLED = 'cancelled'
+FINISHED_STATUSES = (STATUS_SUCCEEDED, STATUS_FAILED, STATUS_CANCELLED)
+
+
+def _utc_now():
+    return datetime.datetime.now(datetime.timezone.utc).strftime(UTC_TIMESTAMP_FORMAT)
+
+
+class JobCancelled(Exception):
+    """任务已被取消"""
+
+
+class JobFailed(Exception):
+    """任务部分失败，仍携带可供查看的结果"""
+
+    def __init__(self, message, result=None):
+        super().__init__(message)
+        self.result = result
+
+
+class Job:
+    """后台任务：记录状态、进度计数与结果，支持协作式取消"""
+
+    def __init__(self, kind, params=None, job_id=None):
+        self.id = job_id or secrets.token_hex(8)
+        self.kind = kind
+        self.params = params or {}
+        self.status = STATUS_PENDING
+        self.progress = {}
+        self.result = None
+        self.error = None
+        self.created_at = _utc_now()
+        self.started_at = None
+        self.finished_at = None
+        self._finished_monotonic = None
+        self._cancel = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    @property
+    def finished(self):
+        return self.status in FINISHED_STATUSES
+
+    def cancel(self):
+        """标记取消并执行已注册的取消回调（终止子进程、TQM 等）"""
+        with self._lock:
+            if self._cancel.is_set():
+                return
+            self._cancel.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"取消回调执行失败 {self.kind} {self.id}: {str(e)}")
+
+    def on_cancel(self, callback):
+        """注册取消回调，已取消时立即执行；返回注销函数"""
+        with self._lock:
+            if not self._cancel.is_set():
+                self._callbacks.append(callback)
+                return lambda: self._discard_callback(callback)
+        callback()
+        return lambda: None
+
+    def _discard_callback(self, callback):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def check_cancelled(self):
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+    def set_progress(self, **values):
+        with self._lock:
+            self.progress.update(values)
+
+    def add_progress(self, **counters):
+        with self._lock:
+            for key, value in counters.items():
+                self.progress[key] = self.progress.get(key, 0) + value
+
+    def start(self):
+        with self._lock:
+            self.status = STATUS_RUNNING
+            self.started_at = _utc_now()
+
+    def finish(self, status=STATUS_SUCCEEDED, result=None, error=None):
+        with self._lock:
+            self._finished_monotonic = time.monotonic()
+            self.finished_at = _utc_now()
+            self.result = result
+            self.error = error
+            self.status = status
+
+    def run(self, target):
+        """执行 target(job)，按返回或异常设置最终状态"""
+        self.start()
+        try:
+            result = target(self)
+        except JobCancelled:
+            self.finish(STATUS_CANCELLED)
+        except JobFailed as e:
+            self.finish(STATUS_FAILED, result=e.result, error=str(e))
+        except Exception as e:
+            logger.error(f"任务执行失败 {self.kind} {self.id}: {str(e)}")
+            self.finish(STATUS_FAILED, error=str(e) or e.__class__.__name__)
+        else:
+            self.finish(result=result)
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'id': self.id,
+                'kind': self.kind,
+                'status': self.status,
+                'params': self.params,
+                'progress': dict(self.progress),
+                'result': self.result,
+                'error': self.error,
+                'created_at': self.created_at,
+                'started_at': self.started_at,
+                'finished_at': self.finished_at
+            }
+
+
+class JobRegistry:
+    """进程内的后台任务登记表
+
+    submit 的任务在 JOBS_CONCURRENCY 个工作线程中执行；已结束的任务保留 JOBS_RETENTION 秒，
+    最多保留 JOBS_MAX_FINISHED 个，供客户端查询进度与结果。
+    """
+
+    def __init__(self, max_workers=None, retention=None, max_finished=None):
+        self.max_workers = max_workers or int(os.getenv('JOBS_CONCURRENCY', '4'))
+        self.retention = retention if retention is not None else int(os.getenv('JOBS_RETENTION', '3600'))
+        self.max_finished = max_finished or int(os.getenv('JOBS_MAX_FINISHED', '200'))
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='job')
+
+    def track(self, kind, params=None, job_id=None):
+        """登记一个由调用方自行执行的任务（如流式下载、同步执行），job_id 冲突时另行生成"""
+        with self._lock:
+            self._prune()
+            if job_id in self._jobs:
+                job_id = None
+            job = Job(kind, params, job_id)
+            self._jobs[job.id] = job
+        return job
+
+    def submit(self, kind, target, params=None):
+        """登记任务并在后台执行 target(job)"""
+        job = self.track(kind, params)
+        self._executor.submit(job.run, target)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self, kind=None):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return [job for job in reversed(jobs) if kind is None or job.kind == kind]
+
+    def cancel(self, job_id):
+        """请求取消任务，任务不存在时返回 None"""
+        job = self.get(job_id)
+        if job is not None and not job.finished:
+            job.cancel()
+        return job
+
+    def _prune(self):
+        now = time.monotonic()
+        finished = [job for job in self._jobs.values() if job.finished]
+        expired = {job.id for job in finished if now - job._finished_monotonic > self.retention}
+        overflow = len(finished) - len(expired) - self.max_finished
+        if overflow > 0:
+            remaining = sorted((job for job in finished if job.id not in expired), key=lambda job: job._finished_monotonic)
+            expired |= {job.id for job in remaining[:overflow]}
+        for job_id in expired:
+            del self._jobs[job_id]
+
+
+class DisconnectWatcher:
+    """轮询请求的客户端连接，对端关闭时调用 callback
+
+    依赖服务器在 environ 中提供原始套接字（werkzeug 开发服务器、gunicorn），否则不做检测。
+    请求体已读完，此时可读且读到 EOF 即表示客户端已断开。
+    """
+
+    SOCKET_KEYS = ('werkzeug.socket', 'gunicorn.socket')
+
+    def __init__(self, environ, callback, interval=1.0):
+        self.callback = callback
+        self.interval = interval
+        self.sock = next((environ[key] for key in self.SOCKET_KEYS if environ.get(key) is not None), None)
+        self._stop = threading.Event()
+        if self.sock is not None:
+            threading.Thread(target=self._loop, name='disconnect-watch', daemon=True).start()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                readable, _, _ = select.select([self.sock], [], [], 0)
+                if not readable or self.sock.recv(1, socket.MSG_PEEK):
+                    continue
+            except ValueError:
+                # TLS 套接字不支持 MSG_PEEK，放弃检测
+                return
+            except OSError:
+                pass
+            if not self._stop.is_set():
+                logger.info("客户端已断开，取消执行")
+                self.callback()
+            return
+
+    def stop(self):
+        self._stop.set()
@@ -0,0 +1,64 @@
+import os
+import json
+import logging
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # orjson 为可选依赖，未安装时使用标准库
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """更快的 JSON 序列化
+
+    JSON_ENGINE=auto（默认）时优先使用 orjson，未安装则回退到标准库；也可指定 orjson 或 json。
+    输出为紧凑的 UTF-8（不转义非 ASCII 字符、不排序键），jsonify 直接生成字节，避免额外的字符串拼接。
+    orjson 无法处理的值（如超出 64 位的整数）自动回退到标准库。
+    """
+
+    ensure_ascii = False
+    sort_keys = False
+
+    def __init__(self, app):
+        super().__init__(app)
+        engine = os.getenv('JSON_ENGINE', 'auto').lower()
+        if engine == 'orjson' and orjson is None:
+            logger.warning("JSON_ENGINE=orjson 但未安装 orjson，使用标准库")
+        self.use_orjson = orjson is not None and engine in ('auto', 'orjson')
+
+    @property
+    def engine(self):
+        return 'orjson' if self.use_orjson else 'json'
+
+    def _pretty(self):
+        return (self.compact is None and self._app.debug) or self.compact is False
+
+    def dumps_bytes(self, obj, pretty=False):
+        """序列化为 UTF-8 字节"""
+        if self.use_orjson:
+            option = orjson.OPT_NON_STR_KEYS
+            if pretty:
+                option |= orjson.OPT_INDENT_2
+            if self.sort_keys:
+                option |= orjson.OPT_SORT_KEYS
+            try:
+                return orjson.dumps(obj, default=self.default, option=option)
+            except TypeError:
+                pass
+        kwargs = {'indent': 2} if pretty else {'separators': (',', ':')}
+        return self.dumps(obj, **kwargs).encode('utf-8')
+
+    def dumps(self, obj, **kwargs):
+        kwargs.setdefault('default', self.default)
+        kwargs.setdefault('ensure_ascii', self.ensure_ascii)
+        kwargs.setdefault('sort_keys', self.sort_keys)
+        return json.dumps(obj, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            self.dumps_bytes(obj, pretty=self._pretty()) + b'\n', mimetype=self.mimetype
+        )
@@ -0,0 +1,179 @@
+import os
+import stat
+import time
+import posixpath
+import threading
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from metrics import SFTP_LISTING_CACHE_LOOKUPS, SFTP_LISTING_CACHE_ENTRIES
+
+logger = logging.getLogger(__name__)
+
+CACHE_HIT = 'hit'
+CACHE_REVALIDATED = 'revalidated'
+CACHE_MISS = 'miss'
+
+
+def _entry_dict(attr):
+    return {
+        'name': attr.filename,
+        'type': 'directory' if stat.S_ISDIR(attr.st_mode) else 'file',
+        'size': attr.st_size,
+        'mtime': attr.st_mtime
+    }
+
+
+class _Listing:
+    __slots__ = ('entries', 'dir_mtime', 'fetched_at', 'validated_at')
+
+    def __init__(self, entries, dir_mtime, now):
+        self.entries = entries
+        self.dir_mtime = dir_mtime
+        self.fetched_at = now
+        self.validated_at = now
+
+
+class ListingCache:
+    """远程目录列表缓存
+
+    SFTP_LIST_TTL 秒内直接返回缓存；超过后先 stat 目录，mtime 未变化时沿用缓存（只需一次往返），
+    但缓存最长保留 SFTP_LIST_MAX_AGE 秒，以便刷新文件大小等不影响目录 mtime 的变化。
+    本应用的写操作会主动失效相关目录。首次列出目录后在后台预取前 SFTP_LIST_PREFETCH 个子目录。
+    """
+
+    def __init__(self, pool, ttl=None, max_age=None, max_entries=None, prefetch=None):
+        self.pool = pool
+        self.ttl = ttl if ttl is not None else float(os.getenv('SFTP_LIST_TTL', '10'))
+        self.max_age = max_age if max_age is not None else float(os.getenv('SFTP_LIST_MAX_AGE', '60'))
+        self.max_entries = max_entries or int(os.getenv('SFTP_LIST_CACHE_SIZE', '2000'))
+        self.prefetch = prefetch if prefetch is not None else int(os.getenv('SFTP_LIST_PREFETCH', '8'))
+        self._listings = OrderedDict()
+        self._generations = {}
+        self._prefetching = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='sftp-prefetch')
+        self.hits = 0
+        self.revalidations = 0
+        self.misses = 0
+
+        SFTP_LISTING_CACHE_ENTRIES.set_function(lambda: self.stats()['size'])
+
+    @staticmethod
+    def _normalize(path):
+        return posixpath.normpath(path) if path else '/'
+
+    def _lookup(self, key):
+        with self._lock:
+            listing = self._listings.get(key)
+            if listing is not None:
+                self._listings.move_to_end(key)
+            return listing
+
+    def _generation(self, host_id):
+        with self._lock:
+            return self._generations.get(host_id, 0)
+
+    def _store(self, key, listing, generation):
+        with self._lock:
+            # 列目录期间发生了失效，结果可能已过期，不写入缓存
+            if self._generations.get(key[0], 0) != generation:
+                return
+            self._listings[key] = listing
+            self._listings.move_to_end(key)
+            while len(self._listings) > self.max_entries:
+                self._listings.popitem(last=False)
+
+    def _fetch(self, sftp, path):
+        dir_mtime = sftp.stat(path).st_mtime
+        entries = [_entry_dict(attr) for attr in sftp.listdir_attr(path)]
+        return _Listing(entries, dir_mtime, time.monotonic())
+
+    def list(self, host, path, refresh=False):
+        """返回 (条目列表, 缓存状态)"""
+        path = self._normalize(path)
+        key = (host['id'], path)
+        listing = None if refresh else self._lookup(key)
+        now = time.monotonic()
+
+        if listing is not None and now - listing.validated_at < self.ttl:
+            self.hits += 1
+            SFTP_LISTING_CACHE_LOOKUPS.inc(result=CACHE_HIT)
+            return listing.entries, CACHE_HIT
+
+        generation = self._generation(host['id'])
+        with self.pool.sftp(host) as sftp:
+            if listing is not None and now - listing.fetched_at < self.max_age:
+                dir_mtime = sftp.stat(path).st_mtime
+                # mtime 精度为秒，刚被修改过的目录同一秒内可能再次变化，此时重新列出
+                if dir_mtime == listing.dir_mtime and time.time() - dir_mtime > 1:
+                    listing.validated_at = now
+                    self.revalidations += 1
+                    SFTP_LISTING_CACHE_LOOKUPS.inc(result=CACHE_REVALIDATED)
+                    return listing.entries, CACHE_REVALIDATED
+            listing = self._fetch(sftp, path)
+        self.misses += 1
+        SFTP_LISTING_CACHE_LOOKUPS.inc(result=CACHE_MISS)
+        self._store(key, listing, generation)
+        self._schedule_prefetch(host, path, listing.entries)
+        return listing.entries, CACHE_MISS
+
+    def _schedule_prefetch(self, host, path, entries):
+        if self.prefetch <= 0:
+            return
+        children = []
+        for entry in entries:
+            if entry['type'] != 'directory':
+                continue
+            child = posixpath.join(path, entry['name'])
+            key = (host['id'], child)
+            with self._lock:
+                if key in self._listings or key in self._prefetching:
+                    continue
+                self._prefetching.add(key)
+            children.append(child)
+            if len(children) >= self.prefetch:
+                break
+        if children:
+            self._executor.submit(self._prefetch_children, host, children, self._generation(host['id']))
+
+    def _prefetch_children(self, host, children, generation):
+        try:
+            with self.pool.sftp(host) as sftp:
+                for child in children:
+                    try:
+                        self._store((host['id'], child), self._fetch(sftp, child), generation)
+                    except IOError:
+                        # 无权限等错误只跳过该目录
+                        continue
+        except Exception as e:
+            logger.debug("预取子目录失败: %s", str(e))
+        finally:
+            with self._lock:
+                for child in children:
+                    self._prefetching.discard((host['id'], child))
+
+    def invalidate(self, host_id, *paths, recursive=False):
+        """失效路径本身及其父目录的列表；recursive 时同时失效其下所有子目录"""
+        targets = {self._normalize(path) for path in paths if path}
+        keys = targets | {posixpath.dirname(path) for path in targets}
+        prefixes = tuple(path.rstrip('/') + '/' for path in targets) if recursive else ()
+        with self._lock:
+            self._generations[host_id] = self._generations.get(host_id, 0) + 1
+            for key in list(self._listings):
+                if key[0] == host_id and (key[1] in keys or (prefixes and key[1].startswith(prefixes))):
+                    del self._listings[key]
+
+    def invalidate_host(self, host_id):
+        with self._lock:
+            self._generations[host_id] = self._generations.get(host_id, 0) + 1
+            for key in [key for key in self._listings if key[0] == host_id]:
+                del self._listings[key]
+
+    def stats(self):
+        with self._lock:
+            size = len(self._listings)
+        return {
+            'size': size, 'max_entries': self.max_entries, 'ttl': self.ttl, 'max_age': self.max_age,
+            'hits': self.hits, 'revalidations': self.revalidations, 'misses': self.misses
+        }
@@ -0,0 +1,137 @@
+import os
+import gzip
+import json
+import time
+import datetime
+import threading
+import logging
+from database import LOG_TABLES, UTC_TIMESTAMP_FORMAT
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RETENTION_DAYS = 3
+
+
+def _env_int(name, default):
+    value = os.getenv(name)
+    if value is None or value.strip() == '':
+        return default
+    return int(value)
+
+
+class LogRetention:
+    """日志保留引擎：在后台按索引小批量清理过期日志，可选先归档为压缩文件
+
+    每张日志表的保留天数可通过环境变量 LOG_RETENTION_<TABLE>_DAYS 配置，
+    例如 LOG_RETENTION_ACCESS_LOGS_DAYS=7；设置为 0 表示该表不清理。
+    """
+
+    def __init__(self, db, retention_days=None, batch_size=None, interval=None,
+                 archive_dir=None, batch_pause=0.05):
+        self.db = db
+        self.retention_days = {
+            table: _env_int(f"LOG_RETENTION_{table.upper()}_DAYS", DEFAULT_RETENTION_DAYS)
+            for table in LOG_TABLES
+        }
+        if retention_days:
+            self.retention_days.update(retention_days)
+        self.batch_size = batch_size or _env_int('LOG_RETENTION_BATCH_SIZE', 500)
+        self.interval = interval or _env_int('LOG_RETENTION_INTERVAL', 3600)
+        self.archive_dir = archive_dir if archive_dir is not None else os.getenv('LOG_ARCHIVE_DIR', '')
+        self.batch_pause = batch_pause
+
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._run_lock = threading.Lock()
+        self._thread = None
+        self.last_run = None
+
+    def start(self):
+        """启动后台清理线程"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._loop, name='log-retention', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+
+    def trigger(self):
+        """请求立即执行一次清理（异步）"""
+        self._wakeup.set()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"日志清理失败: {str(e)}")
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+
+    def run_once(self):
+        """对所有日志表执行一轮分批清理，返回每张表删除的行数"""
+        with self._run_lock:
+            deleted = {}
+            now = datetime.datetime.now(datetime.timezone.utc)
+            for table, days in self.retention_days.items():
+                if days <= 0:
+                    continue
+                cutoff = (now - datetime.timedelta(days=days)).strftime(UTC_TIMESTAMP_FORMAT)
+                deleted[table] = self._prune_table(table, cutoff)
+            deleted['command_outputs'] = self._prune_orphan_outputs()
+
+            self.last_run = {
+                'finished_at': datetime.datetime.now(datetime.timezone.utc).strftime(UTC_TIMESTAMP_FORMAT),
+                'deleted': deleted
+            }
+            if any(deleted.values()):
+                logger.info(f"日志清理完成: {deleted}")
+            return deleted
+
+    def _prune_table(self, table, cutoff):
+        archive = self._archiver(table) if self.archive_dir else None
+        total = 0
+        while not self._stop.is_set():
+            count = self.db.prune_logs_batch(table, cutoff, self.batch_size, archive=archive)
+            total += count
+            if count < self.batch_size:
+                break
+            # 批次之间让出数据库写锁，避免阻塞请求线程
+            time.sleep(self.batch_pause)
+        return total
+
+    def _prune_orphan_outputs(self):
+        """清理命令日志删除后不再被引用的去重输出"""
+        total = 0
+        while not self._stop.is_set():
+            count = self.db.prune_orphan_outputs(self.batch_size)
+            total += count
+            if count < self.batch_size:
+                break
+            time.sleep(self.batch_pause)
+        return total
+
+    def _archiver(self, table):
+        """返回将行数据追加写入 gzip JSON Lines 归档文件的回调"""
+        os.makedirs(self.archive_dir, exist_ok=True)
+
+        def archive(rows):
+            day = datetime.datetime.now(datetime.timezone.utc).strftime('%Y%m%d')
+            path = os.path.join(self.archive_dir, f"{table}-{day}.jsonl.gz")
+            with gzip.open(path, 'at', encoding='utf-8') as f:
+                for row in rows:
+                    f.write(json.dumps(row, ensure_ascii=False, default=str))
+                    f.write('\n')
+
+        return archive
+
+    def status(self):
+        return {
+            'retention_days': self.retention_days,
+            'batch_size': self.batch_size,
+            'interval': self.interval,
+            'archive_dir': self.archive_dir or None,
+            'last_run': self.last_run
+        }
@@ -0,0 +1,164 @@
+import os
+import json
+import uuid
+import queue
+import random
+import atexit
+import logging
+import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from metrics import LOG_RECORDS_DROPPED
+
+# 高频日志通过 extra=SAMPLED 标记，只按 LOG_SAMPLE_RATE 比例输出
+SAMPLED = {'sampled': True}
+MAX_REQUEST_ID_LENGTH = 128
+_REQUEST_ID_CHARS = set('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789-_.:')
+
+_listener = None
+
+
+def request_id_from_header(value):
+    """采用客户端传入的 X-Request-ID（校验长度与字符），否则生成新的 id"""
+    if value and len(value) <= MAX_REQUEST_ID_LENGTH and set(value) <= _REQUEST_ID_CHARS:
+        return value
+    return uuid.uuid4().hex
+
+
+class RequestContextFilter(logging.Filter):
+    """在产生日志的线程中附加当前请求的 request_id、方法与路径"""
+
+    def filter(self, record):
+        from flask import g, has_request_context, request
+
+        if has_request_context():
+            record.request_id = g.get('request_id')
+            record.method = request.method
+            record.path = request.path
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """对带 sampled 标记的日志按比例采样，并记录采样率便于还原数量"""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if not getattr(record, 'sampled', False):
+            return True
+        if self.rate >= 1:
+            return True
+        if random.random() >= self.rate:
+            return False
+        record.sample_rate = self.rate
+        return True
+
+
+class MarkSampledFilter(logging.Filter):
+    """将某个 logger 的全部记录标记为可采样，用于 werkzeug 的逐请求日志"""
+
+    def filter(self, record):
+        record.sampled = True
+        return True
+
+
+class JSONFormatter(logging.Formatter):
+    """每条日志输出为一行 JSON"""
+
+    FIELDS = ('request_id', 'method', 'path', 'sample_rate')
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc)
+                  .isoformat(timespec='milliseconds').replace('+00:00', 'Z'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+            'src': f"{record.pathname}:{record.lineno}",
+            'thread': record.threadName,
+        }
+        for field in self.FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s [%(request_id)s]: %(message)s [in %(pathname)s:%(lineno)d]')
+
+    def format(self, record):
+        if not hasattr(record, 'request_id'):
+            record.request_id = '-'
+        return super().format(record)
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """请求线程只负责入队，队列已满时丢弃并计数，不阻塞请求"""
+
+    def prepare(self, record):
+        # 在产生日志的线程中合并参数与异常栈，保留结构化字段供监听线程格式化
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+
+def configure_logging(app=None):
+    """配置异步日志：请求线程写入内存队列，由后台监听线程写入滚动日志文件
+
+    环境变量:
+        LOG_FILE: 日志文件路径，默认 logs/app.log
+        LOG_FORMAT: json（默认）或 text
+        LOG_LEVEL: 日志级别，默认 INFO
+        LOG_MAX_BYTES / LOG_BACKUP_COUNT: 单个文件大小上限与保留的历史文件数
+        LOG_SAMPLE_RATE: 高频日志（逐请求日志等）的采样比例
+        LOG_QUEUE_SIZE: 内存队列容量，写满后新日志被丢弃
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    log_file = os.getenv('LOG_FILE', 'logs/app.log')
+    os.makedirs(os.path.dirname(log_file) or '.', exist_ok=True)
+    file_handler = RotatingFileHandler(
+        log_file,
+        maxBytes=int(os.getenv('LOG_MAX_BYTES', str(50 * 1024 * 1024))),
+        backupCount=int(os.getenv('LOG_BACKUP_COUNT', '10')),
+        encoding='utf-8'
+    )
+    file_handler.setFormatter(JSONFormatter() if os.getenv('LOG_FORMAT', 'json') == 'json' else TextFormatter())
+
+    queue_handler = NonBlockingQueueHandler(queue.Queue(int(os.getenv('LOG_QUEUE_SIZE', '10000'))))
+    queue_handler.addFilter(SamplingFilter(float(os.getenv('LOG_SAMPLE_RATE', '0.01'))))
+    queue_handler.addFilter(RequestContextFilter())
+
+    root_logger = logging.getLogger()
+    root_logger.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
+    root_logger.handlers.clear()
+    root_logger.addHandler(queue_handler)
+    logging.getLogger('werkzeug').addFilter(MarkSampledFilter())
+
+    if app is not None:
+        # Flask 默认向 stderr 同步输出，统一交给根 logger 的队列处理
+        from flask.logging import default_handler
+        app.logger.removeHandler(default_handler)
+
+    _listener = QueueListener(queue_handler.queue, file_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return _listener
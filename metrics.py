@@ -0,0 +1,226 @@
+import threading
+import bisect
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    metric_type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} 需要标签 {self.labelnames}，实际为 {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def collect(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.metric_type}"
+        ]
+        lines.extend(self.collect())
+        return lines
+
+
+class Counter(_Metric):
+    """单调递增计数器"""
+    metric_type = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def collect(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Gauge(_Metric):
+    """可增可减的瞬时值，也可绑定回调函数在采集时读取"""
+    metric_type = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+        self._functions = {}
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, func, **labels):
+        """采集时调用 func() 获取当前值，适用于连接池等外部状态"""
+        key = self._key(labels)
+        with self._lock:
+            self._functions[key] = func
+
+    def collect(self):
+        with self._lock:
+            values = dict(self._values)
+            functions = list(self._functions.items())
+        for key, func in functions:
+            try:
+                values[key] = func()
+            except Exception:
+                continue
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in values.items()]
+
+
+class Histogram(_Metric):
+    """按桶统计的直方图"""
+    metric_type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0, 'count': 0}
+            series['counts'][index] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    def collect(self):
+        with self._lock:
+            items = [(key, {'counts': list(s['counts']), 'sum': s['sum'], 'count': s['count']})
+                     for key, s in self._series.items()]
+        lines = []
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series['counts']):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, ('le', _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(series['sum'])}")
+            lines.append(f"{self.name}_count{labels} {series['count']}")
+        return lines
+
+
+class Registry:
+    """指标注册表，按 Prometheus 文本格式导出"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                return self._metrics[metric.name]
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    'http_request_duration_seconds', 'HTTP请求处理耗时', ('method', 'route', 'status'))
+DB_QUERY_SECONDS = REGISTRY.histogram(
+    'db_query_duration_seconds', 'SQLite操作耗时', ('operation',),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0))
+ANSIBLE_RUN_SECONDS = REGISTRY.histogram(
+    'ansible_run_duration_seconds', 'Ansible TQM运行耗时', ('kind',))
+ANSIBLE_HOST_TASK_SECONDS = REGISTRY.histogram(
+    'ansible_host_task_duration_seconds', '单个主机任务从开始到返回结果的耗时', ('status',))
+ANSIBLE_HOST_RESULTS = REGISTRY.counter(
+    'ansible_host_results_total', '主机执行结果计数', ('kind', 'status'))
+ANSIBLE_ACTIVE_RUNS = REGISTRY.gauge(
+    'ansible_active_runs', '正在执行的Ansible运行数', ('kind',))
+ANSIBLE_FORKS = REGISTRY.gauge(
+    'ansible_forks_configured', '单次运行配置的Ansible fork数')
+ANSIBLE_FORKS_IN_USE = REGISTRY.gauge(
+    'ansible_forks_in_use', '所有并发运行当前占用的fork数')
+ADMISSION_ACTIVE = REGISTRY.gauge(
+    'admission_active_requests', '已被接纳正在执行的昂贵请求数')
+ADMISSION_QUEUED = REGISTRY.gauge(
+    'admission_queued_requests', '排队等待执行的昂贵请求数')
+ADMISSION_REJECTED = REGISTRY.counter(
+    'admission_rejected_total', '因繁忙被拒绝的请求数', ('endpoint', 'reason'))
+PLAYBOOK_CACHE_LOOKUPS = REGISTRY.counter(
+    'playbook_cache_lookups_total', '已解析 playbook 缓存的查找次数', ('result',))
+SFTP_LISTING_CACHE_LOOKUPS = REGISTRY.counter(
+    'sftp_listing_cache_lookups_total', 'SFTP 目录列表缓存的查找次数', ('result',))
+SFTP_LISTING_CACHE_ENTRIES = REGISTRY.gauge(
+    'sftp_listing_cache_entries', 'SFTP 目录列表缓存中的目录数')
+SCHEDULED_RUNS = REGISTRY.counter(
+    'scheduled_runs_total', '计划执行次数', ('kind', 'status'))
+SCHEDULED_RUN_SECONDS = REGISTRY.histogram(
+    'scheduled_run_duration_seconds', '计划执行耗时', ('kind',))
+SCHEDULED_RUN_LATENESS = REGISTRY.histogram(
+    'scheduled_run_lateness_seconds', '计划执行实际开始时间相对计划时间的延迟')
+SSH_CONNECT_SECONDS = REGISTRY.histogram(
+    'ssh_connect_duration_seconds', 'SSH连接及认证握手耗时', ('outcome',))
+SSH_POOL_CONNECTIONS = REGISTRY.gauge(
+    'ssh_pool_connections', 'SSH连接池中的连接数', ('state',))
+TERMINAL_SESSIONS = REGISTRY.gauge(
+    'terminal_sessions_open', '当前打开的Web终端会话数')
+LOG_RECORDS_DROPPED = REGISTRY.counter(
+    'log_records_dropped_total', '日志队列已满而丢弃的日志条数')
@@ -0,0 +1,72 @@
+import zlib
+import hashlib
+
+CODEC_RAW = 'raw'
+CODEC_ZLIB = 'zlib'
+
+
+class OutputStore:
+    """命令输出存储：按内容哈希去重，并对输出进行压缩
+
+    相同的输出（如多台主机执行 uptime 或 ok）只保存一份，
+    command_logs 中通过 output_hash 引用。所有方法都在调用方的连接/事务内执行。
+    """
+
+    def __init__(self, compress_level=6, min_compress_size=64):
+        self.compress_level = compress_level
+        self.min_compress_size = min_compress_size
+
+    @staticmethod
+    def hash_output(output):
+        return hashlib.sha256(output.encode('utf-8')).hexdigest()
+
+    def encode(self, output):
+        """返回 (codec, data)，压缩收益不足时保留原始字节"""
+        raw = output.encode('utf-8')
+        if len(raw) >= self.min_compress_size:
+            compressed = zlib.compress(raw, self.compress_level)
+            if len(compressed) < len(raw):
+                return CODEC_ZLIB, compressed
+        return CODEC_RAW, raw
+
+    @staticmethod
+    def decode(codec, data):
+        if data is None:
+            return None
+        if codec == CODEC_ZLIB:
+            data = zlib.decompress(data)
+        return bytes(data).decode('utf-8')
+
+    def put(self, conn, output, seen=None):
+        """保存输出并返回其哈希；seen 用于在同一批写入中跳过重复内容
+
+        调用方需已在 conn 上以 BEGIN IMMEDIATE 开启事务，存在性检查与后续引用该哈希的写入处于同一写锁内。
+        """
+        if output is None:
+            return None
+        output_hash = self.hash_output(output)
+        if seen is not None and output_hash in seen:
+            return output_hash
+
+        exists = conn.execute(
+            "SELECT 1 FROM command_outputs WHERE hash = ?", (output_hash,)
+        ).fetchone()
+        if not exists:
+            codec, data = self.encode(output)
+            conn.execute("""
+                INSERT OR IGNORE INTO command_outputs (hash, codec, data, raw_size, stored_size)
+                VALUES (?, ?, ?, ?, ?)
+            """, (output_hash, codec, data, len(output.encode('utf-8')), len(data)))
+
+        if seen is not None:
+            seen.add(output_hash)
+        return output_hash
+
+    def resolve_rows(self, rows):
+        """将查询结果中的压缩输出透明还原到 output 字段"""
+        for row in rows:
+            codec = row.pop('output_codec', None)
+            data = row.pop('output_data', None)
+            if row.get('output') is None and data is not None:
+                row['output'] = self.decode(codec, data)
+        return rows
@@ -0,0 +1,103 @@
+import os
+import copy
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from ansible.errors import AnsibleParserError
+from ansible.parsing.dataloader import DataLoader
+from ansible.playbook import Playbook
+from ansible.playbook.play import Play
+from ansible.vars.manager import VariableManager
+from metrics import PLAYBOOK_CACHE_LOOKUPS
+
+
+def content_hash(content):
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def _has_imports(data):
+    return any('import_playbook' in entry for entry in data)
+
+
+def _load_from_file(content, variable_manager, loader):
+    """通过临时文件用 Playbook.load 加载，import_playbook 相对临时文件所在目录解析"""
+    fd, path = tempfile.mkstemp(prefix='ansible_playbook_', suffix='.yml')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(content)
+        return Playbook.load(path, variable_manager=variable_manager, loader=loader).get_plays()
+    finally:
+        os.remove(path)
+
+
+class PlaybookCache:
+    """按内容哈希缓存解析并校验过的 playbook 结构
+
+    YAML 只在某个内容首次出现时解析一次，并通过 Play.load 校验 play 字段、模块与参数；
+    之后的运行直接用缓存数据的副本构造 Play，不再写临时文件和重新解析。
+    包含 import_playbook 的内容被引用的文件可能变化，每次运行仍通过临时文件由 Playbook.load 加载。
+    最多缓存 PLAYBOOK_CACHE_SIZE 个不同的内容，按最近使用淘汰。
+    """
+
+    def __init__(self, max_entries=None):
+        self.max_entries = max_entries or int(os.getenv('PLAYBOOK_CACHE_SIZE', '64'))
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _parse(content):
+        loader = DataLoader()
+        data = loader.load(content, file_name='<playbook>', show_content=False)
+        if not isinstance(data, list) or not data:
+            raise AnsibleParserError('playbook 必须是由 play 组成的非空列表')
+        variable_manager = VariableManager(loader=loader)
+        for entry in data:
+            if not isinstance(entry, dict):
+                raise AnsibleParserError(f'play 必须是字典: {entry!r}')
+        if _has_imports(data):
+            _load_from_file(content, variable_manager, loader)
+            return data
+        for entry in data:
+            # Play.load 会修改传入的数据，校验使用副本
+            Play.load(copy.deepcopy(entry), variable_manager=variable_manager, loader=loader)
+        return data
+
+    def parse(self, content):
+        """返回 (内容哈希, 解析后的 play 数据)；校验失败时抛出 AnsibleError，失败结果不缓存"""
+        digest = content_hash(content)
+        with self._lock:
+            data = self._entries.get(digest)
+            if data is not None:
+                self._entries.move_to_end(digest)
+                self.hits += 1
+        if data is not None:
+            PLAYBOOK_CACHE_LOOKUPS.inc(result='hit')
+            return digest, data
+
+        PLAYBOOK_CACHE_LOOKUPS.inc(result='miss')
+        data = self._parse(content)
+        with self._lock:
+            self.misses += 1
+            self._entries[digest] = data
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return digest, data
+
+    def load_plays(self, content, variable_manager, loader):
+        """返回 (内容哈希, 绑定到本次运行 inventory 的 Play 列表)"""
+        digest, data = self.parse(content)
+        if _has_imports(data):
+            return digest, _load_from_file(content, variable_manager, loader)
+        plays = [
+            Play.load(copy.deepcopy(entry), variable_manager=variable_manager, loader=loader)
+            for entry in data
+        ]
+        return digest, plays
+
+    def stats(self):
+        with self._lock:
+            size = len(self._entries)
+        return {'size': size, 'max_entries': self.max_entries, 'hits': self.hits, 'misses': self.misses}
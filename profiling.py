@@ -0,0 +1,169 @@
+import os
+import io
+import time
+import json
+import pstats
+import cProfile
+import threading
+import logging
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROFILE_PATHS = '/api/execute,/api/upload,/api/playbook/execute'
+
+
+class RequestProfile:
+    """单次请求的剖析数据：阶段耗时以及可选的 cProfile 统计"""
+
+    def __init__(self, method, path):
+        self.method = method
+        self.path = path
+        self.started = time.perf_counter()
+        self.phases = []
+        self.profiler = None
+
+    def add_phase(self, name, started, duration):
+        self.phases.append({
+            'name': name,
+            'offset_ms': round((started - self.started) * 1000, 3),
+            'duration_ms': round(duration * 1000, 3)
+        })
+
+
+class Profiler:
+    """可选的慢请求剖析器
+
+    通过环境变量 PROFILE_ENABLED=1 开启（也可在运行时通过管理接口切换）。
+    匹配 PROFILE_PATHS 的请求会被 cProfile 采样，仅当耗时超过
+    PROFILE_THRESHOLD_MS 时才保存结果；Ansible 运行中的各阶段耗时一并记录。
+    同一时刻只允许一个请求持有 cProfile，其余请求只记录阶段耗时。
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.enabled = os.getenv('PROFILE_ENABLED', '').lower() in ('1', 'true', 'yes')
+        self.threshold_ms = int(os.getenv('PROFILE_THRESHOLD_MS', '1000'))
+        self.paths = [p.strip() for p in os.getenv('PROFILE_PATHS', DEFAULT_PROFILE_PATHS).split(',') if p.strip()]
+        self.use_cprofile = os.getenv('PROFILE_MODE', 'cprofile') == 'cprofile'
+        self.keep = int(os.getenv('PROFILE_KEEP', '200'))
+        self.top_functions = 40
+
+        self._local = threading.local()
+        self._cprofile_lock = threading.Lock()
+
+    def configure(self, enabled=None, threshold_ms=None, paths=None, use_cprofile=None):
+        if enabled is not None:
+            self.enabled = bool(enabled)
+        if threshold_ms is not None:
+            self.threshold_ms = int(threshold_ms)
+        if paths is not None:
+            self.paths = list(paths)
+        if use_cprofile is not None:
+            self.use_cprofile = bool(use_cprofile)
+
+    def settings(self):
+        return {
+            'enabled': self.enabled,
+            'threshold_ms': self.threshold_ms,
+            'paths': self.paths,
+            'use_cprofile': self.use_cprofile,
+            'keep': self.keep
+        }
+
+    def _matches(self, path):
+        return any(path == p or path.startswith(p.rstrip('/') + '/') for p in self.paths)
+
+    @property
+    def current(self):
+        return getattr(self._local, 'profile', None)
+
+    def start_request(self, method, path):
+        """在请求开始时调用，若匹配剖析条件则开始记录"""
+        if not self.enabled or not self._matches(path):
+            return
+        profile = RequestProfile(method, path)
+        if self.use_cprofile and self._cprofile_lock.acquire(blocking=False):
+            profile.profiler = cProfile.Profile()
+            try:
+                profile.profiler.enable()
+            except ValueError:
+                # 其他剖析工具已激活
+                profile.profiler = None
+                self._cprofile_lock.release()
+        self._local.profile = profile
+
+    def finish_request(self, status_code):
+        """在请求结束时调用，超过阈值则保存剖析结果"""
+        profile = self.current
+        if profile is None:
+            return
+        self._local.profile = None
+        duration_ms = (time.perf_counter() - profile.started) * 1000
+        stats_text = self._stop_profiler(profile)
+
+        if duration_ms < self.threshold_ms:
+            return
+        try:
+            self.db.add_profile(
+                profile.method,
+                profile.path,
+                status_code,
+                round(duration_ms, 3),
+                json.dumps(profile.phases),
+                stats_text
+            )
+            self.db.prune_profiles(self.keep)
+        except Exception as e:
+            logger.error(f"保存剖析结果失败: {str(e)}")
+
+    def discard(self):
+        """请求异常终止时清理未完成的剖析"""
+        profile = self.current
+        if profile is not None:
+            self._local.profile = None
+            self._stop_profiler(profile, collect=False)
+
+    def _stop_profiler(self, profile, collect=True):
+        if profile.profiler is None:
+            return None
+        profile.profiler.disable()
+        self._cprofile_lock.release()
+        if not collect:
+            return None
+        output = io.StringIO()
+        stats = pstats.Stats(profile.profiler, stream=output)
+        stats.sort_stats('cumulative').print_stats(self.top_functions)
+        return output.getvalue()
+
+    @contextmanager
+    def phase(self, name):
+        """记录一个执行阶段的耗时，未处于剖析中的请求开销可忽略"""
+        profile = self.current
+        if profile is None:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            profile.add_phase(name, started, time.perf_counter() - started)
+
+
+_profiler = None
+
+
+def init_profiler(db):
+    global _profiler
+    _profiler = Profiler(db)
+    return _profiler
+
+
+@contextmanager
+def phase(name):
+    """模块级阶段计时入口，供 AnsibleManager 等组件使用"""
+    if _profiler is None:
+        yield
+        return
+    with _profiler.phase(name):
+        yield
@@ -0,0 +1,353 @@
+import os
+import time
+import socket
+import random
+import datetime
+import threading
+import logging
+from zoneinfo import ZoneInfo
+from database import UTC_TIMESTAMP_FORMAT
+from admission import AdmissionRejected
+from jobs import JobCancelled, JobFailed, STATUS_SUCCEEDED, STATUS_FAILED, STATUS_CANCELLED
+from metrics import SCHEDULED_RUNS, SCHEDULED_RUN_SECONDS, SCHEDULED_RUN_LATENESS
+
+logger = logging.getLogger(__name__)
+
+KIND_COMMAND = 'command'
+KIND_PLAYBOOK = 'playbook'
+SCHEDULE_KINDS = (KIND_COMMAND, KIND_PLAYBOOK)
+# 计划执行占用的准入端点，与对应的 HTTP 接口共享并发上限
+ADMISSION_ENDPOINTS = {KIND_COMMAND: 'execute', KIND_PLAYBOOK: 'playbook'}
+
+STATUS_RUNNING = 'running'
+STATUS_SKIPPED = 'skipped'
+STATUS_REJECTED = 'rejected'
+STATUS_INTERRUPTED = 'interrupted'
+
+TRIGGER_SCHEDULE = 'schedule'
+TRIGGER_MANUAL = 'manual'
+
+CRON_MACROS = {
+    '@yearly': '0 0 1 1 *',
+    '@annually': '0 0 1 1 *',
+    '@monthly': '0 0 1 * *',
+    '@weekly': '0 0 * * 0',
+    '@daily': '0 0 * * *',
+    '@midnight': '0 0 * * *',
+    '@hourly': '0 * * * *',
+}
+MONTH_NAMES = ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec']
+DAY_NAMES = ['sun', 'mon', 'tue', 'wed', 'thu', 'fri', 'sat']
+
+# 查找下一次触发时间时最多向后搜索的年数，超过说明表达式永远不会触发（如 2 月 30 日）
+CRON_SEARCH_YEARS = 5
+
+
+def _utc_now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+def _format(dt):
+    return dt.astimezone(datetime.timezone.utc).strftime(UTC_TIMESTAMP_FORMAT)
+
+
+def _parse(value):
+    return datetime.datetime.strptime(value, UTC_TIMESTAMP_FORMAT).replace(tzinfo=datetime.timezone.utc)
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class CronError(ValueError):
+    """无效的 cron 表达式"""
+
+
+class CronSchedule:
+    """标准 5 字段 cron 表达式：分 时 日 月 周
+
+    支持 *、逗号列表、a-b 范围、/n 步长、月份与星期的英文缩写以及 @daily 等宏；
+    日与周同时受限时按 cron 的惯例任一匹配即触发。
+    """
+
+    FIELDS = (('minute', 0, 59, None), ('hour', 0, 23, None), ('day', 1, 31, None),
+              ('month', 1, 12, MONTH_NAMES), ('weekday', 0, 7, DAY_NAMES))
+
+    def __init__(self, expression):
+        self.expression = expression.strip()
+        fields = CRON_MACROS.get(self.expression.lower(), self.expression).split()
+        if len(fields) != 5:
+            raise CronError(f'cron 表达式需要 5 个字段: {expression}')
+        values = [self._parse_field(field, *spec) for field, spec in zip(fields, self.FIELDS)]
+        self.minutes, self.hours, self.days, self.months, weekdays = values
+        # 周日可写作 0 或 7
+        self.weekdays = {day % 7 for day in weekdays}
+        self._any_day = fields[2] == '*'
+        self._any_weekday = fields[4] == '*'
+
+    @staticmethod
+    def _value(token, low, names):
+        if names and token.lower() in names:
+            return names.index(token.lower()) + (1 if low == 1 else 0)
+        return int(token)
+
+    @classmethod
+    def _parse_field(cls, field, name, low, high, names):
+        values = set()
+        for part in field.split(','):
+            base, _, step = part.partition('/')
+            try:
+                step = int(step) if step else 1
+                if base == '*':
+                    start, end = low, high
+                elif '-' in base:
+                    start, end = (cls._value(token, low, names) for token in base.split('-', 1))
+                else:
+                    start = cls._value(base, low, names)
+                    end = high if step > 1 else start
+            except ValueError:
+                raise CronError(f'无法解析 {name} 字段: {field}')
+            if step < 1 or not low <= start <= end <= high:
+                raise CronError(f'{name} 字段超出范围 {low}-{high}: {field}')
+            values.update(range(start, end + 1, step))
+        return values
+
+    def _day_matches(self, dt):
+        day_ok = dt.day in self.days
+        weekday_ok = (dt.isoweekday() % 7) in self.weekdays
+        if self._any_day or self._any_weekday:
+            return day_ok and weekday_ok
+        return day_ok or weekday_ok
+
+    def next_after(self, dt):
+        """返回 dt 之后（不含 dt 所在分钟）第一个匹配的时间，dt 为带时区的本地时间"""
+        tz = dt.tzinfo
+        current = dt.replace(tzinfo=None, second=0, microsecond=0) + datetime.timedelta(minutes=1)
+        limit = current.year + CRON_SEARCH_YEARS
+        while current.year <= limit:
+            if current.month not in self.months:
+                current = (current.replace(day=1, hour=0, minute=0) + datetime.timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(current):
+                current = current.replace(hour=0, minute=0) + datetime.timedelta(days=1)
+            elif current.hour not in self.hours:
+                current = current.replace(minute=0) + datetime.timedelta(hours=1)
+            elif current.minute not in self.minutes:
+                current += datetime.timedelta(minutes=1)
+            else:
+                return current.replace(tzinfo=tz)
+        raise CronError(f'cron 表达式不会触发: {self.expression}')
+
+
+class Scheduler:
+    """定时执行命令与 Playbook
+
+    计划保存在 schedules 表中，后台线程在到期时通过任务登记表异步执行，并与 HTTP 请求共享准入控制
+    与 fork 预算。每次触发时间在 cron 时间之后随机延后 0~jitter 秒，避免整点同时启动；上一次执行
+    尚未结束时本次记为 skipped。每次执行的排队延迟、耗时与结果汇总记录在 schedule_runs 表中，
+    每个计划保留最近 SCHEDULER_HISTORY_LIMIT 条。cron 按 SCHEDULER_TIMEZONE 时区计算。
+
+    到期计划通过条件更新 next_run_at 认领，多个进程同时运行调度器时同一次触发只会执行一次；
+    上一次执行是否结束只在本进程内判断。每条执行记录带有所属进程（主机名:pid），启动时只把
+    本机上已退出进程遗留的 running 记录标记为 interrupted，其他存活进程的执行不受影响。
+    """
+
+    def __init__(self, db, ansible, jobs, admission):
+        self.db = db
+        self.ansible = ansible
+        self.jobs = jobs
+        self.admission = admission
+        self.enabled = os.getenv('SCHEDULER_ENABLED', '1').lower() in ('1', 'true', 'yes')
+        self.timezone = ZoneInfo(os.getenv('SCHEDULER_TIMEZONE', 'UTC'))
+        self.default_jitter = int(os.getenv('SCHEDULER_DEFAULT_JITTER', '30'))
+        self.poll_interval = float(os.getenv('SCHEDULER_POLL_INTERVAL', '30'))
+        self.history_limit = int(os.getenv('SCHEDULER_HISTORY_LIMIT', '100'))
+        self.hostname = socket.gethostname()
+        self.instance = f'{self.hostname}:{os.getpid()}'
+
+        self._running = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """启动调度线程，SCHEDULER_ENABLED=0 时只能手动触发"""
+        if not self.enabled or (self._thread and self._thread.is_alive()):
+            return
+        interrupted = self.db.interrupt_schedule_runs(self._orphaned_runs())
+        if interrupted:
+            logger.warning(f"{interrupted} 个计划执行在上次进程退出时未结束，已标记为 interrupted")
+        self._thread = threading.Thread(target=self._loop, name='scheduler', daemon=True)
+        self._thread.start()
+
+    def _orphaned_runs(self):
+        """本机已退出进程遗留的 running 记录；其他主机上的进程无法判断存活，不做处理"""
+        orphaned = []
+        for run in self.db.get_running_schedule_runs():
+            if run['instance'] is None:
+                # 升级前的记录没有进程信息
+                orphaned.append(run['id'])
+                continue
+            hostname, _, pid = run['instance'].rpartition(':')
+            if hostname == self.hostname and pid.isdigit() and not _process_alive(int(pid)):
+                orphaned.append(run['id'])
+        return orphaned
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+
+    def wake(self):
+        """计划变更后重新计算等待时间"""
+        self._wakeup.set()
+
+    def next_run_at(self, cron, jitter, after=None):
+        """按 cron 与 jitter 计算下一次触发时间（UTC 字符串）"""
+        after = (after or _utc_now()).astimezone(self.timezone)
+        next_time = CronSchedule(cron).next_after(after)
+        if jitter:
+            next_time += datetime.timedelta(seconds=random.randint(0, int(jitter)))
+        return _format(next_time)
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self._dispatch_due()
+                wait = self._seconds_until_next()
+            except Exception as e:
+                logger.error(f"计划调度失败: {str(e)}")
+                wait = self.poll_interval
+            self._wakeup.wait(wait)
+            self._wakeup.clear()
+
+    def _seconds_until_next(self):
+        next_at = self.db.get_next_schedule_time()
+        if next_at is None:
+            return self.poll_interval
+        return min(self.poll_interval, max(0.5, (_parse(next_at) - _utc_now()).total_seconds()))
+
+    def _dispatch_due(self):
+        now = _utc_now()
+        for schedule in self.db.get_due_schedules(_format(now)):
+            try:
+                next_at = self.next_run_at(schedule['cron'], schedule['jitter'], now)
+            except CronError as e:
+                logger.error(f"计划 {schedule['name']} 的 cron 表达式无效，已停用: {str(e)}")
+                self.db.update_schedule(schedule['id'], {'enabled': False, 'next_run_at': None})
+                continue
+            if not self.db.claim_schedule(schedule['id'], schedule['next_run_at'], next_at):
+                continue
+            self.launch(schedule, schedule['next_run_at'], TRIGGER_SCHEDULE)
+
+    def launch(self, schedule, scheduled_at=None, trigger=TRIGGER_MANUAL):
+        """提交一次执行，返回 Job；上一次执行未结束时记录 skipped 并返回 None"""
+        scheduled_at = scheduled_at or _format(_utc_now())
+        with self._lock:
+            skipped = schedule['id'] in self._running
+            if not skipped:
+                self._running[schedule['id']] = None
+        if skipped:
+            self.db.add_schedule_run(
+                schedule['id'], None, trigger, STATUS_SKIPPED, scheduled_at,
+                error='上一次执行尚未结束，跳过本次执行', instance=self.instance
+            )
+            self.db.prune_schedule_runs(schedule['id'], self.history_limit)
+            SCHEDULED_RUNS.inc(kind=schedule['kind'], status=STATUS_SKIPPED)
+            logger.info(f"计划 {schedule['name']} 上一次执行尚未结束，跳过本次执行")
+            return None
+
+        try:
+            job = self.jobs.submit(
+                'schedule', lambda job: self._execute(job, schedule, scheduled_at, trigger),
+                params={'schedule_id': schedule['id'], 'name': schedule['name'], 'trigger': trigger}
+            )
+        except Exception:
+            with self._lock:
+                self._running.pop(schedule['id'], None)
+            raise
+        with self._lock:
+            if schedule['id'] in self._running:
+                self._running[schedule['id']] = job.id
+        return job
+
+    def running(self):
+        """正在执行的计划，{schedule_id: job_id}"""
+        with self._lock:
+            return dict(self._running)
+
+    def _target_hosts(self, schedule):
+        if schedule['host_ids'] is None:
+            return self.db.get_hosts()
+        hosts = [self.db.get_host(host_id) for host_id in schedule['host_ids']]
+        return [host for host in hosts if host]
+
+    def _execute(self, job, schedule, scheduled_at, trigger):
+        started = _utc_now()
+        lateness = max(0.0, (started - _parse(scheduled_at)).total_seconds())
+        run_id = self.db.add_schedule_run(
+            schedule['id'], job.id, trigger, STATUS_RUNNING, scheduled_at, _format(started), instance=self.instance
+        )
+        started_monotonic = time.perf_counter()
+        status, summary, error = STATUS_FAILED, None, None
+        try:
+            target_hosts = self._target_hosts(schedule)
+            if not target_hosts:
+                raise ValueError('没有可用的目标主机')
+            job.set_progress(hosts=len(target_hosts))
+            with self.admission.admit(ADMISSION_ENDPOINTS[schedule['kind']], label=f"schedule:{schedule['name']}"):
+                if schedule['kind'] == KIND_PLAYBOOK:
+                    summary = self._run_playbook(job, schedule, target_hosts)
+                else:
+                    summary = self._run_command(job, schedule, target_hosts)
+            if job.cancelled:
+                status = STATUS_CANCELLED
+            elif not summary['failed_hosts']:
+                status = STATUS_SUCCEEDED
+            else:
+                error = f"{len(summary['failed_hosts'])} 台主机执行失败"
+        except AdmissionRejected as e:
+            status, error = STATUS_REJECTED, f'系统繁忙，未执行: {e.reason}'
+        except Exception as e:
+            error = str(e) or e.__class__.__name__
+            logger.error(f"计划 {schedule['name']} 执行失败: {error}")
+        finally:
+            duration = time.perf_counter() - started_monotonic
+            self.db.finish_schedule_run(run_id, status, _format(_utc_now()), duration * 1000, lateness * 1000,
+                                        summary, error)
+            self.db.prune_schedule_runs(schedule['id'], self.history_limit)
+            with self._lock:
+                self._running.pop(schedule['id'], None)
+            SCHEDULED_RUNS.inc(kind=schedule['kind'], status=status)
+            SCHEDULED_RUN_SECONDS.observe(duration, kind=schedule['kind'])
+            SCHEDULED_RUN_LATENESS.observe(lateness)
+
+        if status == STATUS_CANCELLED:
+            raise JobCancelled()
+        if status != STATUS_SUCCEEDED:
+            raise JobFailed(error, result=summary)
+        return summary
+
+    def _run_command(self, job, schedule, target_hosts):
+        results = self.ansible.execute_command(schedule['command'], target_hosts, cancel=job)
+        counts = {status: len(host_results) for status, host_results in results.items()}
+        failed = [host for status in ('failed', 'unreachable') for host in results.get(status, {})]
+        return {'counts': counts, 'failed_hosts': sorted(failed)}
+
+    def _run_playbook(self, job, schedule, target_hosts):
+        saved = self.db.get_playbook(schedule['playbook_id'], schedule['playbook_version'])
+        if not saved:
+            raise ValueError(f"Playbook不存在: {schedule['playbook_id']}")
+        result = self.ansible.execute_custom_playbook(saved['content'], target_hosts, cancel=job)
+        self.ansible.log_playbook_result(result, target_hosts, f"Playbook {saved['name']} v{saved['version']}")
+        counts = {status: len(hosts) for status, hosts in result['summary'].items()}
+        failed = result['summary']['failed'] + result['summary']['unreachable']
+        return {
+            'counts': counts, 'failed_hosts': sorted(failed),
+            'playbook_version': saved['version'], 'return_code': result['return_code']
+        }
@@ -0,0 +1,306 @@
+import os
+import io
+import re
+import stat
+import json
+import time
+import queue
+import hashlib
+import tarfile
+import zipfile
+import tempfile
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_FORMATS = ('tar', 'tgz', 'zip')
+_UNSAFE_NAME_CHARS = re.compile(r'[^A-Za-z0-9._-]+')
+
+
+def _file_type(mode):
+    if stat.S_ISDIR(mode):
+        return 'directory'
+    if stat.S_ISLNK(mode):
+        return 'link'
+    return 'file'
+
+
+def _error_message(e):
+    return str(e) or e.__class__.__name__
+
+
+def archive_dirname(host):
+    """归档中每台主机的目录名：id-地址，去除不安全字符"""
+    return _UNSAFE_NAME_CHARS.sub('_', f"{host['id']}-{host['address']}")
+
+
+class _StreamBuffer(io.RawIOBase):
+    """只写的缓冲区，供 tarfile/zipfile 以流模式写入后由生成器分块取出"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        if data:
+            self._chunks.append(data)
+            self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+# 归档时每次从源文件读取并写入的块大小
+ARCHIVE_CHUNK_SIZE = 65536
+
+# zip 格式无法表示 1980 年以前的时间
+_ZIP_MIN_MTIME = 315532800
+
+
+class ArchiveStream:
+    """以流模式写入 tar/tgz/zip 归档，每次写入后取出已生成的字节块"""
+
+    def __init__(self, archive_format):
+        if archive_format not in ARCHIVE_FORMATS:
+            raise ValueError(f'Unsupported archive format: {archive_format}')
+        self.format = archive_format
+        self.buffer = _StreamBuffer()
+        if archive_format == 'zip':
+            self.archive = zipfile.ZipFile(self.buffer, 'w', compression=zipfile.ZIP_DEFLATED)
+        else:
+            self.archive = tarfile.open(fileobj=self.buffer, mode='w|gz' if archive_format == 'tgz' else 'w|')
+
+    def _zip_info(self, name, mtime, mode):
+        info = zipfile.ZipInfo(name, date_time=time.localtime(max(mtime or 0, _ZIP_MIN_MTIME))[:6])
+        info.compress_type = zipfile.ZIP_DEFLATED
+        if mode is not None:
+            info.external_attr = mode << 16
+        return info
+
+    def add_file(self, name, fileobj, size, mtime, mode=None):
+        """写入一个文件，返回写入过程中产生的字节块"""
+        if self.format == 'zip':
+            info = self._zip_info(name, mtime, stat.S_IFREG | mode if mode is not None else None)
+            with self.archive.open(info, 'w') as target:
+                for chunk in iter(lambda: fileobj.read(ARCHIVE_CHUNK_SIZE), b''):
+                    target.write(chunk)
+                    data = self.buffer.drain()
+                    if data:
+                        yield data
+        else:
+            info = tarfile.TarInfo(name)
+            info.size = size
+            info.mtime = mtime or 0
+            if mode is not None:
+                info.mode = mode
+            yield from self._add_tar_file(info, fileobj)
+        data = self.buffer.drain()
+        if data:
+            yield data
+
+    def _add_tar_file(self, info, fileobj):
+        """与 TarFile.addfile 相同，但文件内容按块写入并在每块后取出，避免整个文件留在缓冲区中"""
+        archive = self.archive
+        archive._check('awx')
+        header = info.tobuf(archive.format, archive.encoding, archive.errors)
+        archive.fileobj.write(header)
+        archive.offset += len(header)
+        remaining = info.size
+        while remaining > 0:
+            chunk = fileobj.read(min(ARCHIVE_CHUNK_SIZE, remaining))
+            if not chunk:
+                raise OSError('unexpected end of data')
+            archive.fileobj.write(chunk)
+            remaining -= len(chunk)
+            data = self.buffer.drain()
+            if data:
+                yield data
+        blocks, remainder = divmod(info.size, tarfile.BLOCKSIZE)
+        if remainder > 0:
+            archive.fileobj.write(tarfile.NUL * (tarfile.BLOCKSIZE - remainder))
+            blocks += 1
+        archive.offset += blocks * tarfile.BLOCKSIZE
+        archive.members.append(info)
+
+    def add_directory(self, name, mtime, mode=None):
+        """写入目录条目，返回产生的字节"""
+        if self.format == 'zip':
+            info = self._zip_info(name.rstrip('/') + '/', mtime, stat.S_IFDIR | (mode if mode is not None else 0o755))
+            info.external_attr |= 0x10
+            self.archive.writestr(info, b'')
+        else:
+            info = tarfile.TarInfo(name)
+            info.type = tarfile.DIRTYPE
+            info.mtime = mtime or 0
+            info.mode = mode if mode is not None else 0o755
+            self.archive.addfile(info)
+        return self.buffer.drain()
+
+    def add_bytes(self, name, data):
+        if self.format == 'zip':
+            self.archive.writestr(name, data)
+        else:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = time.time()
+            self.archive.addfile(info, io.BytesIO(data))
+        return self.buffer.drain()
+
+    def close(self):
+        self.archive.close()
+        return self.buffer.drain()
+
+
+class BatchSFTP:
+    """在多台主机上并发执行同一个 SFTP 操作
+
+    使用 SSHConnectionPool 复用连接，并发数由 SFTP_BATCH_CONCURRENCY 限制；
+    单台主机的失败只记录在该主机的结果中，不影响其他主机。
+    """
+
+    def __init__(self, pool, max_workers=None, max_read_bytes=None, spool_size=None):
+        self.pool = pool
+        self.max_workers = max_workers or int(os.getenv('SFTP_BATCH_CONCURRENCY', '16'))
+        self.max_read_bytes = max_read_bytes or int(os.getenv('SFTP_BATCH_MAX_READ', str(1 << 20)))
+        self.spool_size = spool_size or 8 << 20
+
+    def _run(self, hosts, operation):
+        """对每台主机执行 operation(sftp)，返回与 hosts 顺序一致的结果列表"""
+        def run_one(host):
+            entry = {'host_id': host['id'], 'address': host['address'], 'comment': host['comment']}
+            start = time.perf_counter()
+            try:
+                with self.pool.sftp(host) as sftp:
+                    entry['result'] = operation(sftp)
+            except Exception as e:
+                entry['error'] = _error_message(e)
+            entry['duration_ms'] = round((time.perf_counter() - start) * 1000, 3)
+            return entry
+
+        if not hosts:
+            return []
+        workers = min(self.max_workers, len(hosts))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='sftp-batch') as executor:
+            return list(executor.map(run_one, hosts))
+
+    def stat(self, hosts, path):
+        def operation(sftp):
+            attr = sftp.stat(path)
+            return {
+                'type': _file_type(attr.st_mode),
+                'size': attr.st_size,
+                'mtime': attr.st_mtime,
+                'mode': oct(stat.S_IMODE(attr.st_mode))
+            }
+        return self._run(hosts, operation)
+
+    def read(self, hosts, path, max_bytes=None):
+        """读取文件内容，附带 sha256 便于跨主机比较；超过 max_bytes 的部分被截断"""
+        limit = min(max_bytes or self.max_read_bytes, self.max_read_bytes)
+
+        def operation(sftp):
+            with sftp.file(path, 'r') as f:
+                f.prefetch(limit + 1)
+                data = f.read(limit + 1)
+            truncated = len(data) > limit
+            data = data[:limit]
+            return {
+                'content': data.decode('utf-8', errors='replace'),
+                'size': len(data),
+                'truncated': truncated,
+                'sha256': hashlib.sha256(data).hexdigest()
+            }
+        return self._run(hosts, operation)
+
+    def list(self, hosts, path):
+        def operation(sftp):
+            return [{
+                'name': entry.filename,
+                'type': 'directory' if stat.S_ISDIR(entry.st_mode) else 'file',
+                'size': entry.st_size,
+                'mtime': entry.st_mtime
+            } for entry in sftp.listdir_attr(path)]
+        return self._run(hosts, operation)
+
+    def _fetch(self, host, path):
+        """将远程文件下载到临时文件，返回 (文件对象, 大小, mtime)"""
+        spool = tempfile.SpooledTemporaryFile(max_size=self.spool_size)
+        try:
+            with self.pool.sftp(host) as sftp:
+                attr = sftp.stat(path)
+                if stat.S_ISDIR(attr.st_mode):
+                    raise IsADirectoryError('Cannot download a directory')
+                sftp.getfo(path, spool)
+            size = spool.tell()
+            spool.seek(0)
+            return spool, size, attr.st_mtime
+        except Exception:
+            spool.close()
+            raise
+
+    def download_archive(self, hosts, path, archive_format='tar'):
+        """并发下载各主机上的同一文件，按完成顺序流式写入归档
+
+        归档内文件为 <id-地址>/<文件名>，失败的主机记录在归档末尾的 errors.json 中。
+        返回字节块生成器。
+        """
+        if archive_format not in ARCHIVE_FORMATS:
+            raise ValueError(f'Unsupported archive format: {archive_format}')
+        basename = os.path.basename(path.rstrip('/')) or 'file'
+        completed = queue.Queue()
+        cancelled = threading.Event()
+
+        def fetch(host):
+            if cancelled.is_set():
+                return
+            try:
+                completed.put((host, self._fetch(host, path), None))
+            except Exception as e:
+                completed.put((host, None, _error_message(e)))
+
+        def generate():
+            archive = ArchiveStream(archive_format)
+            executor = ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(hosts))),
+                                          thread_name_prefix='sftp-archive')
+            for host in hosts:
+                executor.submit(fetch, host)
+
+            errors = {}
+            try:
+                for _ in hosts:
+                    host, fetched, error = completed.get()
+                    if error is not None:
+                        errors[host['id']] = {'address': host['address'], 'error': error}
+                        continue
+                    spool, size, mtime = fetched
+                    with spool:
+                        yield from archive.add_file(f"{archive_dirname(host)}/{basename}", spool, size, mtime)
+
+                summary = json.dumps({'path': path, 'errors': errors}, ensure_ascii=False, indent=2).encode('utf-8')
+                yield archive.add_bytes('errors.json', summary)
+                yield archive.close()
+            finally:
+                # 客户端中途断开时停止尚未开始的下载，并清理已下载的临时文件
+                cancelled.set()
+                executor.shutdown(wait=False, cancel_futures=True)
+                while True:
+                    try:
+                        _, fetched, _ = completed.get_nowait()
+                    except queue.Empty:
+                        break
+                    if fetched:
+                        fetched[0].close()
+
+        return generate()
@@ -0,0 +1,432 @@
+import os
+import json
+import stat
+import queue
+import posixpath
+import tempfile
+import threading
+import logging
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from jobs import JobCancelled, JobFailed, STATUS_CANCELLED, STATUS_FAILED
+from sftp_batch import ArchiveStream, _file_type, _error_message
+
+logger = logging.getLogger(__name__)
+
+# 任务结果中最多保留的失败条目数
+MAX_REPORTED_ERRORS = 100
+
+
+class TreeError(Exception):
+    """目录树操作的参数或前置条件错误"""
+
+
+class TreeEntry:
+    __slots__ = ('path', 'attr', 'depth')
+
+    def __init__(self, path, attr, depth):
+        self.path = path
+        self.attr = attr
+        self.depth = depth
+
+    @property
+    def is_dir(self):
+        return stat.S_ISDIR(self.attr.st_mode)
+
+    @property
+    def is_link(self):
+        return stat.S_ISLNK(self.attr.st_mode)
+
+    def to_dict(self):
+        return {
+            'path': self.path,
+            'type': _file_type(self.attr.st_mode),
+            'size': self.attr.st_size,
+            'mtime': self.attr.st_mtime,
+            'mode': oct(stat.S_IMODE(self.attr.st_mode)),
+            'depth': self.depth
+        }
+
+
+def normalize_path(path):
+    path = posixpath.normpath(path or '')
+    if not path.startswith('/'):
+        raise TreeError('Path must be absolute')
+    return path
+
+
+def delete_path(path):
+    path = normalize_path(path)
+    if path == '/':
+        raise TreeError('Refusing to delete the root directory')
+    return path
+
+
+def copy_paths(source, destination):
+    source, destination = normalize_path(source), normalize_path(destination)
+    if destination == source or destination.startswith(source.rstrip('/') + '/'):
+        raise TreeError('Destination must not be inside the source')
+    return source, destination
+
+
+class _Channels:
+    """同一条池化 SSH 连接上的多个 SFTP 通道，按需借出给工作线程"""
+
+    def __init__(self, clients):
+        self.clients = clients
+        self._free = queue.Queue()
+        for client in clients:
+            self._free.put(client)
+
+    def __len__(self):
+        return len(self.clients)
+
+    @contextmanager
+    def borrow(self):
+        client = self._free.get()
+        try:
+            yield client
+        finally:
+            self._free.put(client)
+
+    @property
+    def primary(self):
+        return self.clients[0]
+
+
+class SFTPTree:
+    """单台主机上的递归目录操作：遍历、删除、复制与打包下载
+
+    每个操作只借用一条池化 SSH 连接，在其上打开 SFTP_TREE_CHANNELS 个 SFTP 通道，
+    目录遍历与文件处理分布到各通道并行执行；文件读取使用预取、写入使用流水线模式，
+    避免逐块等待往返。进度写入 Job，可随时取消。
+    """
+
+    def __init__(self, pool, channels=None, max_entries=None, spool_size=None):
+        self.pool = pool
+        self.channels = channels or int(os.getenv('SFTP_TREE_CHANNELS', '4'))
+        self.max_entries = max_entries or int(os.getenv('SFTP_TREE_MAX_ENTRIES', '100000'))
+        self.spool_size = spool_size or 8 << 20
+
+    @contextmanager
+    def _open(self, host):
+        with self.pool.connection(host) as client:
+            clients = [client.open_sftp()]
+            try:
+                for _ in range(self.channels - 1):
+                    try:
+                        clients.append(client.open_sftp())
+                    except Exception as e:
+                        # 服务器限制了单连接会话数（如 OpenSSH MaxSessions）时使用已打开的通道
+                        logger.debug("打开额外SFTP通道失败: %s", str(e))
+                        break
+                yield _Channels(clients)
+            finally:
+                for sftp in clients:
+                    sftp.close()
+
+    def _walk(self, channels, root, job=None, max_depth=None, limit=None):
+        """并行遍历 root 下的目录树（不跟随符号链接）
+
+        返回 (根条目, 子条目列表, 失败列表, 是否截断)，子条目按发现顺序排列。
+        """
+        root_attr = channels.primary.lstat(root)
+        root_entry = TreeEntry(root, root_attr, 0)
+        entries, errors = [], []
+        truncated = False
+        if not root_entry.is_dir or max_depth == 0:
+            return root_entry, entries, errors, truncated
+
+        def listdir(path):
+            with channels.borrow() as sftp:
+                return sftp.listdir_attr(path)
+
+        with ThreadPoolExecutor(max_workers=len(channels), thread_name_prefix='sftp-walk') as executor:
+            futures = {executor.submit(listdir, root): (root, 0)}
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    path, depth = futures.pop(future)
+                    try:
+                        attrs = future.result()
+                    except Exception as e:
+                        errors.append({'path': path, 'error': _error_message(e)})
+                        continue
+                    files = size = 0
+                    for attr in attrs:
+                        entry = TreeEntry(posixpath.join(path, attr.filename), attr, depth + 1)
+                        entries.append(entry)
+                        if entry.is_dir:
+                            if (max_depth is None or entry.depth < max_depth) and not truncated:
+                                futures[executor.submit(listdir, entry.path)] = (entry.path, entry.depth)
+                        else:
+                            files += 1
+                            if stat.S_ISREG(attr.st_mode):
+                                size += attr.st_size or 0
+                    if job is not None:
+                        job.add_progress(dirs_scanned=1, files_found=files, bytes_found=size)
+                    if limit is not None and len(entries) >= limit:
+                        truncated = True
+                if job is not None and job.cancelled:
+                    for future in futures:
+                        future.cancel()
+                    raise JobCancelled()
+                if truncated:
+                    for future in futures:
+                        future.cancel()
+                    break
+        if truncated:
+            del entries[limit:]
+        return root_entry, entries, errors, truncated
+
+    @staticmethod
+    def _totals(entries):
+        return {
+            'files': sum(1 for entry in entries if not entry.is_dir),
+            'directories': sum(1 for entry in entries if entry.is_dir),
+            'bytes': sum(entry.attr.st_size or 0 for entry in entries if stat.S_ISREG(entry.attr.st_mode))
+        }
+
+    def _parallel(self, channels, func, items, job, errors):
+        """在各通道上并行执行 func(sftp, item)，失败记入 errors，返回成功数量"""
+        def run(item):
+            job.check_cancelled()
+            with channels.borrow() as sftp:
+                func(sftp, item)
+
+        succeeded = 0
+        with ThreadPoolExecutor(max_workers=len(channels), thread_name_prefix='sftp-tree') as executor:
+            futures = {executor.submit(run, item): item for item in items}
+            try:
+                for future in futures:
+                    try:
+                        future.result()
+                        succeeded += 1
+                    except JobCancelled:
+                        raise
+                    except Exception as e:
+                        errors.append({'path': futures[future].path, 'error': _error_message(e)})
+                        job.add_progress(errors=1)
+            except JobCancelled:
+                for future in futures:
+                    future.cancel()
+                raise
+        return succeeded
+
+    @staticmethod
+    def _by_depth(entries, deepest_first=False):
+        levels = {}
+        for entry in entries:
+            levels.setdefault(entry.depth, []).append(entry)
+        return [levels[depth] for depth in sorted(levels, reverse=deepest_first)]
+
+    @staticmethod
+    def _result(totals, errors):
+        return {'totals': totals, 'errors': errors[:MAX_REPORTED_ERRORS], 'error_count': len(errors)}
+
+    def _finish(self, totals, errors):
+        result = self._result(totals, errors)
+        if errors:
+            # 部分条目失败时任务标记为失败，同时保留结果供客户端查看
+            raise JobFailed(f'{len(errors)} 个条目处理失败', result)
+        return result
+
+    def list(self, host, path, max_depth=None):
+        """递归列出目录，条目数超过 SFTP_TREE_MAX_ENTRIES 时截断"""
+        path = normalize_path(path)
+        with self._open(host) as channels:
+            root, entries, errors, truncated = self._walk(channels, path, max_depth=max_depth, limit=self.max_entries)
+        return {
+            'path': path,
+            'type': _file_type(root.attr.st_mode),
+            'entries': [entry.to_dict() for entry in entries],
+            'totals': self._totals(entries),
+            'truncated': truncated,
+            'errors': errors,
+            'channels': self.channels
+        }
+
+    def delete(self, host, path, job):
+        """递归删除：先并行删除文件与链接，再由深到浅删除目录"""
+        path = delete_path(path)
+        with self._open(host) as channels:
+            job.set_progress(phase='scanning')
+            root, entries, errors, _ = self._walk(channels, path, job)
+            tree = [root] + entries
+            totals = self._totals(tree)
+            job.set_progress(phase='deleting', total_files=totals['files'], total_directories=totals['directories'],
+                             deleted_files=0, deleted_directories=0)
+
+            def remove(sftp, entry):
+                sftp.remove(entry.path)
+                job.add_progress(deleted_files=1)
+
+            def rmdir(sftp, entry):
+                sftp.rmdir(entry.path)
+                job.add_progress(deleted_directories=1)
+
+            self._parallel(channels, remove, [entry for entry in tree if not entry.is_dir], job, errors)
+            for level in self._by_depth([entry for entry in tree if entry.is_dir], deepest_first=True):
+                self._parallel(channels, rmdir, level, job, errors)
+        job.set_progress(phase='done')
+        return self._finish(totals, errors)
+
+    def copy(self, host, source, destination, job):
+        """在同一主机内递归复制，保留权限位与符号链接；目标路径必须不存在"""
+        source, destination = copy_paths(source, destination)
+        with self._open(host) as channels:
+            try:
+                channels.primary.lstat(destination)
+                raise TreeError('Destination already exists')
+            except IOError:
+                pass
+
+            job.set_progress(phase='scanning')
+            root, entries, errors, _ = self._walk(channels, source, job)
+            tree = [root] + entries
+            totals = self._totals(tree)
+            job.set_progress(phase='copying', total_files=totals['files'], total_directories=totals['directories'],
+                             total_bytes=totals['bytes'], copied_files=0, copied_directories=0, copied_bytes=0)
+
+            def target(entry):
+                return destination + entry.path[len(source):] if entry is not root else destination
+
+            def mkdir(sftp, entry):
+                # mkdir 的权限受远端 umask 影响，创建后显式设置
+                sftp.mkdir(target(entry))
+                sftp.chmod(target(entry), stat.S_IMODE(entry.attr.st_mode))
+                job.add_progress(copied_directories=1)
+
+            def copy_file(sftp, entry):
+                dest = target(entry)
+                if entry.is_link:
+                    sftp.symlink(sftp.readlink(entry.path), dest)
+                else:
+                    with sftp.open(entry.path, 'rb') as src, sftp.open(dest, 'wb') as dst:
+                        src.prefetch(entry.attr.st_size)
+                        dst.set_pipelined(True)
+                        for chunk in iter(lambda: src.read(32768), b''):
+                            dst.write(chunk)
+                            job.add_progress(copied_bytes=len(chunk))
+                    sftp.chmod(dest, stat.S_IMODE(entry.attr.st_mode))
+                job.add_progress(copied_files=1)
+
+            # 目录由浅到深创建，保证父目录先于子目录存在
+            for level in self._by_depth([entry for entry in tree if entry.is_dir]):
+                self._parallel(channels, mkdir, level, job, errors)
+            self._parallel(channels, copy_file, [entry for entry in tree if not entry.is_dir], job, errors)
+        job.set_progress(phase='done')
+        return self._finish(totals, errors)
+
+    def download_archive(self, host, path, archive_format, job):
+        """将目录树打包为 tar/tgz/zip 流式返回
+
+        文件在各通道上并行下载到临时文件，按完成顺序写入归档；读取失败的条目记录在
+        归档末尾的 errors.json 中。返回字节块生成器，客户端断开时任务标记为取消。
+        """
+        path = normalize_path(path)
+        archive = ArchiveStream(archive_format)
+        base = posixpath.basename(path) or 'root'
+        # 同时在途的临时文件数量上限，避免客户端接收慢时大量文件堆积
+        in_flight = threading.BoundedSemaphore(self.channels * 2)
+        stop = threading.Event()
+
+        def fetch(channels, entry):
+            while not in_flight.acquire(timeout=0.5):
+                if stop.is_set():
+                    raise JobCancelled()
+            spool = tempfile.SpooledTemporaryFile(max_size=self.spool_size)
+            try:
+                with channels.borrow() as sftp:
+                    with sftp.open(entry.path, 'rb') as f:
+                        f.prefetch(entry.attr.st_size)
+                        for chunk in iter(lambda: f.read(65536), b''):
+                            if stop.is_set():
+                                raise JobCancelled()
+                            spool.write(chunk)
+                size = spool.tell()
+                spool.seek(0)
+                return spool, size
+            except BaseException:
+                spool.close()
+                in_flight.release()
+                raise
+
+        def name_of(entry):
+            return posixpath.join(base, entry.path[len(path):].lstrip('/')) if entry.path != path else base
+
+        def generate():
+            job.start()
+            status, error = None, None
+            files, errors = [], []
+            try:
+                with self._open(host) as channels:
+                    job.set_progress(phase='scanning')
+                    root, entries, errors, _ = self._walk(channels, path, job)
+                    if root.is_dir:
+                        directories = [root] + [entry for entry in entries if entry.is_dir]
+                        files = [entry for entry in entries if stat.S_ISREG(entry.attr.st_mode)]
+                    else:
+                        directories, files = [], [root]
+                    totals = self._totals(files)
+                    job.set_progress(phase='downloading', total_files=totals['files'], total_bytes=totals['bytes'],
+                                     downloaded_files=0, downloaded_bytes=0)
+
+                    for entry in directories:
+                        data = archive.add_directory(name_of(entry), entry.attr.st_mtime,
+                                                     stat.S_IMODE(entry.attr.st_mode))
+                        if data:
+                            yield data
+
+                    executor = ThreadPoolExecutor(max_workers=len(channels), thread_name_prefix='sftp-archive')
+                    futures = {executor.submit(fetch, channels, entry): entry for entry in files}
+                    try:
+                        pending = set(futures)
+                        while pending:
+                            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                            for future in done:
+                                entry = futures[future]
+                                try:
+                                    spool, size = future.result()
+                                except Exception as e:
+                                    errors.append({'path': entry.path, 'error': _error_message(e)})
+                                    job.add_progress(errors=1)
+                                    continue
+                                try:
+                                    with spool:
+                                        yield from archive.add_file(name_of(entry), spool, size, entry.attr.st_mtime,
+                                                                    stat.S_IMODE(entry.attr.st_mode))
+                                finally:
+                                    in_flight.release()
+                                job.add_progress(downloaded_files=1, downloaded_bytes=size)
+                            job.check_cancelled()
+                    finally:
+                        stop.set()
+                        executor.shutdown(wait=True, cancel_futures=True)
+                        for future, entry in futures.items():
+                            if future.done() and not future.cancelled() and future.exception() is None:
+                                future.result()[0].close()
+
+                if errors:
+                    summary = json.dumps({'path': path, 'errors': errors}, ensure_ascii=False, indent=2)
+                    yield archive.add_bytes(posixpath.join(base, 'errors.json') if root.is_dir else 'errors.json',
+                                            summary.encode('utf-8'))
+                yield archive.close()
+                job.set_progress(phase='done')
+                if errors:
+                    status, error = STATUS_FAILED, f'{len(errors)} 个条目处理失败'
+            except (JobCancelled, GeneratorExit):
+                status = STATUS_CANCELLED
+                raise
+            except Exception as e:
+                logger.error(f"打包下载失败 {path}: {str(e)}")
+                status, error = STATUS_FAILED, _error_message(e)
+                raise
+            finally:
+                result = self._result(self._totals(files), errors)
+                if status is None:
+                    job.finish(result=result)
+                else:
+                    job.finish(status, result=result, error=error)
+
+        return generate()
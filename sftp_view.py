@@ -0,0 +1,194 @@
+import os
+import time
+import codecs
+import logging
+
+logger = logging.getLogger(__name__)
+
+BLOCK_SIZE = 65536
+
+
+def utf8_safe_length(data):
+    """去掉末尾不完整的 UTF-8 多字节字符后的长度，避免窗口边界把字符截成两半"""
+    for back in range(1, min(4, len(data)) + 1):
+        byte = data[-back]
+        if byte & 0xC0 == 0x80:
+            continue
+        if byte < 0x80:
+            return len(data)
+        need = 2 if byte & 0xE0 == 0xC0 else 3 if byte & 0xF0 == 0xE0 else 4 if byte & 0xF8 == 0xF0 else 1
+        return len(data) - back if need > back else len(data)
+    return len(data)
+
+
+def _decode(data):
+    return data.decode('utf-8', errors='replace')
+
+
+class FileViewer:
+    """大文件的分段读取：按字节或按行返回窗口，以及从末尾反向读取最后 N 行
+
+    单次返回的数据量不超过 SFTP_VIEW_MAX_BYTES，所有读取都只在远端定位后读取所需范围，
+    读取范围内的请求以预取方式并发发出。
+    """
+
+    def __init__(self, max_bytes=None, max_lines=None):
+        self.max_bytes = max_bytes or int(os.getenv('SFTP_VIEW_MAX_BYTES', str(1 << 20)))
+        self.max_lines = max_lines or int(os.getenv('SFTP_VIEW_MAX_LINES', '10000'))
+
+    def _read(self, f, offset, length):
+        if length <= 0:
+            return b''
+        return b''.join(f.readv([(offset, length)]))
+
+    def _window(self, data, offset, size, lines=None):
+        result = {
+            'content': _decode(data),
+            'offset': offset,
+            'end': offset + len(data),
+            'size': size,
+            'eof': offset + len(data) >= size
+        }
+        if lines is not None:
+            result['lines'] = lines
+        return result
+
+    def read_bytes(self, f, size, offset, length=None):
+        """读取 [offset, offset+length) 的字节窗口，offset 为负数时从文件末尾倒数"""
+        if offset < 0:
+            offset = max(0, size + offset)
+        offset = min(offset, size)
+        length = min(length or self.max_bytes, self.max_bytes, size - offset)
+        data = self._read(f, offset, length)
+        if offset + len(data) < size:
+            data = data[:utf8_safe_length(data)]
+        return self._window(data, offset, size)
+
+    def read_lines(self, f, size, offset, count):
+        """从字节偏移 offset 开始读取 count 行，end 可作为下一页的 offset"""
+        count = min(count, self.max_lines)
+        offset = min(max(offset, 0), size)
+        chunks, found, position = [], 0, offset
+        limit = min(size, offset + self.max_bytes)
+        while position < limit and found < count:
+            chunk = self._read(f, position, min(BLOCK_SIZE, limit - position))
+            if not chunk:
+                break
+            index = -1
+            while found < count:
+                index = chunk.find(b'\n', index + 1)
+                if index < 0:
+                    break
+                found += 1
+            if found >= count:
+                chunk = chunk[:index + 1]
+            chunks.append(chunk)
+            position += len(chunk)
+        data = b''.join(chunks)
+        if found < count and position < size:
+            # 达到单次读取上限仍未凑满行数，截断在字符边界
+            data = data[:utf8_safe_length(data)]
+        else:
+            found += 1 if data and not data.endswith(b'\n') else 0
+        return self._window(data, offset, size, lines=found)
+
+    def find_line(self, f, size, line):
+        """返回第 line 行（从 1 开始）的起始字节偏移，需要从头扫描换行符"""
+        remaining, position = line - 1, 0
+        while remaining > 0 and position < size:
+            chunk = self._read(f, position, min(BLOCK_SIZE * 16, size - position))
+            if not chunk:
+                break
+            count = chunk.count(b'\n')
+            if count < remaining:
+                remaining -= count
+                position += len(chunk)
+                continue
+            index = -1
+            for _ in range(remaining):
+                index = chunk.index(b'\n', index + 1)
+            return position + index + 1
+        return position if remaining == 0 else size
+
+    def tail(self, f, size, count):
+        """从末尾反向按块读取，返回最后 count 行"""
+        count = min(count, self.max_lines)
+        position, chunks, found = size, [], 0
+        floor = max(0, size - self.max_bytes)
+        # 文件末尾的换行符不算作新的一行
+        skip_trailing = True
+        while position > floor:
+            start = max(floor, position - BLOCK_SIZE)
+            chunk = self._read(f, start, position - start)
+            end = len(chunk)
+            if skip_trailing and chunk.endswith(b'\n'):
+                end -= 1
+            skip_trailing = False
+            index = end
+            while found < count:
+                index = chunk.rfind(b'\n', 0, index)
+                if index < 0:
+                    break
+                found += 1
+            chunks.append(chunk)
+            if found >= count:
+                chunks[-1] = chunk[index + 1:]
+                position = start + index + 1
+                break
+            position = start
+        data = b''.join(reversed(chunks))
+        if found < count and position > 0:
+            # 读到上限仍未找到足够的行，丢弃不完整的开头部分
+            index = data.find(b'\n')
+            cut = index + 1 if index >= 0 else 0
+            data, position = data[cut:], position + cut
+        lines = data.count(b'\n') + (1 if data and not data.endswith(b'\n') else 0)
+        return self._window(data, position, size, lines=lines)
+
+
+class TailFollower:
+    """tail -f：周期性检查文件大小，读取新增内容
+
+    文件变小时视为被截断或轮转，从头重新读取。读取间隔由 SFTP_TAIL_INTERVAL 控制。
+    """
+
+    def __init__(self, sftp, path, offset, max_bytes, interval=None):
+        self.sftp = sftp
+        self.path = path
+        self.offset = offset
+        self.max_bytes = max_bytes
+        self.interval = interval or float(os.getenv('SFTP_TAIL_INTERVAL', '1'))
+        self._decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+
+    def poll(self):
+        """逐个生成自上次读取以来的事件，新增内容按 max_bytes 分块"""
+        size = self.sftp.stat(self.path).st_size
+        if size < self.offset:
+            yield {'type': 'truncated', 'size': size}
+            self.offset = 0
+            self._decoder.reset()
+        if size > self.offset:
+            with self.sftp.open(self.path, 'rb') as f:
+                while self.offset < size:
+                    length = min(self.max_bytes, size - self.offset)
+                    data = b''.join(f.readv([(self.offset, length)]))
+                    if not data:
+                        break
+                    start = self.offset
+                    self.offset += len(data)
+                    yield {
+                        'type': 'data',
+                        'content': self._decoder.decode(data),
+                        'offset': start,
+                        'end': self.offset,
+                        'size': size
+                    }
+
+    def wait(self, receive):
+        """等待一个间隔，receive(timeout) 用于同时检测客户端断开"""
+        deadline = time.monotonic() + self.interval
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            receive(remaining)
@@ -0,0 +1,271 @@
+import os
+import time
+import shlex
+import select
+import socket
+import hashlib
+import threading
+import logging
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+import paramiko
+from metrics import (
+    SSH_CONNECT_SECONDS, SSH_POOL_CONNECTIONS, ANSIBLE_RUN_SECONDS, ANSIBLE_HOST_RESULTS
+)
+
+logger = logging.getLogger(__name__)
+
+# 视为主机不可达的异常，与 Ansible 的 unreachable 语义一致
+UNREACHABLE_ERRORS = (
+    socket.error,
+    socket.timeout,
+    EOFError,
+    paramiko.AuthenticationException,
+    paramiko.ssh_exception.NoValidConnectionsError,
+)
+
+
+def connect_ssh(host, timeout=10):
+    """为指定主机建立SSH连接并记录握手耗时"""
+    ssh = paramiko.SSHClient()
+    ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+
+    connect_args = {
+        'hostname': host['address'],
+        'port': host['port'],
+        'username': host['username'],
+        'timeout': timeout
+    }
+    if host['auth_method'] == 'password':
+        connect_args['password'] = host['password']
+
+    start = time.perf_counter()
+    try:
+        ssh.connect(**connect_args)
+    except Exception:
+        SSH_CONNECT_SECONDS.observe(time.perf_counter() - start, outcome='error')
+        ssh.close()
+        raise
+    SSH_CONNECT_SECONDS.observe(time.perf_counter() - start, outcome='success')
+    return ssh
+
+
+class SSHConnectionPool:
+    """按主机复用的SSH连接池
+
+    连接以独占方式借出，归还后保留为空闲连接，超过 idle_timeout 未使用的连接会被关闭。
+    """
+
+    def __init__(self, max_idle_per_host=4, idle_timeout=300, connect_timeout=10):
+        self.max_idle_per_host = max_idle_per_host
+        self.idle_timeout = idle_timeout
+        self.connect_timeout = connect_timeout
+        self._idle = {}
+        self._in_use = 0
+        self._lock = threading.Lock()
+
+        SSH_POOL_CONNECTIONS.set_function(lambda: self.stats()['idle'], state='idle')
+        SSH_POOL_CONNECTIONS.set_function(lambda: self.stats()['in_use'], state='in_use')
+
+    @staticmethod
+    def _key(host):
+        secret = hashlib.sha256((host.get('password') or '').encode('utf-8')).hexdigest()
+        return (host['address'], int(host['port']), host['username'], host['auth_method'], secret)
+
+    def _checkout(self, host):
+        key = self._key(host)
+        now = time.monotonic()
+        stale = []
+        client = None
+        with self._lock:
+            entries = self._idle.get(key, [])
+            while entries:
+                candidate, last_used = entries.pop()
+                transport = candidate.get_transport()
+                if now - last_used > self.idle_timeout or transport is None or not transport.is_active():
+                    stale.append(candidate)
+                    continue
+                client = candidate
+                break
+            self._in_use += 1
+
+        for candidate in stale:
+            candidate.close()
+
+        if client is None:
+            try:
+                client = connect_ssh(host, timeout=self.connect_timeout)
+            except Exception:
+                with self._lock:
+                    self._in_use -= 1
+                raise
+        return key, client
+
+    def _checkin(self, key, client, reusable):
+        with self._lock:
+            self._in_use -= 1
+            entries = self._idle.setdefault(key, [])
+            transport = client.get_transport()
+            if reusable and transport is not None and transport.is_active() and len(entries) < self.max_idle_per_host:
+                entries.append((client, time.monotonic()))
+                return
+        client.close()
+
+    @contextmanager
+    def connection(self, host):
+        """借出一个已连接的 SSHClient，异常时丢弃该连接"""
+        key, client = self._checkout(host)
+        reusable = False
+        try:
+            yield client
+            reusable = True
+        finally:
+            self._checkin(key, client, reusable)
+
+    @contextmanager
+    def sftp(self, host):
+        """在池化连接上打开SFTP会话"""
+        with self.connection(host) as client:
+            with client.open_sftp() as sftp:
+                yield sftp
+
+    def discard_host(self, host):
+        """关闭某主机的所有空闲连接，例如主机信息变更后"""
+        with self._lock:
+            entries = self._idle.pop(self._key(host), [])
+        for client, _ in entries:
+            client.close()
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for entries in idle.values():
+            for client, _ in entries:
+                client.close()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'idle': sum(len(entries) for entries in self._idle.values()),
+                'in_use': self._in_use,
+                'hosts': len(self._idle)
+            }
+
+
+class FastPathUnsupported(Exception):
+    """该主机无法使用快速通道执行，应回退到 Ansible"""
+
+
+class ExecutionCancelled(Exception):
+    """执行已被取消"""
+
+
+class CommandTimeout(Exception):
+    """命令在 FAST_PATH_COMMAND_TIMEOUT 内未结束，主机本身可达"""
+
+
+class FastPathExecutor:
+    """通过池化SSH连接直接执行原始命令的快速通道
+
+    适用于不依赖 Ansible 模块的 shell 命令与连通性检查，结果结构与 AnsibleManager 保持一致。
+    包含 Jinja 模板语法的命令需要 Ansible 渲染，不走快速通道。
+    """
+
+    def __init__(self, pool, max_workers=None, command_timeout=None):
+        self.pool = pool
+        self.max_workers = max_workers or int(os.getenv('FAST_PATH_CONCURRENCY', '64'))
+        timeout = command_timeout if command_timeout is not None else int(os.getenv('FAST_PATH_COMMAND_TIMEOUT', '0'))
+        self.command_timeout = timeout or None
+        self.enabled = os.getenv('FAST_PATH_ENABLED', '').lower() in ('1', 'true', 'yes')
+
+    @staticmethod
+    def supports(command):
+        return '{{' not in command and '{%' not in command
+
+    def _exec(self, client, command, cancel=None):
+        transport = client.get_transport()
+        if transport is None or not transport.is_active():
+            raise FastPathUnsupported('连接已断开')
+        channel = transport.open_session()
+        try:
+            channel.exec_command(f"/bin/sh -c {shlex.quote(command)}")
+            stdout, stderr = [], []
+            deadline = time.monotonic() + self.command_timeout if self.command_timeout else None
+            while True:
+                while channel.recv_ready():
+                    stdout.append(channel.recv(32768))
+                while channel.recv_stderr_ready():
+                    stderr.append(channel.recv_stderr(32768))
+                if channel.exit_status_ready() and not channel.recv_ready() and not channel.recv_stderr_ready():
+                    break
+                if deadline and time.monotonic() > deadline:
+                    raise CommandTimeout(f'命令执行超时（{self.command_timeout} 秒）')
+                if cancel is not None and cancel.cancelled:
+                    raise ExecutionCancelled()
+                select.select([channel], [], [], 1.0)
+            rc = channel.recv_exit_status()
+        finally:
+            channel.close()
+
+        decode = lambda chunks: b''.join(chunks).decode('utf-8', errors='replace').rstrip('\r\n')
+        return decode(stdout), decode(stderr), rc
+
+    def _run_on_host(self, host, command, cancel=None):
+        """返回 (状态, 结果)；状态为 success/failed/unreachable/fallback/cancelled"""
+        for attempt in range(2):
+            if cancel is not None and cancel.cancelled:
+                return 'cancelled', {'msg': '执行已取消，主机未运行'}
+            try:
+                with self.pool.connection(host) as client:
+                    try:
+                        stdout, stderr, rc = self._exec(client, command, cancel)
+                    except ExecutionCancelled:
+                        # 通道已关闭，连接本身仍可复用
+                        return 'cancelled', {'msg': '执行已取消，命令被中断'}
+                    except CommandTimeout as e:
+                        return 'failed', {'msg': str(e)}
+                if rc == 0:
+                    return 'success', {'stdout': stdout, 'stderr': stderr, 'rc': rc}
+                return 'failed', {'msg': 'non-zero return code', 'rc': rc}
+            except UNREACHABLE_ERRORS as e:
+                return 'unreachable', {'msg': str(e) or e.__class__.__name__}
+            except (paramiko.SSHException, FastPathUnsupported) as e:
+                # 复用的空闲连接可能已被远端关闭，换新连接重试一次
+                if attempt == 0:
+                    continue
+                return 'fallback', {'msg': str(e)}
+            except Exception as e:
+                logger.warning(f"快速通道执行失败，回退到Ansible: {str(e)}")
+                return 'fallback', {'msg': str(e)}
+
+    def run(self, command, target_hosts, kind='fast_command', cancel=None):
+        """并发在所有主机上执行命令，cancel 被取消后尚未开始的主机不再执行、正在执行的命令被中断
+
+        Returns:
+            tuple: (results, fallback_hosts)，results 结构与 Ansible 路径一致
+        """
+        results = {'success': {}, 'failed': {}, 'unreachable': {}}
+        fallback_hosts = []
+        if not target_hosts:
+            return results, fallback_hosts
+
+        start = time.perf_counter()
+        workers = min(self.max_workers, len(target_hosts))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='fast-path') as pool:
+            outcomes = list(pool.map(lambda host: self._run_on_host(host, command, cancel), target_hosts))
+        ANSIBLE_RUN_SECONDS.observe(time.perf_counter() - start, kind=kind)
+
+        for host, (status, result) in zip(target_hosts, outcomes):
+            if status == 'fallback':
+                fallback_hosts.append(host)
+                continue
+            results.setdefault(status, {})[host['address']] = result
+            ANSIBLE_HOST_RESULTS.inc(kind=kind, status=status)
+        return results, fallback_hosts
+
+    def ping(self, target_hosts):
+        """通过SSH执行空命令检查连通性，成功结果与 ping 模块一致"""
+        results, fallback_hosts = self.run('true', target_hosts, kind='fast_ping')
+        for address in list(results['success']):
+            results['success'][address] = {'ping': 'pong', 'changed': False}
+        return results, fallback_hosts
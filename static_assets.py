@@ -0,0 +1,152 @@
+import os
+import re
+import gzip
+import hashlib
+import mimetypes
+import logging
+from flask import Response, request, send_file
+
+try:
+    import brotli
+except ImportError:  # brotli 为可选依赖，未安装时只提供 gzip
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Vite 构建产物 assets/name-<hash>.ext，内容变化时文件名随之变化，可永久缓存
+FINGERPRINT_PATTERN = re.compile(r'(^|/)assets/.+[-.][A-Za-z0-9_-]{8,}\.[A-Za-z0-9]+$')
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'application/xml',
+                      'image/svg+xml', 'application/wasm', 'application/manifest+json')
+IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE = 'no-cache'
+
+
+class StaticAsset:
+    """单个静态文件：内容与各编码变体常驻内存，超出大小限制的文件仍从磁盘发送"""
+
+    def __init__(self, relpath, path, body, mimetype, immutable):
+        self.relpath = relpath
+        self.path = path
+        self.mimetype = mimetype
+        self.immutable = immutable
+        self.size = os.path.getsize(path)
+        self.etag = None
+        self.variants = {}
+        if body is not None:
+            self.etag = hashlib.sha1(body).hexdigest()[:20]
+            self.variants['identity'] = body
+
+    @property
+    def in_memory(self):
+        return 'identity' in self.variants
+
+
+class StaticAssets:
+    """前端静态资源层
+
+    启动时扫描 public/ 建立内存清单，预先生成 gzip（及安装 brotli 时的 br）压缩变体；
+    目录中已存在的 .gz/.br 预压缩文件会被直接采用。按 Accept-Encoding 协商编码，
+    指纹文件返回 immutable 缓存头，其余文件（包括 index.html）通过 ETag 协商缓存。
+    """
+
+    def __init__(self, root, max_file_size=None, min_compress_size=1024):
+        self.root = os.path.abspath(root)
+        self.max_file_size = max_file_size or int(os.getenv('STATIC_MAX_MEMORY_FILE', str(4 << 20)))
+        self.min_compress_size = min_compress_size
+        self.assets = {}
+        self.load()
+
+    def load(self):
+        """重新扫描静态目录并生成清单"""
+        assets = {}
+        if os.path.isdir(self.root):
+            for directory, _, filenames in os.walk(self.root):
+                for filename in filenames:
+                    if filename.endswith(('.gz', '.br')):
+                        continue
+                    path = os.path.join(directory, filename)
+                    relpath = os.path.relpath(path, self.root).replace(os.sep, '/')
+                    try:
+                        assets[relpath] = self._build(relpath, path)
+                    except OSError as e:
+                        logger.warning(f"加载静态文件失败 {relpath}: {str(e)}")
+        self.assets = assets
+        total = sum(len(body) for asset in assets.values() for body in asset.variants.values())
+        logger.info(f"静态资源清单已加载: {len(assets)} 个文件，内存占用 {total} 字节")
+
+    def _build(self, relpath, path):
+        mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        immutable = bool(FINGERPRINT_PATTERN.search(relpath))
+        if os.path.getsize(path) > self.max_file_size:
+            return StaticAsset(relpath, path, None, mimetype, immutable)
+
+        with open(path, 'rb') as f:
+            body = f.read()
+        asset = StaticAsset(relpath, path, body, mimetype, immutable)
+        if len(body) < self.min_compress_size or not mimetype.startswith(COMPRESSIBLE_TYPES):
+            return asset
+
+        for encoding, suffix, compress in (
+            ('gzip', '.gz', lambda data: gzip.compress(data, compresslevel=9, mtime=0)),
+            ('br', '.br', (lambda data: brotli.compress(data, quality=11)) if brotli else None),
+        ):
+            prebuilt = path + suffix
+            if os.path.isfile(prebuilt):
+                with open(prebuilt, 'rb') as f:
+                    data = f.read()
+            elif compress is not None:
+                data = compress(body)
+            else:
+                continue
+            if len(data) < len(body):
+                asset.variants[encoding] = data
+        return asset
+
+    def get(self, path):
+        return self.assets.get(path.lstrip('/'))
+
+    @staticmethod
+    def _choose_encoding(asset):
+        accepted = request.accept_encodings
+        for encoding in ('br', 'gzip'):
+            if encoding in asset.variants and accepted[encoding]:
+                return encoding
+        return 'identity'
+
+    def send(self, asset):
+        """按请求协商编码并返回响应，ETag 匹配时返回 304"""
+        cache_control = IMMUTABLE_CACHE if asset.immutable else REVALIDATE_CACHE
+        if not asset.in_memory:
+            response = send_file(asset.path, mimetype=asset.mimetype, conditional=True, etag=True)
+            response.headers['Cache-Control'] = cache_control
+            return response
+
+        encoding = self._choose_encoding(asset)
+        etag = asset.etag if encoding == 'identity' else f'{asset.etag}-{encoding}'
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = Response(asset.variants[encoding], mimetype=asset.mimetype)
+            if encoding != 'identity':
+                response.headers['Content-Encoding'] = encoding
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = cache_control
+        if len(asset.variants) > 1:
+            response.headers['Vary'] = 'Accept-Encoding'
+        return response
+
+    def serve(self, path):
+        """返回静态文件；不存在的路径交给前端路由，返回 index.html"""
+        asset = self.get(path) if path else None
+        if asset is not None:
+            return self.send(asset)
+        if FINGERPRINT_PATTERN.search(path or ''):
+            # 旧版本的指纹文件已不存在，返回 index.html 会导致浏览器按脚本解析 HTML
+            return Response('Not found', status=404, mimetype='text/plain')
+        return self.serve_index()
+
+    def serve_index(self):
+        asset = self.get('index.html')
+        if asset is None:
+            return Response('index.html not found', status=404, mimetype='text/plain')
+        return self.send(asset)
@@ -0,0 +1,48 @@
+import io
+import os
+import sys
+import tarfile
+import zipfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sftp_batch import ArchiveStream, ARCHIVE_CHUNK_SIZE
+
+# 单个输出块允许的上限：一个读取块加上 tar 头与 gzip/流缓冲的余量
+MAX_CHUNK = ARCHIVE_CHUNK_SIZE + 64 * 1024
+FILE_SIZE = 8 * 1024 * 1024 + 123
+
+
+def _build(archive_format, payload):
+    stream = ArchiveStream(archive_format)
+    chunks = list(stream.add_file('host/big.bin', io.BytesIO(payload), len(payload), 1700000000, 0o644))
+    chunks.append(stream.add_bytes('manifest.json', b'{}'))
+    chunks.append(stream.close())
+    return chunks
+
+
+@pytest.mark.parametrize('archive_format', ['tar', 'tgz', 'zip'])
+def test_add_file_streams_bounded_chunks(archive_format):
+    payload = os.urandom(FILE_SIZE)
+    chunks = _build(archive_format, payload)
+
+    assert max(len(chunk) for chunk in chunks) <= MAX_CHUNK
+    data = b''.join(chunks)
+    if archive_format == 'zip':
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            assert archive.read('host/big.bin') == payload
+            assert archive.read('manifest.json') == b'{}'
+    else:
+        with tarfile.open(fileobj=io.BytesIO(data), mode='r:*') as archive:
+            member = archive.getmember('host/big.bin')
+            assert member.size == FILE_SIZE and member.mode == 0o644
+            assert archive.extractfile(member).read() == payload
+            assert archive.extractfile('manifest.json').read() == b'{}'
+
+
+def test_tar_short_source_raises():
+    stream = ArchiveStream('tar')
+    with pytest.raises(OSError):
+        list(stream.add_file('short.bin', io.BytesIO(b'abc'), 10, 0))